@@ -1,10 +1,22 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, g, stream_with_context
 from flask_cors import CORS
 import psycopg2
 import os
 import logging
 import datetime
-import requests
+import base64
+import functools
+
+from db_pool import ConnectionPool
+from schema_registry import SchemaRegistry
+from response_cache import ResponseCache
+from explorer_client import explorer
+from block_writer import BlockBatchWriter
+from moving_averages import MovingAverageEngine, recompute_moving_averages
+from money_supply import MoneySupplyEngine
+from hashrate import HashrateEngine
+from requestevery5seconds import get_block_time, format_unix_time, raw_cache
+from sync_missing_blocks import fetch_blocks_in_order
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -14,7 +26,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Database connection function (reused from requestevery5seconds.py)
-def get_db_connection():
+def connect_database():
     try:
         # Get database URL and fix postgres:// if needed (Heroku format)
         DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -39,6 +51,177 @@ def get_db_connection():
         logger.error(f"Database connection error: {e}")
         raise
 
+# Process-wide connection pool. Each gunicorn worker builds its own pool after
+# the fork, so connections are never shared between workers.
+db_pool = ConnectionPool(
+    connect_database,
+    minconn=int(os.environ.get('DB_POOL_MIN', 1)),
+    maxconn=int(os.environ.get('DB_POOL_MAX', 10)),
+    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    health_check_interval=float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30))
+)
+
+def get_db_connection():
+    """Check a pooled connection out for the current request; it is returned on teardown."""
+    if 'db_conn' not in g:
+        g.db_conn = db_pool.getconn()
+    return g.db_conn
+
+@app.teardown_appcontext
+def return_db_connection(exception):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        db_pool.putconn(conn)
+
+# Cached view of the block_data/emissions/market_data columns. Every worker
+# compares a catalog fingerprint at most every SCHEMA_REGISTRY_CHECK_INTERVAL
+# seconds and reloads when a migration changed it; /api/schema/refresh reloads
+# the worker that serves it at once.
+schema_registry = SchemaRegistry(
+    get_db_connection,
+    ttl=float(os.environ.get('SCHEMA_REGISTRY_TTL', 300)),
+    check_interval=float(os.environ.get('SCHEMA_REGISTRY_CHECK_INTERVAL', 5))
+)
+
+# Rendered responses of the read endpoints, keyed on the chain tip, the latest
+# market row and the schema version. Each gunicorn worker keeps its own cache.
+response_cache = ResponseCache(
+    max_size=int(os.environ.get('RESPONSE_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 60))
+)
+
+def data_version():
+    """
+    (latest block, latest emissions block, latest market row, schema version) -
+    changes whenever the ingestor writes a block or a market sample, or the
+    served schema changes. Three primary key lookups.
+    """
+    cursor = get_db_connection().cursor()
+    try:
+        cursor.execute("""
+            SELECT (SELECT MAX(current_block_number) FROM block_data),
+                   (SELECT MAX(current_block_number) FROM emissions),
+                   (SELECT MAX(id) FROM market_data)
+        """)
+        return cursor.fetchone() + (schema_registry.version(),)
+    finally:
+        cursor.close()
+
+def cached_response(view):
+    """Serve successful responses from response_cache while the data version is unchanged."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            version = data_version()
+        except Exception as e:
+            logger.warning(f"Could not read data version, skipping response cache: {e}")
+            # Only a checked-out connection needs its aborted transaction cleared;
+            # if the checkout itself failed there is nothing to roll back
+            if 'db_conn' in g:
+                try:
+                    g.db_conn.rollback()
+                except Exception as rollback_error:
+                    logger.warning(f"Rollback after failed data version read failed: {rollback_error}")
+            return view(*args, **kwargs)
+        
+        key = request.full_path
+        cached = response_cache.get(key, version)
+        if cached is not None:
+            body, status, mimetype = cached
+            return Response(body, status=status, mimetype=mimetype, headers={'X-Cache': 'HIT'})
+        
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            response_cache.put(key, version, (response.get_data(), response.status_code, response.mimetype))
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    return wrapper
+
+MOVING_AVERAGE_COLUMNS = ['moving_avg_100', 'moving_avg_672']
+
+# Number of heights /api/sync fetches from the explorer at once
+SYNC_CONCURRENCY = int(os.environ.get('SYNC_CONCURRENCY', 8))
+
+# Rows per server-side cursor fetch and per streamed chunk in /api/all-data
+ALL_DATA_CHUNK_SIZE = int(os.environ.get('ALL_DATA_CHUNK_SIZE', 2000))
+
+BLOCK_DETAIL_COLUMNS = [
+    'current_block_number',
+    'current_block_timestamp',
+    'previous_block_number',
+    'previous_block_timestamp',
+    'block_time_interval_seconds',
+    'network_hashrate'
+]
+
+def block_select_columns(required):
+    """Required block_data columns plus the moving average columns present in the schema."""
+    return schema_registry.select_columns('block_data', required, MOVING_AVERAGE_COLUMNS)
+
+def add_moving_averages(target, row):
+    for column in MOVING_AVERAGE_COLUMNS:
+        if row.get(column) is not None:
+            target[column] = float(row[column])
+
+def format_block_detail(row):
+    """Build the detailed block representation from a block_data row keyed by column name."""
+    block_time = row['current_block_timestamp']  # Unix timestamp
+    formatted_time = datetime.datetime.fromtimestamp(float(block_time)).strftime('%Y-%m-%d %H:%M:%S')
+    
+    block_data = {
+        'block_number': row['current_block_number'],
+        'timestamp': block_time,
+        'datetime': formatted_time,
+        'previous_block': row['previous_block_number'],
+        'previous_timestamp': row['previous_block_timestamp'],
+        'block_time_seconds': row['block_time_interval_seconds'],
+        'network_hashrate': float(row['network_hashrate']) if row['network_hashrate'] is not None else None
+    }
+    
+    # Add moving averages if they exist
+    add_moving_averages(block_data, row)
+    return block_data
+
+def format_chain_summary(summary):
+    """Build the /api/stats response from a chain_summary row."""
+    (latest_block, total_blocks, avg_block_time, avg_hashrate, ma_100, ma_672,
+     money_supply, block_reward, market_unix_timestamp, market_data_time, price, difficulty) = summary
+    
+    moving_averages = {}
+    if ma_100 is not None:
+        moving_averages['ma_100'] = float(ma_100)
+    if ma_672 is not None:
+        moving_averages['ma_672'] = float(ma_672)
+    
+    result = {
+        'latest_block': latest_block,
+        'total_blocks': total_blocks,
+        'avg_block_time': float(avg_block_time) if avg_block_time is not None else None,
+        'avg_hashrate': float(avg_hashrate) if avg_hashrate is not None else None,
+        'moving_averages': moving_averages
+    }
+    
+    if market_unix_timestamp is not None:
+        result['price'] = float(price) if price is not None else None
+        result['difficulty'] = float(difficulty) if difficulty is not None else None
+        result['market_data_time'] = market_data_time.strftime('%Y-%m-%d %H:%M:%S') if market_data_time is not None else None
+    
+    if money_supply is not None or block_reward is not None:
+        result['money_supply'] = float(money_supply) if money_supply is not None else None
+        result['block_reward'] = float(block_reward) if block_reward is not None else None
+    
+    return result
+
+def warm_schema_registry():
+    """Introspect the schema once at startup so the first requests don't pay for it."""
+    with app.app_context():
+        try:
+            schema_registry.refresh()
+        except Exception as e:
+            logger.warning(f"Could not load schema at startup, will retry on first request: {e}")
+
+warm_schema_registry()
+
 # API Routes
 
 @app.route('/')
@@ -46,111 +229,216 @@ def index():
     return jsonify({
         "message": "Welcome to the Fact0rn Blockchain API",
         "endpoints": {
-            "GET /api/blocks": "Get recent blocks (with optional limit parameter)",
+            "GET /api/blocks": "Get recent blocks (with optional limit parameter, paginate with cursor, extra moving average windows)",
             "GET /api/blocks/<block_number>": "Get details for a specific block",
             "GET /api/stats": "Get blockchain statistics",
             "GET /api/all-data": "Get all blockchain data (use with caution)",
             "GET /api/emissions/daily": "Get emissions data grouped by UTC day",
             "GET /api/sync": "Sync missing blocks from the Fact0rn explorer",
-            "GET /api/fix-moving-averages": "Fix missing or incorrect moving averages in the database"
+            "GET /api/fix-moving-averages": "Fix missing or incorrect moving averages in the database",
+            "GET /api/health/db-pool": "Get database connection pool size and saturation counters",
+            "GET /api/health/explorer": "Get explorer call latency and error counters for this worker",
+            "GET /api/health/response-cache": "Get response cache size and hit counters for this worker",
+            "GET /api/health/raw-cache": "Get on-disk explorer response cache size and hit counters for this worker",
+            "POST /api/schema/refresh": "Reload the cached table schema after a migration in the worker "
+                                        "that serves it; other workers notice the change within "
+                                        "SCHEMA_REGISTRY_CHECK_INTERVAL seconds"
         }
     })
 
+@app.route('/api/health/db-pool', methods=['GET'])
+def get_db_pool_stats():
+    """Connection pool counters for the worker process that served this request."""
+    return jsonify(db_pool.stats())
+
+@app.route('/api/health/response-cache', methods=['GET'])
+def get_response_cache_stats():
+    """Response cache size and hit counters for the worker process that served this request."""
+    return jsonify(response_cache.stats())
+
+@app.route('/api/health/raw-cache', methods=['GET'])
+def get_raw_cache_stats():
+    """On-disk explorer response cache size and hit counters for this worker."""
+    if raw_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **raw_cache.stats()})
+
+@app.route('/api/health/explorer', methods=['GET'])
+def get_explorer_stats():
+    """Explorer latency and error counters for the worker process that served this request."""
+    return jsonify(explorer.stats())
+
+@app.route('/api/schema/refresh', methods=['POST'])
+def refresh_schema():
+    """Re-introspect the table schema, e.g. after running setup_database.py."""
+    try:
+        columns = schema_registry.refresh()
+        response_cache.clear()
+        return jsonify({'status': 'success', 'tables': columns})
+    except Exception as e:
+        logger.error(f"Error in refresh_schema: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+def encode_block_cursor(direction, block_number):
+    """Opaque pagination cursor pointing just after or before a block."""
+    return base64.urlsafe_b64encode(f"{direction}:{block_number}".encode()).decode().rstrip('=')
+
+def decode_block_cursor(cursor):
+    """Return (direction, block_number) for a cursor, or raise ValueError."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, block_number = base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+        if direction not in ('after', 'before'):
+            raise ValueError
+        return direction, int(block_number)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
 @app.route('/api/blocks', methods=['GET'])
+@cached_response
 def get_blocks():
+    """
+    Get a page of blocks in ascending order.
+    Optional query parameters:
+    - limit: Page size (default 50, max 10000)
+    - start_block / end_block: Restrict the pages to a block range
+    - cursor: A next_cursor or prev_cursor from a previous response
+    - paginate: Set to 'true' to get the paginated response on the first page
+    - windows: Comma-separated moving average windows to include, e.g. 24,144,2016
+    Without cursor or paginate the response is a plain list of the latest blocks.
+    """
     try:
         # Get parameters from request
         limit = request.args.get('limit', 50, type=int)
         start_block = request.args.get('start_block', type=int)
         end_block = request.args.get('end_block', type=int)
+        page_cursor = request.args.get('cursor')
+        paginate = page_cursor is not None or request.args.get('paginate', default='false', type=str).lower() == 'true'
         
         # Ensure reasonable limits for performance
-        if limit > 10000:  # Cap at 10000 for performance
+        if limit <= 0 or limit > 10000:  # Cap at 10000 for performance
             limit = 10000
         
+        try:
+            windows = [int(window) for window in request.args.get('windows', '').split(',') if window.strip()]
+        except ValueError:
+            return jsonify({"error": "windows must be a comma-separated list of block counts"}), 400
+        
+        direction, anchor = 'before', None
+        if page_cursor:
+            try:
+                direction, anchor = decode_block_cursor(page_cursor)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        
         # Connect to the database
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check if moving average columns exist
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'block_data' AND column_name IN ('moving_avg_100', 'moving_avg_672');")
-        existing_columns = [row[0] for row in cursor.fetchall()]
-        has_ma_100 = 'moving_avg_100' in existing_columns
-        has_ma_672 = 'moving_avg_672' in existing_columns
-        
-        # Construct the query to get block data with moving averages from block_data table
-        query = """
-            SELECT 
-                current_block_number, 
-                block_time_interval_seconds,
-                current_block_timestamp,
-                network_hashrate
-        """
-        
-        # Add moving average columns to the query if they exist
-        if has_ma_100:
-            query += ", moving_avg_100"
-        if has_ma_672:
-            query += ", moving_avg_672"
-            
-        query += " FROM block_data"
+        # Construct the query to get block data, including whichever moving average columns exist
+        columns = block_select_columns([
+            'current_block_number',
+            'block_time_interval_seconds',
+            'current_block_timestamp',
+            'network_hashrate'
+        ])
+        query = f"SELECT {', '.join(columns)} FROM block_data"
         
         conditions = []
+        params = []
         
         # Add conditions based on parameters
-        if start_block:
-            conditions.append(f"current_block_number >= {start_block}")
-        if end_block:
-            conditions.append(f"current_block_number <= {end_block}")
+        if start_block is not None:
+            conditions.append("current_block_number >= %s")
+            params.append(start_block)
+        if end_block is not None:
+            conditions.append("current_block_number <= %s")
+            params.append(end_block)
+        if anchor is not None:
+            conditions.append("current_block_number > %s" if direction == 'after' else "current_block_number < %s")
+            params.append(anchor)
         
         # Add WHERE clause if there are conditions
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
         
-        # Add ORDER BY and LIMIT clauses
-        query += " ORDER BY current_block_number DESC"
-        if limit:
-            query += f" LIMIT {limit}"
+        # Walk the primary key index from the anchor, fetching one extra row to
+        # learn whether another page exists in that direction. Pages going back
+        # in time are read newest-first and flipped by the outer query, so the
+        # rows always come back in ascending order.
+        if direction == 'after':
+            query += " ORDER BY current_block_number ASC LIMIT %s"
+        else:
+            query = f"SELECT * FROM ({query} ORDER BY current_block_number DESC LIMIT %s) AS page ORDER BY current_block_number ASC"
+        params.append(limit + 1)
         
         # Execute the query
-        cursor.execute(query)
+        cursor.execute(query, params)
         rows = cursor.fetchall()
         
+        has_more = len(rows) > limit
+        if has_more:
+            rows = rows[:limit] if direction == 'after' else rows[1:]
+        
         # Convert to list of dictionaries
         blocks = []
         for row in rows:
+            row = dict(zip(columns, row))
             block_data = {
-                'block_number': row[0],
-                'block_time_seconds': row[1],
-                'timestamp': row[2],
-                'datetime': datetime.datetime.fromtimestamp(row[2]).strftime('%Y-%m-%d %H:%M:%S'),
-                'network_hashrate': float(row[3]) if row[3] is not None else None
+                'block_number': row['current_block_number'],
+                'block_time_seconds': row['block_time_interval_seconds'],
+                'timestamp': row['current_block_timestamp'],
+                'datetime': datetime.datetime.fromtimestamp(float(row['current_block_timestamp'])).strftime('%Y-%m-%d %H:%M:%S'),
+                'network_hashrate': float(row['network_hashrate']) if row['network_hashrate'] is not None else None
             }
             
             # Add moving averages if they exist
-            col_index = 4
-            if has_ma_100 and len(row) > col_index and row[col_index] is not None:
-                block_data['moving_avg_100'] = float(row[col_index])
-                col_index += 1
-                
-            if has_ma_672 and len(row) > col_index and row[col_index] is not None:
-                block_data['moving_avg_672'] = float(row[col_index])
+            add_moving_averages(block_data, row)
                 
             blocks.append(block_data)
         
-        # Sort blocks by block_number (ascending)
-        blocks.sort(key=lambda x: x['block_number'])
+        # Requested windows come from the side table, one range read for the whole page
+        if windows and blocks:
+            for block_data in blocks:
+                block_data['moving_averages'] = {}
+            blocks_by_number = {block_data['block_number']: block_data for block_data in blocks}
+            cursor.execute("""
+                SELECT block_number, window_size, value
+                FROM block_moving_averages
+                WHERE block_number BETWEEN %s AND %s AND window_size = ANY(%s)
+            """, (blocks[0]['block_number'], blocks[-1]['block_number'], windows))
+            for block_number, window_size, value in cursor.fetchall():
+                if block_number in blocks_by_number and value is not None:
+                    blocks_by_number[block_number]['moving_averages'][str(window_size)] = float(value)
+        
+        cursor.close()
+        
+        if not paginate:
+            return jsonify(blocks)
+        
+        # The page we came from lies on the anchor's side, so a cursor back
+        # towards it always exists when we arrived through one
+        next_cursor = None
+        prev_cursor = None
+        if blocks:
+            newer_exists = has_more if direction == 'after' else anchor is not None
+            older_exists = has_more if direction == 'before' else True
+            if newer_exists:
+                next_cursor = encode_block_cursor('after', blocks[-1]['block_number'])
+            if older_exists:
+                prev_cursor = encode_block_cursor('before', blocks[0]['block_number'])
         
         # Return the result as JSON
-        return jsonify(blocks)
+        return jsonify({
+            'blocks': blocks,
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor
+        })
     
     except Exception as e:
         # Log the error and return an error response
         print(f"Error: {str(e)}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/blocks/<int:block_number>', methods=['GET'])
 def get_block(block_number):
@@ -158,25 +446,9 @@ def get_block(block_number):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check if moving average columns exist
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'block_data' AND column_name IN ('moving_avg_100', 'moving_avg_672');")
-        existing_columns = [row[0] for row in cursor.fetchall()]
-        has_ma_100 = 'moving_avg_100' in existing_columns
-        has_ma_672 = 'moving_avg_672' in existing_columns
-        
         # Construct the query based on available columns
-        query = """
-            SELECT current_block_number, current_block_timestamp, 
-                   previous_block_number, previous_block_timestamp,
-                   block_time_interval_seconds, network_hashrate
-        """
-        
-        # Add moving average columns if they exist
-        if has_ma_100:
-            query += ", moving_avg_100"
-        if has_ma_672:
-            query += ", moving_avg_672"
-            
+        columns = block_select_columns(BLOCK_DETAIL_COLUMNS)
+        query = f"SELECT {', '.join(columns)}"
         query += " FROM block_data WHERE current_block_number = %s"
         
         # Execute the query
@@ -185,31 +457,10 @@ def get_block(block_number):
         
         if not block:
             cursor.close()
-            conn.close()
             return jsonify({'error': f'Block {block_number} not found'}), 404
         
         # Format block data
-        block_time = block[1]  # Unix timestamp
-        formatted_time = datetime.datetime.fromtimestamp(block_time).strftime('%Y-%m-%d %H:%M:%S')
-        
-        result = {
-            'block_number': block[0],
-            'timestamp': block_time,
-            'datetime': formatted_time,
-            'previous_block': block[2],
-            'previous_timestamp': block[3],
-            'block_time_seconds': block[4],
-            'network_hashrate': float(block[5]) if block[5] is not None else None
-        }
-        
-        # Add moving averages if they exist
-        col_index = 6
-        if has_ma_100 and len(block) > col_index and block[col_index] is not None:
-            result['moving_avg_100'] = float(block[col_index])
-            col_index += 1
-            
-        if has_ma_672 and len(block) > col_index and block[col_index] is not None:
-            result['moving_avg_672'] = float(block[col_index])
+        result = format_block_detail(dict(zip(columns, block)))
         
         # Check if emissions data exists for this block
         cursor.execute("""
@@ -224,23 +475,37 @@ def get_block(block_number):
             result['block_reward'] = float(emissions[1]) if emissions[1] is not None else None
         
         cursor.close()
-        conn.close()
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in get_block: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/stats', methods=['GET'])
+@cached_response
 def get_stats():
+    """
+    Latest chain statistics. Read from the chain_summary row the ingestor
+    maintains; computed from block_data when that table is not there yet.
+    """
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check if moving average columns exist
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'block_data' AND column_name IN ('moving_avg_100', 'moving_avg_672');")
-        existing_columns = [row[0] for row in cursor.fetchall()]
-        has_ma_100 = 'moving_avg_100' in existing_columns
-        has_ma_672 = 'moving_avg_672' in existing_columns
+        if schema_registry.has_table('chain_summary'):
+            cursor.execute("""
+                SELECT latest_block, total_blocks, avg_block_time, avg_hashrate,
+                       moving_avg_100, moving_avg_672, money_supply, block_reward,
+                       market_unix_timestamp, market_data_time, price, difficulty
+                FROM chain_summary
+                WHERE id = 1
+            """)
+            summary = cursor.fetchone()
+            if summary:
+                cursor.close()
+                return jsonify(format_chain_summary(summary))
+        
+        has_ma_100 = schema_registry.has_column('block_data', 'moving_avg_100')
+        has_ma_672 = schema_registry.has_column('block_data', 'moving_avg_672')
         
         # Get latest block
         cursor.execute("""
@@ -343,7 +608,6 @@ def get_stats():
             result['block_reward'] = float(emissions[1]) if emissions[1] is not None else None
             
         cursor.close()
-        conn.close()
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in get_stats: {e}")
@@ -351,80 +615,90 @@ def get_stats():
 
 @app.route('/api/all-data', methods=['GET'])
 def get_all_data():
+    """
+    Stream every block, joined with its emissions data, as a JSON array.
+    Rows are read through a server-side cursor and sent in chunks so memory
+    use does not grow with the length of the chain.
+    """
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if moving average columns exist
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'block_data' AND column_name IN ('moving_avg_100', 'moving_avg_672');")
-        existing_columns = [row[0] for row in cursor.fetchall()]
-        has_ma_100 = 'moving_avg_100' in existing_columns
-        has_ma_672 = 'moving_avg_672' in existing_columns
-        
-        # Get all block data
-        query = """
-            SELECT current_block_number, current_block_timestamp, 
-                   previous_block_number, previous_block_timestamp,
-                   block_time_interval_seconds, network_hashrate
-        """
         
-        # Add moving average columns if they exist
-        if has_ma_100:
-            query += ", moving_avg_100"
-        if has_ma_672:
-            query += ", moving_avg_672"
-            
-        query += " FROM block_data ORDER BY current_block_number DESC"
+        # Get all block data with emissions joined in a single query
+        columns = block_select_columns(BLOCK_DETAIL_COLUMNS)
+        select_list = [f"b.{column}" for column in columns]
+        has_emissions = schema_registry.has_table('emissions')
+        if has_emissions:
+            select_list += ["e.current_block_number IS NOT NULL", "e.money_supply", "e.block_reward"]
+            query = f"""
+                SELECT {', '.join(select_list)}
+                FROM block_data b
+                LEFT JOIN emissions e ON e.current_block_number = b.current_block_number
+                ORDER BY b.current_block_number DESC
+            """
+        else:
+            query = f"SELECT {', '.join(select_list)} FROM block_data b ORDER BY b.current_block_number DESC"
         
+        # Named (server-side) cursor: rows are fetched from Postgres ALL_DATA_CHUNK_SIZE at a time
+        cursor = conn.cursor(name='all_data_stream')
+        cursor.itersize = ALL_DATA_CHUNK_SIZE
         cursor.execute(query)
-        blocks = cursor.fetchall()
-        
-        result = []
-        for block in blocks:
-            block_time = block[1]  # Unix timestamp
-            formatted_time = datetime.datetime.fromtimestamp(block_time).strftime('%Y-%m-%d %H:%M:%S')
-            
-            block_data = {
-                'block_number': block[0],
-                'timestamp': block_time,
-                'datetime': formatted_time,
-                'previous_block': block[2],
-                'previous_timestamp': block[3],
-                'block_time_seconds': block[4],
-                'network_hashrate': float(block[5]) if block[5] is not None else None
-            }
-            
-            # Add moving averages if they exist
-            col_index = 6
-            if has_ma_100 and len(block) > col_index and block[col_index] is not None:
-                block_data['moving_avg_100'] = float(block[col_index])
-                col_index += 1
-                
-            if has_ma_672 and len(block) > col_index and block[col_index] is not None:
-                block_data['moving_avg_672'] = float(block[col_index])
-            
-            # Get emissions data for this block if available
-            cursor.execute("""
-                SELECT money_supply, block_reward
-                FROM emissions
-                WHERE current_block_number = %s
-            """, (block[0],))
-            emissions = cursor.fetchone()
-            
-            if emissions:
-                block_data['money_supply'] = float(emissions[0]) if emissions[0] is not None else None
-                block_data['block_reward'] = float(emissions[1]) if emissions[1] is not None else None
-            
-            result.append(block_data)
-        
-        cursor.close()
-        conn.close()
-        return jsonify(result)
     except Exception as e:
         logger.error(f"Error in get_all_data: {e}")
         return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        column_count = len(columns)
+        chunk = []
+        first = True
+        try:
+            yield "["
+            for row in cursor:
+                block_data = format_block_detail(dict(zip(columns, row)))
+                
+                # Add emissions data for this block if available
+                if has_emissions and row[column_count]:
+                    money_supply, block_reward = row[column_count + 1], row[column_count + 2]
+                    block_data['money_supply'] = float(money_supply) if money_supply is not None else None
+                    block_data['block_reward'] = float(block_reward) if block_reward is not None else None
+                
+                chunk.append(app.json.dumps(block_data) if first else "," + app.json.dumps(block_data))
+                first = False
+                if len(chunk) >= ALL_DATA_CHUNK_SIZE:
+                    yield "".join(chunk)
+                    chunk = []
+            chunk.append("]")
+            yield "".join(chunk)
+        except Exception as e:
+            # Headers are already sent, so the only option is to end the stream early
+            logger.error(f"Error streaming all-data response: {e}")
+        finally:
+            cursor.close()
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def daily_emissions_from_blocks(cursor, days):
+    """Group the emissions table by UTC day; used until daily_emissions exists."""
+    query = """
+        SELECT 
+            DATE_TRUNC('day', date_time) as day,
+            MAX(money_supply) - MIN(money_supply) as daily_emission,
+            MIN(money_supply) as start_supply,
+            MAX(money_supply) as end_supply,
+            COUNT(*) as block_count,
+            MIN(current_block_number) as first_block,
+            MAX(current_block_number) as last_block
+        FROM emissions
+        WHERE date_time >= CURRENT_DATE - INTERVAL '%s days'
+        GROUP BY DATE_TRUNC('day', date_time)
+        ORDER BY day DESC
+        LIMIT %s
+    """
+    
+    cursor.execute(query, (days, days))
+    return cursor.fetchall()
 
 @app.route('/api/emissions/daily', methods=['GET'])
+@cached_response
 def get_daily_emissions():
     try:
         # Get parameters from request
@@ -435,31 +709,22 @@ def get_daily_emissions():
         cursor = conn.cursor()
         
         # Check if emissions table exists
-        cursor.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'emissions')")
-        table_exists = cursor.fetchone()[0]
-        
-        if not table_exists:
+        if not schema_registry.has_table('emissions'):
             return jsonify({"error": "Emissions data is not available"}), 404
         
-        # Query to get emissions data grouped by day (in UTC time)
-        query = """
-            SELECT 
-                DATE_TRUNC('day', date_time) as day,
-                MAX(money_supply) - MIN(money_supply) as daily_emission,
-                MIN(money_supply) as start_supply,
-                MAX(money_supply) as end_supply,
-                COUNT(*) as block_count,
-                MIN(current_block_number) as first_block,
-                MAX(current_block_number) as last_block
-            FROM emissions
-            WHERE date_time >= CURRENT_DATE - INTERVAL '%s days'
-            GROUP BY DATE_TRUNC('day', date_time)
-            ORDER BY day DESC
-            LIMIT %s
-        """
-        
-        cursor.execute(query, (days, days))
-        rows = cursor.fetchall()
+        if schema_registry.has_table('daily_emissions'):
+            # Read the per-day rollup kept up to date by the ingest writers
+            cursor.execute("""
+                SELECT day, end_supply - start_supply, start_supply, end_supply,
+                       block_count, first_block, last_block
+                FROM daily_emissions
+                WHERE day >= CURRENT_DATE - %s
+                ORDER BY day DESC
+                LIMIT %s
+            """, (days, days))
+            rows = cursor.fetchall()
+        else:
+            rows = daily_emissions_from_blocks(cursor, days)
         
         if not rows:
             return jsonify({"error": "No emissions data found for the specified period"}), 404
@@ -480,7 +745,6 @@ def get_daily_emissions():
             })
         
         cursor.close()
-        conn.close()
         
         return jsonify(emissions_data)
     
@@ -499,8 +763,9 @@ def sync_blocks():
         cursor = conn.cursor()
         
         # Get the latest block count from the explorer
-        response = requests.get('https://explorer.fact0rn.io/api/getblockcount')
-        latest_block = int(response.text.strip())
+        latest_block = int(explorer.get_text("getblockcount"))
+        if raw_cache is not None:
+            raw_cache.note_tip(latest_block)
         
         # Get the latest block in our database
         cursor.execute("SELECT MAX(current_block_number) FROM block_data")
@@ -510,7 +775,6 @@ def sync_blocks():
         # Check if we're missing any blocks
         if latest_block <= latest_local_block:
             cursor.close()
-            conn.close()
             return jsonify({
                 'status': 'success',
                 'message': 'No blocks to sync',
@@ -523,19 +787,45 @@ def sync_blocks():
         blocks_synced = []
         failures = []
         
-        for block_index in blocks_to_sync:
+        # Warmed from block_data on the first block, then O(1) per block
+        moving_average_engine = MovingAverageEngine()
+        money_supply_engine = MoneySupplyEngine()
+        hashrate_engine = HashrateEngine()
+        
+        # Blocks are only written by flush_pending(), in one transaction per run
+        writer = BlockBatchWriter(conn, batch_size=None, overwrite=True)
+        pending = []
+        
+        def flush_pending():
             try:
-                # Get block data
-                block_hash, block_time, block_info = get_block_details(block_index)
-                if block_hash is None or block_time is None:
+                writer.flush()
+                blocks_synced.extend(pending)
+            except Exception as e:
+                print(f"Database error writing blocks {pending}: {e}")
+                failures.extend(pending)
+                # Re-warm the windows and supply from the database on the next block
+                moving_average_engine.last_block = None
+                money_supply_engine.last_block = None
+                hashrate_engine.last_block = None
+            pending.clear()
+        
+        # Explorer calls for all heights run in parallel; blocks arrive in order
+        for block_index, fetched in zip(blocks_to_sync, fetch_blocks_in_order(blocks_to_sync, SYNC_CONCURRENCY)):
+            try:
+                if fetched is None:
                     print(f"Failed to fetch block {block_index}")
                     failures.append(block_index)
                     continue
+                block_time = fetched['block_time']
+                
+                # The engine re-warms from block_data after a gap, so write what is buffered first
+                if moving_average_engine.last_block != block_index - 1:
+                    flush_pending()
                 
                 # Get previous block details
                 prev_block_index = block_index - 1
-                prev_block_hash, prev_block_time, _ = get_block_details(prev_block_index)
-                if prev_block_hash is None or prev_block_time is None:
+                prev_block_time = get_block_time(prev_block_index, cursor)
+                if prev_block_time is None:
                     print(f"Failed to fetch previous block {prev_block_index}")
                     failures.append(block_index)
                     continue
@@ -544,59 +834,34 @@ def sync_blocks():
                 time_difference = block_time - prev_block_time
                 formatted_block_time = format_unix_time(block_time)
                 
-                # Get current hashrate
-                current_hashrate = fetch_current_hashrate()
+                # Moving averages including this block, written with the insert
+                averages = moving_average_engine.next(cursor, block_index, time_difference)
+                money_supply = money_supply_engine.next(cursor, block_index, fetched['block_reward'])
+                network_hashrate = hashrate_engine.next(cursor, block_index, fetched['chain_work'], block_time)
                 
-                # Insert into block_data table
-                try:
-                    cursor.execute("""
-                        INSERT INTO block_data (
-                            current_block_number, 
-                            current_block_timestamp, 
-                            previous_block_number,
-                            previous_block_timestamp,
-                            block_time_interval_seconds,
-                            network_hashrate
-                        )
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (current_block_number) DO UPDATE SET
-                            current_block_timestamp = EXCLUDED.current_block_timestamp,
-                            previous_block_number = EXCLUDED.previous_block_number,
-                            previous_block_timestamp = EXCLUDED.previous_block_timestamp,
-                            block_time_interval_seconds = EXCLUDED.block_time_interval_seconds,
-                            network_hashrate = EXCLUDED.network_hashrate;
-                    """, (
-                        block_index, 
-                        block_time, 
-                        prev_block_index,
-                        prev_block_time,
-                        time_difference,
-                        current_hashrate
-                    ))
-                    
-                    conn.commit()
-                    
-                    # Update moving averages
-                    update_moving_averages(conn, cursor, block_index)
-                    
-                    # Get block reward from coinbase transaction
-                    block_reward = get_block_reward(block_info)
-                    
-                    # Save emissions data for the block
-                    save_emissions_data(block_index, block_time, formatted_block_time, block_reward)
-                    
-                    blocks_synced.append(block_index)
-                    print(f"Successfully synced block {block_index}")
-                except Exception as e:
-                    print(f"Database error for block {block_index}: {e}")
-                    conn.rollback()
-                    failures.append(block_index)
+                writer.add(
+                    block_index,
+                    block_time,
+                    prev_block_index,
+                    prev_block_time,
+                    time_difference,
+                    network_hashrate,
+                    averages,
+                    formatted_time=formatted_block_time,
+                    money_supply=money_supply,
+                    block_reward=fetched['block_reward'],
+                    header=fetched['header']
+                )
+                pending.append(block_index)
             except Exception as e:
                 print(f"Error syncing block {block_index}: {e}")
                 failures.append(block_index)
         
+        flush_pending()
+        if blocks_synced:
+            response_cache.clear()
+        
         cursor.close()
-        conn.close()
         
         return jsonify({
             'status': 'success',
@@ -620,14 +885,31 @@ def fix_moving_averages():
     Optional query parameters:
     - limit: Maximum number of blocks to process (default 100)
     - force: Set to 'true' to recalculate all moving averages, not just missing ones
+    - start_block / end_block: Recompute a block range in bulk instead (limit is ignored)
     """
     try:
         # Get query parameters
         limit = request.args.get('limit', default=100, type=int)
         force = request.args.get('force', default='false', type=str).lower() == 'true'
+        start_block = request.args.get('start_block', type=int)
+        end_block = request.args.get('end_block', type=int)
         
         # Connect to database
         conn = get_db_connection()
+        
+        if start_block is not None or end_block is not None:
+            # Bulk mode: one set-based pass per batch over the requested range
+            blocks_updated = recompute_moving_averages(conn, start_block, end_block, only_missing=not force)
+            # Repaired averages do not move the chain tip, so the cached responses would not notice
+            response_cache.clear()
+            return jsonify({
+                'status': 'success',
+                'message': f'Recomputed moving averages for {blocks_updated} blocks',
+                'blocks_updated': blocks_updated,
+                'start_block': start_block,
+                'end_block': end_block
+            })
+        
         cursor = conn.cursor()
         
         if force:
@@ -649,37 +931,27 @@ def fix_moving_averages():
             """, (limit,))
         
         blocks_to_fix = [row[0] for row in cursor.fetchall()]
+        cursor.close()
         
         if not blocks_to_fix:
-            cursor.close()
-            conn.close()
             return jsonify({
                 'status': 'success',
                 'message': 'No blocks need moving averages fixed',
                 'blocks_fixed': []
             })
         
-        # Process each block
-        fixed_blocks = []
-        failures = []
-        
-        for block_number in blocks_to_fix:
-            try:
-                print(f"Fixing moving averages for block {block_number}...")
-                update_moving_averages(conn, cursor, block_number)
-                fixed_blocks.append(block_number)
-            except Exception as e:
-                print(f"Error fixing moving averages for block {block_number}: {e}")
-                failures.append(block_number)
-        
-        cursor.close()
-        conn.close()
+        # Recompute the range spanned by the selected blocks in one set-based pass.
+        # The selection is ordered, so no other missing blocks fall inside it.
+        print(f"Fixing moving averages for blocks {blocks_to_fix[0]}-{blocks_to_fix[-1]}...")
+        blocks_updated = recompute_moving_averages(conn, blocks_to_fix[0], blocks_to_fix[-1], only_missing=not force)
+        response_cache.clear()
         
         return jsonify({
             'status': 'success',
-            'message': f'Fixed moving averages for {len(fixed_blocks)} blocks',
-            'blocks_fixed': fixed_blocks,
-            'failures': failures
+            'message': f'Fixed moving averages for {len(blocks_to_fix)} blocks',
+            'blocks_fixed': blocks_to_fix,
+            'blocks_updated': blocks_updated,
+            'failures': []
         })
     except Exception as e:
         logger.error(f"Error in fix_moving_averages: {e}")
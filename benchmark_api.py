@@ -0,0 +1,471 @@
+"""
+Load test the read endpoints against a large synthetic chain.
+
+Loads a scratch schema (api_benchmark by default) with a generated chain of
+--blocks blocks plus one emissions and one market_data row per block, then
+drives each endpoint with --concurrency parallel clients. Reports p50/p95/p99
+latency, throughput and peak RSS for each endpoint, and can save them as JSON
+to compare runs.
+
+Every connection opened by the benchmark and by the server under test gets
+the scratch schema as search_path through PGOPTIONS, so production tables are
+never touched; --schema must end in _benchmark. The schema is kept after the run (loading 10M blocks takes a
+while); --reuse skips the load when it already holds --blocks blocks and
+--drop removes it at the end.
+
+Targets:
+  flask     the app in this process, one Flask test client per thread
+  gunicorn  `gunicorn api:app` in a subprocess, driven over HTTP
+
+Usage: python benchmark_api.py [--blocks 100000] [--concurrency 8] [--requests 200]
+                               [--target flask|gunicorn] [--workers 4]
+                               [--endpoints blocks,block_detail,...] [--json results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from psycopg2 import sql
+
+from benchmark_ingestion import scratch_schema
+from chain_summary import ensure_chain_summary
+from daily_emissions import ensure_daily_emissions
+
+# Blocks generated per INSERT while loading
+LOAD_CHUNK_SIZE = 500000
+
+# Synthetic chain parameters, matching fake_explorer.py
+TARGET_SPACING = 1800
+INITIAL_SUBSIDY = 100.0
+HALVING_INTERVAL = 840000
+
+SCRATCH_TABLES = """
+    CREATE TABLE block_data (
+        current_block_number INTEGER PRIMARY KEY,
+        current_block_timestamp NUMERIC,
+        previous_block_number INTEGER,
+        previous_block_timestamp NUMERIC,
+        block_time_interval_seconds NUMERIC,
+        moving_avg_100 NUMERIC(20,8),
+        moving_avg_672 NUMERIC(20,8),
+        network_hashrate NUMERIC
+    );
+    CREATE TABLE emissions (
+        current_block_number bigint PRIMARY KEY,
+        unix_timestamp bigint,
+        date_time timestamp,
+        money_supply numeric,
+        block_reward numeric
+    );
+    CREATE TABLE market_data (
+        id SERIAL PRIMARY KEY,
+        unix_timestamp bigint,
+        date_time timestamp,
+        price numeric,
+        difficulty numeric
+    );
+    CREATE TABLE block_moving_averages (
+        block_number INTEGER NOT NULL,
+        window_size INTEGER NOT NULL,
+        value NUMERIC(20,8),
+        PRIMARY KEY (block_number, window_size)
+    );
+    CREATE TABLE moving_average_dirty_ranges (
+        id SERIAL PRIMARY KEY,
+        start_block INTEGER NOT NULL,
+        end_block INTEGER NOT NULL,
+        created_at timestamp DEFAULT now()
+    );
+"""
+
+def block_time_sql(n):
+    """Timestamp of block n: the chain ends now, with deterministic jitter per block."""
+    return f"(%(base)s + {n} * {TARGET_SPACING} + ({n} * 7919) %% {TARGET_SPACING} - {TARGET_SPACING // 2})"
+
+# Emission era of block n and the supply once block n is mined
+ERA = f"floor(n / {HALVING_INTERVAL})"
+MONEY_SUPPLY = (f"({INITIAL_SUBSIDY} * {HALVING_INTERVAL} * 2 * (1 - power(0.5, {ERA}))"
+                f" + (n - {ERA} * {HALVING_INTERVAL} + 1) * {INITIAL_SUBSIDY} * power(0.5, {ERA}))")
+
+
+def connect():
+    from requestevery5seconds import get_db_connection
+    with contextlib.redirect_stdout(io.StringIO()):
+        return get_db_connection()
+
+
+def loaded_blocks(schema):
+    connection = connect()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT 1 FROM information_schema.tables WHERE table_schema = %s AND table_name = 'block_data'",
+                       (schema,))
+        if not cursor.fetchone():
+            return None
+        cursor.execute("SELECT COUNT(*) FROM block_data")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def load_chain(schema, blocks, window_averages):
+    """Recreate the scratch schema and fill it with a blocks-long chain ending now."""
+    from moving_averages import MOVING_AVERAGE_WINDOWS
+
+    identifier = scratch_schema(schema)
+    connection = connect()
+    cursor = connection.cursor()
+    started = time.perf_counter()
+    try:
+        cursor.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(identifier))
+        cursor.execute(sql.SQL("CREATE SCHEMA {}").format(identifier))
+        cursor.execute(SCRATCH_TABLES)
+        connection.commit()
+
+        base = int(datetime.now(timezone.utc).timestamp()) - blocks * TARGET_SPACING
+        lead_in = max(MOVING_AVERAGE_WINDOWS) - 1
+        for start in range(1, blocks + 1, LOAD_CHUNK_SIZE):
+            end = min(start + LOAD_CHUNK_SIZE - 1, blocks)
+            params = {'base': base, 'start': start, 'end': end, 'lead_start': max(1, start - lead_in)}
+
+            # Intervals from consecutive timestamps; the window averages read
+            # lead_in blocks before the chunk so they are exact at its start
+            cursor.execute(f"""
+                INSERT INTO block_data (
+                    current_block_number, current_block_timestamp, previous_block_number,
+                    previous_block_timestamp, block_time_interval_seconds,
+                    moving_avg_100, moving_avg_672, network_hashrate
+                )
+                SELECT n, block_time, n - 1, previous_time, block_time - previous_time, ma_100, ma_672, hashrate
+                FROM (
+                    SELECT n, block_time, previous_time, hashrate,
+                           CAST(AVG(block_time - previous_time) OVER (
+                               ORDER BY n ROWS BETWEEN 99 PRECEDING AND CURRENT ROW) AS NUMERIC(20,8)) AS ma_100,
+                           CAST(AVG(block_time - previous_time) OVER (
+                               ORDER BY n ROWS BETWEEN 671 PRECEDING AND CURRENT ROW) AS NUMERIC(20,8)) AS ma_672
+                    FROM (
+                        SELECT n,
+                               {block_time_sql('n')} AS block_time,
+                               {block_time_sql('(n - 1)')} AS previous_time,
+                               1.0e9 + (n * 104729) %% 1000000 AS hashrate
+                        FROM generate_series(%(lead_start)s::bigint, %(end)s) AS n
+                    ) AS chain
+                ) AS averaged
+                WHERE n >= %(start)s
+            """, params)
+
+            cursor.execute(f"""
+                INSERT INTO emissions (current_block_number, unix_timestamp, date_time, money_supply, block_reward)
+                SELECT n, {block_time_sql('n')}, to_timestamp({block_time_sql('n')}) AT TIME ZONE 'UTC',
+                       {MONEY_SUPPLY}, {INITIAL_SUBSIDY} * power(0.5, {ERA})
+                FROM generate_series(%(start)s::bigint, %(end)s) AS n
+            """, params)
+
+            cursor.execute(f"""
+                INSERT INTO market_data (unix_timestamp, date_time, price, difficulty)
+                SELECT {block_time_sql('n')}, to_timestamp({block_time_sql('n')}) AT TIME ZONE 'UTC',
+                       0.5 + (n %% 1000) / 10000.0, 230 + (n * 31) %% 1000 / 100.0
+                FROM generate_series(%(start)s::bigint, %(end)s) AS n
+            """, params)
+            connection.commit()
+            print(f"Loaded blocks {start}-{end} ({time.perf_counter() - started:.0f}s)")
+
+        ensure_chain_summary(connection)
+        ensure_daily_emissions(connection)
+
+        if window_averages:
+            from moving_averages import recompute_moving_averages
+            with contextlib.redirect_stdout(io.StringIO()):
+                recompute_moving_averages(connection, batch_size=LOAD_CHUNK_SIZE)
+            print(f"Loaded window averages for {MOVING_AVERAGE_WINDOWS} ({time.perf_counter() - started:.0f}s)")
+
+        connection.autocommit = True
+        cursor.execute("VACUUM ANALYZE block_data")
+        cursor.execute("VACUUM ANALYZE emissions")
+        cursor.execute("VACUUM ANALYZE market_data")
+        cursor.execute("VACUUM ANALYZE block_moving_averages")
+    finally:
+        cursor.close()
+        connection.close()
+    return time.perf_counter() - started
+
+
+def endpoint_paths(blocks, seed):
+    """name -> function returning the next path to request."""
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def random_block(margin=0):
+        with lock:
+            return rng.randint(1, max(1, blocks - margin))
+
+    def block_range():
+        start = random_block(100)
+        return f"/api/blocks?start_block={start}&end_block={start + 99}&limit=100"
+
+    return {
+        'blocks': lambda: "/api/blocks?limit=50",
+        'blocks_range': block_range,
+        'blocks_paginated': lambda: "/api/blocks?paginate=true&limit=100",
+        'blocks_windows': lambda: "/api/blocks?limit=100&windows=24,144",
+        'block_detail': lambda: f"/api/blocks/{random_block()}",
+        'stats': lambda: "/api/stats",
+        'emissions_daily': lambda: "/api/emissions/daily?days=30",
+        'all_data': lambda: "/api/all-data",
+    }
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class FlaskTarget:
+    """The app in this process; each client thread gets its own test client."""
+
+    name = 'flask'
+
+    def __init__(self):
+        import api
+        self.app = api.app
+        self._local = threading.local()
+
+    def request(self, path):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.get(path, buffered=False)
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return response.status_code, size
+
+    def peak_rss_kb(self):
+        # Includes the benchmark's own client threads
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def close(self):
+        pass
+
+
+class GunicornTarget:
+    """`gunicorn api:app` in a subprocess, driven over keep-alive HTTP."""
+
+    name = 'gunicorn'
+
+    def __init__(self, workers, port, threads):
+        import requests
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen(
+            ["gunicorn", "api:app", "-w", str(workers), "--threads", str(threads),
+             "-b", f"127.0.0.1:{port}", "--timeout", "600", "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=os.environ.copy()
+        )
+        self._local = threading.local()
+        self._requests = requests
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                requests.get(self.base_url + "/", timeout=2)
+                break
+            except requests.RequestException:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise Exception("gunicorn did not start")
+                time.sleep(0.5)
+
+    def request(self, path):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        response = session.get(self.base_url + path, stream=True, timeout=600)
+        size = sum(len(chunk) for chunk in response.iter_content(65536))
+        response.close()
+        return response.status_code, size
+
+    def _process_tree(self):
+        pids = [self.process.pid]
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    parent = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if parent == self.process.pid:
+                pids.append(int(pid))
+        return pids
+
+    def peak_rss_kb(self):
+        """Largest VmHWM (peak resident set) across the master and its workers."""
+        peak = 0
+        for pid in self._process_tree():
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmHWM:'):
+                            peak = max(peak, int(line.split()[1]))
+            except OSError:
+                continue
+        return peak
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def run_endpoint(target, name, next_path, requests_count, concurrency, warmup):
+    for _ in range(warmup):
+        target.request(next_path())
+
+    def timed_request(_):
+        path = next_path()
+        started = time.perf_counter()
+        try:
+            status, size = target.request(path)
+        except Exception:
+            status, size = None, 0
+        return time.perf_counter() - started, status, size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, requests_count))) as executor:
+        samples = list(executor.map(timed_request, range(requests_count)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(sample[0] * 1000 for sample in samples)
+    errors = sum(1 for _, status, _ in samples if status != 200)
+    return {
+        'requests': requests_count,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(requests_count / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'avg_response_bytes': int(sum(sample[2] for sample in samples) / requests_count),
+        'peak_rss_kb': target.peak_rss_kb(),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the read API against a synthetic chain")
+    parser.add_argument('--blocks', type=int, default=100000)
+    parser.add_argument('--schema', default='api_benchmark', help="scratch schema; must end in _benchmark")
+    parser.add_argument('--reuse', action='store_true', help="skip loading if the schema already holds --blocks blocks")
+    parser.add_argument('--drop', action='store_true', help="drop the scratch schema afterwards")
+    parser.add_argument('--window-averages', action='store_true',
+                        help="also fill block_moving_averages (used by the blocks_windows endpoint)")
+    parser.add_argument('--target', choices=['flask', 'gunicorn'], default='flask')
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn workers")
+    parser.add_argument('--threads', type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument('--port', type=int, default=8556)
+    parser.add_argument('--endpoints', help="comma separated; default is every endpoint")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="requests per endpoint")
+    parser.add_argument('--all-data-requests', type=int, default=2,
+                        help="requests for all_data, which returns the whole chain")
+    parser.add_argument('--warmup', type=int, default=5, help="unrecorded requests per endpoint")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+    try:
+        scratch_schema(args.schema)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Every connection made from here on, including the server's, uses the scratch schema
+    os.environ['PGOPTIONS'] = f"{os.environ.get('PGOPTIONS', '')} -c search_path={args.schema}".strip()
+
+    paths = endpoint_paths(args.blocks, args.seed)
+    endpoints = [name.strip() for name in args.endpoints.split(',')] if args.endpoints else list(paths)
+    unknown = [name for name in endpoints if name not in paths]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    load_seconds = None
+    if args.reuse and loaded_blocks(args.schema) == args.blocks:
+        print(f"Reusing {args.blocks} blocks in schema {args.schema}")
+    else:
+        print(f"Loading {args.blocks} blocks into schema {args.schema}...")
+        load_seconds = load_chain(args.schema, args.blocks, args.window_averages)
+
+    target = None
+    results = {}
+    try:
+        if args.target == 'gunicorn':
+            target = GunicornTarget(args.workers, args.port, args.threads)
+        else:
+            with contextlib.redirect_stdout(io.StringIO()):
+                target = FlaskTarget()
+
+        print(f"{'endpoint':>18} {'req':>5} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'peak RSS MB':>12}")
+        for name in endpoints:
+            is_all_data = name == 'all_data'
+            result = run_endpoint(
+                target, name, paths[name],
+                args.all_data_requests if is_all_data else args.requests,
+                args.concurrency,
+                0 if is_all_data else args.warmup
+            )
+            results[name] = result
+            print(f"{name:>18} {result['requests']:>5} {result['errors']:>4} {result['throughput_rps']:>8.1f} "
+                  f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                  f"{result['peak_rss_kb'] / 1024:>12.1f}")
+    finally:
+        if target is not None:
+            target.close()
+        if args.drop:
+            connection = connect()
+            cursor = connection.cursor()
+            cursor.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(scratch_schema(args.schema)))
+            connection.commit()
+            cursor.close()
+            connection.close()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'revision': git_revision(),
+                'run_at': datetime.now(timezone.utc).isoformat(),
+                'blocks': args.blocks,
+                'load_seconds': round(load_seconds, 1) if load_seconds is not None else None,
+                'target': args.target,
+                'workers': args.workers if args.target == 'gunicorn' else None,
+                'concurrency': args.concurrency,
+                'endpoints': results,
+            }, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Compare the old per-block write path with BlockBatchWriter.
+
+The old path is replayed statement for statement: INSERT into block_data and
+commit, two AVG subqueries plus an UPDATE and commit for the moving averages,
+then a SELECT-then-INSERT into emissions and commit. (The real code also
+opened a second connection for the emissions write, which is not counted
+here, so the "before" number flatters the old path.)
+
+Both paths write to TEMP TABLEs that shadow block_data, emissions,
+block_moving_averages, moving_average_dirty_ranges, chain_summary and
+daily_emissions for this session only.
+
+Usage: python benchmark_block_writes.py [blocks] [batch_size]
+"""
+import sys
+import time
+from datetime import datetime, timezone
+
+from requestevery5seconds import get_db_connection
+from block_writer import BlockBatchWriter
+from moving_averages import MovingAverageEngine
+from chain_summary import CHAIN_SUMMARY_TABLE
+from daily_emissions import DAILY_EMISSIONS_TABLE
+
+SCRATCH_TABLES = """
+    CREATE TEMP TABLE block_data (
+        current_block_number INTEGER PRIMARY KEY,
+        current_block_timestamp NUMERIC,
+        previous_block_number INTEGER,
+        previous_block_timestamp NUMERIC,
+        block_time_interval_seconds NUMERIC,
+        moving_avg_100 NUMERIC(20,8),
+        moving_avg_672 NUMERIC(20,8),
+        network_hashrate NUMERIC
+    );
+    CREATE TEMP TABLE emissions (
+        current_block_number bigint PRIMARY KEY,
+        unix_timestamp bigint,
+        date_time timestamp,
+        money_supply numeric,
+        block_reward numeric
+    );
+    CREATE TEMP TABLE block_moving_averages (
+        block_number INTEGER NOT NULL,
+        window_size INTEGER NOT NULL,
+        value NUMERIC(20,8),
+        PRIMARY KEY (block_number, window_size)
+    );
+    CREATE TEMP TABLE moving_average_dirty_ranges (
+        id SERIAL PRIMARY KEY,
+        start_block INTEGER NOT NULL,
+        end_block INTEGER NOT NULL,
+        created_at timestamp DEFAULT now()
+    );
+"""
+
+def synthetic_blocks(count):
+    """Deterministic (block, time, previous time, interval, supply, reward) rows."""
+    blocks = []
+    block_time = 1650000000
+    supply = 0.0
+    for block_index in range(1, count + 1):
+        interval = 600 + (block_index * 7919) % 2400
+        prev_time = block_time
+        block_time += interval
+        supply += 100.0
+        blocks.append((block_index, block_time, prev_time, interval, supply, 100.0))
+    return blocks
+
+def truncate(connection):
+    cursor = connection.cursor()
+    cursor.execute("TRUNCATE pg_temp.block_data, pg_temp.emissions, pg_temp.block_moving_averages, "
+                   "pg_temp.moving_average_dirty_ranges, pg_temp.chain_summary, pg_temp.daily_emissions")
+    connection.commit()
+    cursor.close()
+
+def write_per_block(connection, blocks):
+    cursor = connection.cursor()
+    for block_index, block_time, prev_time, interval, supply, reward in blocks:
+        cursor.execute("""
+            INSERT INTO block_data (
+                current_block_number, current_block_timestamp, previous_block_number,
+                previous_block_timestamp, block_time_interval_seconds, network_hashrate
+            )
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (current_block_number) DO NOTHING
+        """, (block_index, block_time, block_index - 1, prev_time, interval, None))
+        connection.commit()
+
+        averages = []
+        for window in (100, 672):
+            cursor.execute("""
+                SELECT AVG(block_time_interval_seconds)
+                FROM (
+                    SELECT block_time_interval_seconds
+                    FROM block_data
+                    WHERE current_block_number <= %s AND block_time_interval_seconds IS NOT NULL
+                    ORDER BY current_block_number DESC
+                    LIMIT %s
+                ) AS recent_blocks
+            """, (block_index, window))
+            averages.append(cursor.fetchone()[0])
+        cursor.execute("""
+            UPDATE block_data
+            SET moving_avg_100 = CAST(%s AS NUMERIC(20,8)), moving_avg_672 = CAST(%s AS NUMERIC(20,8))
+            WHERE current_block_number = %s
+        """, (averages[0], averages[1], block_index))
+        connection.commit()
+
+        cursor.execute("SELECT 1 FROM emissions WHERE current_block_number = %s", (block_index,))
+        if not cursor.fetchone():
+            cursor.execute("""
+                INSERT INTO emissions (current_block_number, unix_timestamp, date_time, money_supply, block_reward)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (current_block_number) DO NOTHING
+            """, (block_index, block_time, datetime.fromtimestamp(block_time, timezone.utc), supply, reward))
+            connection.commit()
+    cursor.close()
+
+def write_batched(connection, blocks, batch_size):
+    cursor = connection.cursor()
+    engine = MovingAverageEngine()
+    writer = BlockBatchWriter(connection, batch_size=batch_size)
+    for block_index, block_time, prev_time, interval, supply, reward in blocks:
+        averages = engine.next(cursor, block_index, interval)
+        writer.add(block_index, block_time, block_index - 1, prev_time, interval, None, averages,
+                   formatted_time=datetime.fromtimestamp(block_time, timezone.utc),
+                   money_supply=supply, block_reward=reward)
+    writer.flush()
+    cursor.close()
+
+def run_benchmark(count, batch_size):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(SCRATCH_TABLES)
+        # The writers also maintain these; keep those writes in the session too
+        cursor.execute(CHAIN_SUMMARY_TABLE.replace("CREATE TABLE IF NOT EXISTS", "CREATE TEMP TABLE"))
+        cursor.execute(DAILY_EMISSIONS_TABLE.replace("CREATE TABLE IF NOT EXISTS", "CREATE TEMP TABLE"))
+        connection.commit()
+        blocks = synthetic_blocks(count)
+
+        truncate(connection)
+        started = time.perf_counter()
+        write_per_block(connection, blocks)
+        before_seconds = time.perf_counter() - started
+
+        truncate(connection)
+        started = time.perf_counter()
+        write_batched(connection, blocks, batch_size)
+        after_seconds = time.perf_counter() - started
+
+        print(f"Per-block INSERT/UPDATE/commit path: {before_seconds:.2f}s ({count / before_seconds:.0f} blocks/sec)")
+        print(f"Batched execute_values, {batch_size} blocks per transaction: "
+              f"{after_seconds:.2f}s ({count / after_seconds:.0f} blocks/sec)")
+        print(f"Speedup: {before_seconds / after_seconds:.1f}x")
+    finally:
+        cursor.close()
+        connection.close()
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    run_benchmark(count, batch_size)
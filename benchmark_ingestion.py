@@ -0,0 +1,325 @@
+"""
+Measure ingestion throughput against the local fake explorer.
+
+Each mode ingests the same synthetic blocks into empty tables and reports
+blocks/sec and explorer calls per block:
+
+  live      process_block() one block at a time, as the live loop does at the tip
+  pipeline  IngestPipeline, as the live loop does when catching up
+  sync      sync_missing_blocks()
+  api       repeated GET /api/sync until the database reaches the tip
+
+All tables live in a scratch schema (ingest_benchmark by default). Every
+connection opened by this process gets it as search_path through PGOPTIONS,
+so production tables are never touched. The schema is dropped and recreated
+on every run, so --schema must end in _benchmark. The on-disk raw response cache lives
+in a temporary directory and is emptied before each mode, unless
+--warm-raw-cache keeps it so later modes measure a re-sync from cache.
+
+Usage: python benchmark_ingestion.py [--blocks 500] [--modes live,pipeline,sync,api]
+                                     [--latency 0.02] [--error-rate 0.0] [--json results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from psycopg2 import sql
+
+from block_headers import BLOCK_HEADERS_TABLE
+from chain_summary import CHAIN_SUMMARY_TABLE
+from daily_emissions import DAILY_EMISSIONS_TABLE
+
+SCRATCH_TABLES = """
+    CREATE TABLE block_data (
+        current_block_number INTEGER PRIMARY KEY,
+        current_block_timestamp NUMERIC,
+        previous_block_number INTEGER,
+        previous_block_timestamp NUMERIC,
+        block_time_interval_seconds NUMERIC,
+        moving_avg_100 NUMERIC(20,8),
+        moving_avg_672 NUMERIC(20,8),
+        network_hashrate NUMERIC
+    );
+    CREATE TABLE emissions (
+        current_block_number bigint PRIMARY KEY,
+        unix_timestamp bigint,
+        date_time timestamp,
+        money_supply numeric,
+        block_reward numeric
+    );
+    CREATE TABLE market_data (
+        id SERIAL PRIMARY KEY,
+        unix_timestamp bigint,
+        date_time timestamp,
+        price numeric,
+        difficulty numeric
+    );
+    CREATE TABLE block_moving_averages (
+        block_number INTEGER NOT NULL,
+        window_size INTEGER NOT NULL,
+        value NUMERIC(20,8),
+        PRIMARY KEY (block_number, window_size)
+    );
+    CREATE TABLE moving_average_dirty_ranges (
+        id SERIAL PRIMARY KEY,
+        start_block INTEGER NOT NULL,
+        end_block INTEGER NOT NULL,
+        created_at timestamp DEFAULT now()
+    );
+"""
+
+MODES = ['live', 'pipeline', 'sync', 'api']
+
+# Names the benchmarks may drop and recreate; anything else (public, a typo
+# of a real schema) is refused before any DROP
+SCRATCH_SCHEMA_PATTERN = re.compile(r'[a-z][a-z0-9_]*_benchmark')
+
+
+def scratch_schema(schema):
+    """The quoted identifier of a benchmark scratch schema; raises ValueError for any other name."""
+    if not SCRATCH_SCHEMA_PATTERN.fullmatch(schema or ''):
+        raise ValueError(f"Refusing to use schema {schema!r}: scratch schemas must be lowercase "
+                         f"and end in _benchmark")
+    return sql.Identifier(schema)
+
+
+def create_scratch_schema(schema):
+    identifier = scratch_schema(schema)
+    from requestevery5seconds import get_db_connection
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(identifier))
+    cursor.execute(sql.SQL("CREATE SCHEMA {}").format(identifier))
+    cursor.execute(SCRATCH_TABLES)
+    cursor.execute(CHAIN_SUMMARY_TABLE)
+    cursor.execute(DAILY_EMISSIONS_TABLE)
+    cursor.execute(BLOCK_HEADERS_TABLE)
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+
+def drop_scratch_schema(schema):
+    identifier = scratch_schema(schema)
+    from requestevery5seconds import get_db_connection
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(identifier))
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+
+def reset_tables(chain, clear_raw_cache=True):
+    import requestevery5seconds
+    connection = requestevery5seconds.get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("TRUNCATE block_data, emissions, market_data, block_moving_averages, moving_average_dirty_ranges, "
+                   "chain_summary, daily_emissions, block_headers")
+    # Genesis emissions row: the anchor every mode derives money supply from
+    cursor.execute("INSERT INTO emissions (current_block_number, money_supply, block_reward) VALUES (0, %s, %s)",
+                   (chain.money_supply(0), chain.block_reward(0)))
+    connection.commit()
+    cursor.close()
+    connection.close()
+    # Each mode starts cold, with nothing cached from the previous one
+    requestevery5seconds.block_header_cache.clear()
+    requestevery5seconds.reward_resolver.clear()
+    if clear_raw_cache and requestevery5seconds.raw_cache is not None:
+        requestevery5seconds.raw_cache.clear()
+    requestevery5seconds.moving_average_engine.last_block = None
+    requestevery5seconds.money_supply_engine.last_block = None
+    requestevery5seconds.hashrate_engine.last_block = None
+
+
+def table_summary(chain):
+    from requestevery5seconds import get_db_connection
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT COUNT(*), SUM(moving_avg_100), SUM(moving_avg_672), SUM(network_hashrate),
+               (SELECT COUNT(*) FROM emissions WHERE current_block_number > 0),
+               (SELECT COUNT(*) FROM block_headers),
+               (SELECT total_blocks FROM chain_summary WHERE id = 1)
+        FROM block_data
+    """)
+    blocks, ma_100, ma_672, hashrate, emissions, headers, summary_blocks = cursor.fetchone()
+    cursor.execute("SELECT current_block_number, money_supply FROM emissions WHERE current_block_number > 0")
+    wrong_supply = sum(1 for block_number, supply in cursor.fetchall()
+                       if supply is None or abs(float(supply) - chain.money_supply(block_number)) > 1e-6)
+    cursor.close()
+    connection.close()
+    return {
+        'blocks': blocks,
+        'emissions': emissions,
+        'headers': headers,
+        'wrong_money_supply': wrong_supply,
+        'summary_blocks': summary_blocks,
+        'moving_average_checksum': float((ma_100 or 0) + (ma_672 or 0)),
+        'hashrate_checksum': float(hashrate or 0)
+    }
+
+
+def run_live(start_block, end_block, concurrency):
+    from requestevery5seconds import process_block
+    for block_number in range(start_block, end_block + 1):
+        process_block(block_number)
+
+
+def run_pipeline(start_block, end_block, concurrency):
+    from ingest_pipeline import IngestPipeline
+    IngestPipeline(concurrency=concurrency).run(start_block, end_block)
+
+
+def run_sync(start_block, end_block, concurrency):
+    from sync_missing_blocks import sync_missing_blocks
+    sync_missing_blocks(start_block, end_block, concurrency)
+
+
+def run_api(start_block, end_block, concurrency):
+    import api
+    client = api.app.test_client()
+    while True:
+        response = client.get('/api/sync')
+        body = response.get_json()
+        if response.status_code != 200:
+            raise Exception(f"/api/sync failed: {body}")
+        if not body.get('blocks_synced'):
+            break
+
+
+RUNNERS = {
+    'live': run_live,
+    'pipeline': run_pipeline,
+    'sync': run_sync,
+    'api': run_api,
+}
+
+
+def run_mode(mode, fake, blocks, concurrency, verbose, warm_raw_cache=False):
+    from explorer_client import explorer
+
+    reset_tables(fake.chain, clear_raw_cache=not warm_raw_cache)
+    explorer.reset_stats()
+    fake.reset_stats()
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    error = None
+    started = time.perf_counter()
+    with output:
+        try:
+            RUNNERS[mode](1, blocks, concurrency)
+        except Exception as e:
+            error = str(e)
+    elapsed = time.perf_counter() - started
+
+    summary = table_summary(fake.chain)
+    client_stats = explorer.stats()
+    calls = {name: counters['calls'] for name, counters in client_stats.items()}
+    written = summary['blocks'] or 1
+    return {
+        'mode': mode,
+        'seconds': round(elapsed, 3),
+        'blocks_per_sec': round(summary['blocks'] / elapsed, 2),
+        'calls_per_block': round(sum(calls.values()) / written, 2),
+        'calls_per_block_by_endpoint': {name: round(count / written, 2) for name, count in sorted(calls.items())},
+        'retries': sum(counters['retries'] for counters in client_stats.values()),
+        'injected_errors': sum(fake.stats()['errors'].values()),
+        'error': error,
+        **summary
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion benchmark against the fake explorer")
+    parser.add_argument('--blocks', type=int, default=500)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds added to every explorer response")
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--schema', default='ingest_benchmark', help="scratch schema; must end in _benchmark")
+    parser.add_argument('--keep', action='store_true', help="leave the scratch schema in place")
+    parser.add_argument('--verbose', action='store_true', help="show the ingest code's own output")
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--warm-raw-cache', action='store_true',
+                        help="keep the raw response cache between modes instead of starting each one cold")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in RUNNERS]
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(unknown)}")
+    try:
+        scratch_schema(args.schema)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Every connection made from here on uses the scratch schema
+    os.environ['PGOPTIONS'] = f"{os.environ.get('PGOPTIONS', '')} -c search_path={args.schema}".strip()
+    raw_cache_dir = tempfile.mkdtemp(prefix='ingest_benchmark_raw_cache_')
+    os.environ['RAW_CACHE_DIR'] = raw_cache_dir
+
+    from fake_explorer import FakeChain, FakeExplorer, start_server
+    from explorer_client import explorer
+
+    fake = FakeExplorer(FakeChain(args.blocks), latency=args.latency, latency_jitter=args.latency_jitter,
+                        error_rate=args.error_rate)
+    server, url = start_server(fake)
+    explorer.configure(url)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        create_scratch_schema(args.schema)
+
+    results = []
+    try:
+        for mode in modes:
+            result = run_mode(mode, fake, args.blocks, args.concurrency, args.verbose, args.warm_raw_cache)
+            results.append(result)
+            print(f"{mode:>8}: {result['blocks']} blocks in {result['seconds']:.2f}s "
+                  f"({result['blocks_per_sec']:.1f} blocks/sec), "
+                  f"{result['calls_per_block']:.2f} explorer calls/block"
+                  + (f", error: {result['error']}" if result['error'] else ""))
+    finally:
+        server.shutdown()
+        shutil.rmtree(raw_cache_dir, ignore_errors=True)
+        if not args.keep:
+            with contextlib.redirect_stdout(io.StringIO()):
+                drop_scratch_schema(args.schema)
+
+    for result in results:
+        if result['summary_blocks'] != result['blocks']:
+            print(f"WARNING: {result['mode']} left chain_summary at {result['summary_blocks']} blocks "
+                  f"for {result['blocks']} stored")
+        if result['wrong_money_supply']:
+            print(f"WARNING: {result['mode']} stored {result['wrong_money_supply']} emissions rows whose "
+                  f"money supply differs from the chain's")
+
+    complete = [result for result in results if result['blocks'] == args.blocks]
+    if len({result['moving_average_checksum'] for result in complete}) > 1:
+        print("WARNING: modes that wrote every block disagree on the stored moving averages")
+    hashrates = [result['hashrate_checksum'] for result in complete]
+    if hashrates and max(hashrates) - min(hashrates) > 1e-9 * max(hashrates):
+        print("WARNING: modes that wrote every block disagree on the estimated hashrates")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'blocks': args.blocks,
+                'latency': args.latency,
+                'error_rate': args.error_rate,
+                'concurrency': args.concurrency,
+                'results': results
+            }, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
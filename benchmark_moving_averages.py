@@ -0,0 +1,165 @@
+"""
+Compare the set-based moving average recompute against the block-by-block
+plpgsql loop that setup_database.py used to install.
+
+Both run against TEMP TABLEs named block_data and block_moving_averages, which
+shadow the real tables for this session only, so the benchmark never touches
+production rows.
+
+Usage: python benchmark_moving_averages.py [blocks] [--from-db]
+  blocks     number of blocks to benchmark (default 20000)
+  --from-db  copy the latest blocks from block_data instead of generating them
+"""
+import sys
+import time
+
+from requestevery5seconds import get_db_connection
+from moving_averages import MOVING_AVERAGES, recompute_moving_averages
+from chain_summary import CHAIN_SUMMARY_TABLE
+
+# The per-block loop removed from setup_database.py, kept here as the baseline
+LEGACY_FUNCTION = """
+    CREATE FUNCTION pg_temp.legacy_recalculate_missing_averages() RETURNS void AS $$
+    DECLARE
+        block_record RECORD;
+    BEGIN
+        FOR block_record IN
+            SELECT current_block_number
+            FROM block_data
+            WHERE moving_avg_100 IS NULL OR moving_avg_672 IS NULL
+            ORDER BY current_block_number
+        LOOP
+            UPDATE block_data b
+            SET moving_avg_100 = (
+                SELECT AVG(block_time_interval_seconds)
+                FROM (
+                    SELECT block_time_interval_seconds
+                    FROM block_data
+                    WHERE current_block_number <= block_record.current_block_number
+                    ORDER BY current_block_number DESC
+                    LIMIT 100
+                ) AS recent_blocks
+            )
+            WHERE b.current_block_number = block_record.current_block_number;
+
+            UPDATE block_data b
+            SET moving_avg_672 = (
+                SELECT AVG(block_time_interval_seconds)
+                FROM (
+                    SELECT block_time_interval_seconds
+                    FROM block_data
+                    WHERE current_block_number <= block_record.current_block_number
+                    ORDER BY current_block_number DESC
+                    LIMIT 672
+                ) AS recent_blocks
+            )
+            WHERE b.current_block_number = block_record.current_block_number;
+        END LOOP;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+def create_scratch_table(cursor, blocks, from_db):
+    cursor.execute("""
+        CREATE TEMP TABLE block_data (
+            current_block_number INTEGER PRIMARY KEY,
+            current_block_timestamp NUMERIC,
+            previous_block_number INTEGER,
+            previous_block_timestamp NUMERIC,
+            block_time_interval_seconds NUMERIC,
+            moving_avg_100 NUMERIC(20,8),
+            moving_avg_672 NUMERIC(20,8),
+            network_hashrate NUMERIC
+        )
+    """)
+    if from_db:
+        cursor.execute("""
+            INSERT INTO pg_temp.block_data (
+                current_block_number, current_block_timestamp, previous_block_number,
+                previous_block_timestamp, block_time_interval_seconds, network_hashrate
+            )
+            SELECT current_block_number, current_block_timestamp, previous_block_number,
+                   previous_block_timestamp, block_time_interval_seconds, network_hashrate
+            FROM public.block_data
+            WHERE block_time_interval_seconds IS NOT NULL
+            ORDER BY current_block_number DESC
+            LIMIT %s
+        """, (blocks,))
+    else:
+        # Deterministic pseudo-random intervals around the 30 minute target
+        cursor.execute("""
+            INSERT INTO pg_temp.block_data (
+                current_block_number, current_block_timestamp, previous_block_number,
+                previous_block_timestamp, block_time_interval_seconds
+            )
+            SELECT n, 1650000000 + n * 1800, n - 1, 1650000000 + (n - 1) * 1800,
+                   600 + (n * 7919) %% 2400
+            FROM generate_series(1, %s) AS n
+        """, (blocks,))
+    cursor.execute("""
+        CREATE TEMP TABLE block_moving_averages (
+            block_number INTEGER NOT NULL,
+            window_size INTEGER NOT NULL,
+            value NUMERIC(20,8),
+            PRIMARY KEY (block_number, window_size)
+        )
+    """)
+    # recompute_moving_averages refreshes chain_summary, which also reads
+    # emissions and market_data; keep all of that in the session too
+    cursor.execute(CHAIN_SUMMARY_TABLE.replace("CREATE TABLE IF NOT EXISTS", "CREATE TEMP TABLE"))
+    cursor.execute("CREATE TEMP TABLE emissions (current_block_number bigint PRIMARY KEY, "
+                   "money_supply numeric, block_reward numeric)")
+    cursor.execute("CREATE TEMP TABLE market_data (id SERIAL PRIMARY KEY, unix_timestamp bigint, "
+                   "date_time timestamp, price numeric, difficulty numeric)")
+    cursor.execute("ANALYZE pg_temp.block_data")
+
+def reset_averages(connection):
+    cursor = connection.cursor()
+    cursor.execute("UPDATE pg_temp.block_data SET moving_avg_100 = NULL, moving_avg_672 = NULL")
+    cursor.execute("TRUNCATE pg_temp.block_moving_averages")
+    connection.commit()
+    cursor.close()
+
+def snapshot_averages(cursor):
+    cursor.execute("SELECT current_block_number, moving_avg_100, moving_avg_672 FROM pg_temp.block_data ORDER BY 1")
+    return cursor.fetchall()
+
+def run_benchmark(blocks, from_db=False):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        create_scratch_table(cursor, blocks, from_db)
+        cursor.execute(LEGACY_FUNCTION)
+        connection.commit()
+
+        cursor.execute("SELECT COUNT(*) FROM pg_temp.block_data")
+        row_count = cursor.fetchone()[0]
+        print(f"Benchmarking moving average recompute over {row_count} blocks")
+
+        reset_averages(connection)
+        started = time.perf_counter()
+        cursor.execute("SELECT pg_temp.legacy_recalculate_missing_averages()")
+        connection.commit()
+        legacy_seconds = time.perf_counter() - started
+        legacy_result = snapshot_averages(cursor)
+
+        reset_averages(connection)
+        started = time.perf_counter()
+        # Only the two windows the legacy function computes, for a like-for-like comparison
+        recompute_moving_averages(connection, only_missing=True, windows=MOVING_AVERAGES)
+        bulk_seconds = time.perf_counter() - started
+        bulk_result = snapshot_averages(cursor)
+
+        mismatches = sum(1 for legacy, bulk in zip(legacy_result, bulk_result) if legacy != bulk)
+
+        print(f"Block-by-block plpgsql loop: {legacy_seconds:.2f}s ({row_count / legacy_seconds:.0f} blocks/sec)")
+        print(f"Set-based window recompute:  {bulk_seconds:.2f}s ({row_count / bulk_seconds:.0f} blocks/sec)")
+        print(f"Speedup: {legacy_seconds / bulk_seconds:.1f}x, mismatched rows: {mismatches}")
+    finally:
+        cursor.close()
+        connection.close()
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    blocks = int(args[0]) if args else 20000
+    run_benchmark(blocks, from_db='--from-db' in sys.argv)
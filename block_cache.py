@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+
+class BlockHeaderCache:
+    """
+    Bounded LRU cache of block headers keyed by height.
+
+    Entries hold the block hash, time and full getblock payload. Entries
+    loaded from block_data only know the time, so their hash and info are
+    None; they can answer get_time() but not get().
+    """
+
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, height):
+        entry = self._entries.get(height)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(height)
+        self.hits += 1
+        return entry
+
+    def get(self, height):
+        """Return (hash, time, info) for a fully cached block, or None."""
+        with self._lock:
+            entry = self._lookup(height)
+            if entry is None or entry[2] is None:
+                return None
+            return entry
+
+    def get_time(self, height):
+        with self._lock:
+            entry = self._lookup(height)
+            return entry[1] if entry is not None else None
+
+    def put(self, height, block_hash, block_time, block_info=None):
+        with self._lock:
+            existing = self._entries.get(height)
+            # Never replace a full entry with a time-only one
+            if existing is not None and existing[2] is not None and block_info is None:
+                self._entries.move_to_end(height)
+                return
+            self._entries[height] = (block_hash, block_time, block_info)
+            self._entries.move_to_end(height)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
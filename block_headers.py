@@ -0,0 +1,158 @@
+"""
+block_headers table: the header fields of every stored block.
+
+The ingest paths already download the full getblock payload for each block;
+header_row() keeps its header fields and the writers store them with the
+block, so difficulty history, cumulative chain work (for the hashrate
+estimates) and the Fact0rn factoring fields (nP1, wOffset) never need another
+explorer call. `python block_headers.py` fills in headers for blocks stored
+before the table (or its chain_work column) existed.
+
+Usage: python block_headers.py [--start N] [--end N] [--concurrency 8]
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+from schema_registry import table_exists
+
+BLOCK_HEADERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS block_headers (
+        block_number INTEGER PRIMARY KEY,
+        block_hash TEXT NOT NULL,
+        previous_block_hash TEXT,
+        block_time BIGINT,
+        difficulty NUMERIC,
+        size INTEGER,
+        tx_count INTEGER,
+        bits TEXT,
+        nonce NUMERIC(20,0),
+        version BIGINT,
+        merkle_root TEXT,
+        n_p1 TEXT,
+        w_offset NUMERIC(20,0),
+        chain_work NUMERIC
+    );
+"""
+
+HEADER_COLUMNS = ['block_number', 'block_hash', 'previous_block_hash', 'block_time', 'difficulty', 'size',
+                  'tx_count', 'bits', 'nonce', 'version', 'merkle_root', 'n_p1', 'w_offset', 'chain_work']
+
+# getblock field for each column after block_number
+HEADER_FIELDS = ['hash', 'previousblockhash', 'time', 'difficulty', 'size', 'nTx', 'bits', 'nonce', 'version',
+                 'merkleroot', 'nP1', 'wOffset', 'chainwork']
+
+# A reorg replaces the header stored for a height
+HEADER_UPSERT = f"""
+    INSERT INTO block_headers ({', '.join(HEADER_COLUMNS)})
+    VALUES %s
+    ON CONFLICT (block_number) DO UPDATE SET
+        {', '.join(f"{column} = EXCLUDED.{column}" for column in HEADER_COLUMNS[1:])}
+"""
+
+
+def block_headers_exist(cursor):
+    return table_exists(cursor, 'block_headers')
+
+
+def header_row(block_number, block_info):
+    """Row for block_headers from a getblock payload, or None without one."""
+    if not block_info or not block_info.get('hash'):
+        return None
+    row = [block_number] + [block_info.get(field) for field in HEADER_FIELDS]
+    if row[6] is None and block_info.get('tx') is not None:
+        row[6] = len(block_info['tx'])
+    row[-1] = chain_work(block_info)
+    return tuple(row)
+
+
+def chain_work(block_info):
+    """Cumulative chain work up to a block (getblock's hex chainwork) as an int, or None."""
+    value = block_info.get('chainwork') if block_info else None
+    return int(value, 16) if value else None
+
+
+def save_block_headers(cursor, rows):
+    """Upsert header rows in the caller's transaction."""
+    rows = [row for row in rows if row is not None]
+    if rows and block_headers_exist(cursor):
+        execute_values(cursor, HEADER_UPSERT, rows, page_size=len(rows))
+
+
+def latest_difficulty(cursor):
+    """Difficulty of the highest stored block, or None if no header is stored."""
+    if not block_headers_exist(cursor):
+        return None
+    cursor.execute("SELECT difficulty FROM block_headers ORDER BY block_number DESC LIMIT 1")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def backfill_block_headers(connection, get_block_details, start_block=None, end_block=None, concurrency=8,
+                           batch_size=500):
+    """
+    Fetch and store headers for the block_data rows that have none, or that
+    were stored before chain_work was.
+    get_block_details(height) -> (hash, time, getblock payload). Commits
+    every batch_size headers; returns the number stored.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT b.current_block_number
+            FROM block_data b
+            LEFT JOIN block_headers h ON h.block_number = b.current_block_number
+            WHERE (h.block_number IS NULL OR h.chain_work IS NULL)
+              AND (%(start)s IS NULL OR b.current_block_number >= %(start)s)
+              AND (%(end)s IS NULL OR b.current_block_number <= %(end)s)
+            ORDER BY b.current_block_number
+        """, {'start': start_block, 'end': end_block})
+        missing = [row[0] for row in cursor.fetchall()]
+        connection.commit()
+
+        stored = 0
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="header-fetch") as executor:
+            for offset in range(0, len(missing), batch_size):
+                batch = missing[offset:offset + batch_size]
+                rows = [header_row(block_number, details[2])
+                        for block_number, details in zip(batch, executor.map(get_block_details, batch))]
+                save_block_headers(cursor, rows)
+                connection.commit()
+                stored += sum(1 for row in rows if row is not None)
+                print(f"Stored headers up to block {batch[-1]} ({stored} of {len(missing)})")
+        return stored
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def ensure_block_headers(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(BLOCK_HEADERS_TABLE)
+        cursor.execute("ALTER TABLE block_headers ADD COLUMN IF NOT EXISTS chain_work NUMERIC")
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+if __name__ == "__main__":
+    from requestevery5seconds import get_block_details, get_db_connection
+
+    parser = argparse.ArgumentParser(description="Store block headers for blocks that have none")
+    parser.add_argument('--start', type=int)
+    parser.add_argument('--end', type=int)
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('SYNC_CONCURRENCY', 8)))
+    args = parser.parse_args()
+
+    connection = get_db_connection()
+    try:
+        ensure_block_headers(connection)
+        stored = backfill_block_headers(connection, get_block_details, args.start, args.end, args.concurrency)
+        print(f"Stored {stored} block headers")
+    finally:
+        connection.close()
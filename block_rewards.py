@@ -0,0 +1,160 @@
+"""
+Coinbase rewards without a getrawtransaction call per block.
+
+A block whose only transaction is the coinbase pays no fees, so its reward
+is exactly the subsidy for its height. RewardResolver answers those blocks
+from SubsidySchedule and fetches the coinbase transaction only for blocks
+that also carry fees (nTx > 1) or whose subsidy era has not been checked.
+The first coinbase-only block of every era is still fetched and compared
+with the schedule, and after that every REWARD_SPOT_CHECK_INTERVAL-th one;
+a mismatch turns the schedule off for that era, so a wrong BLOCK_SUBSIDY or
+SUBSIDY_HALVING_INTERVAL costs extra calls, never wrong rewards.
+
+The schedule gives the full subsidy, while the stored reward has always been
+the coinbase's vout[0]. They differ for a block whose miner under-claims or
+splits the reward over several outputs; such a block is only caught (and
+its era switched back to fetching) when a spot check lands on it or a
+later one like it.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+# Smallest unit per coin; subsidies halve in whole units like the node does
+COIN = 100000000
+
+# Coinbase subsidy at height 0, in coins
+BLOCK_SUBSIDY = float(os.environ.get('BLOCK_SUBSIDY', 100))
+
+# Blocks between subsidy halvings
+SUBSIDY_HALVING_INTERVAL = int(os.environ.get('SUBSIDY_HALVING_INTERVAL', 840000))
+
+# Resolved rewards kept in memory, keyed by block hash
+REWARD_CACHE_SIZE = int(os.environ.get('REWARD_CACHE_SIZE', 4096))
+
+# Every Nth coinbase-only block of a checked era is still fetched and compared
+# with the schedule; 1 fetches them all
+REWARD_SPOT_CHECK_INTERVAL = max(1, int(os.environ.get('REWARD_SPOT_CHECK_INTERVAL', 100)))
+
+
+class SubsidySchedule:
+    """Subsidy by height, memoized per halving era."""
+
+    def __init__(self, initial_subsidy=BLOCK_SUBSIDY, halving_interval=SUBSIDY_HALVING_INTERVAL):
+        self.initial_subsidy = round(initial_subsidy * COIN)
+        self.halving_interval = halving_interval
+        self._eras = {}
+
+    def era(self, height):
+        return height // self.halving_interval
+
+    def subsidy(self, height):
+        era = self.era(height)
+        subsidy = self._eras.get(era)
+        if subsidy is None:
+            subsidy = (self.initial_subsidy >> era if era < 64 else 0) / COIN
+            self._eras[era] = subsidy
+        return subsidy
+
+
+class RewardResolver:
+    """
+    Block reward (coinbase vout[0] value) for a getblock payload.
+
+    get_transaction(txid) fetches a decoded transaction from the explorer.
+    Results are cached by block hash in a bounded LRU. Safe to share
+    between the fetch threads.
+    """
+
+    def __init__(self, get_transaction, schedule=None, max_size=REWARD_CACHE_SIZE,
+                 spot_check_interval=REWARD_SPOT_CHECK_INTERVAL):
+        self.get_transaction = get_transaction
+        self.schedule = schedule or SubsidySchedule()
+        self.max_size = max_size
+        self.spot_check_interval = spot_check_interval
+        self._rewards = OrderedDict()
+        # era -> True once the explorer agreed with the schedule, False if it did not
+        self._verified_eras = {}
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.from_schedule = 0
+        self.from_transaction = 0
+        self.spot_checks = 0
+
+    def resolve(self, block_info):
+        if not block_info or not block_info.get('tx'):
+            return None
+        block_hash = block_info.get('hash')
+        with self._lock:
+            if block_hash in self._rewards:
+                self._rewards.move_to_end(block_hash)
+                self.cache_hits += 1
+                return self._rewards[block_hash]
+
+        height = block_info.get('height')
+        coinbase_only = block_info.get('nTx', len(block_info['tx'])) == 1
+        use_schedule = (height is not None and coinbase_only and self._verified_eras.get(self.schedule.era(height))
+                        and not self._spot_check_due())
+        if use_schedule:
+            reward = self.schedule.subsidy(height)
+        else:
+            reward = self._coinbase_value(block_info['tx'][0])
+            if reward is None:
+                return None
+            if height is not None and coinbase_only:
+                self._check_schedule(height, reward)
+
+        if block_hash is not None:
+            with self._lock:
+                self._rewards[block_hash] = reward
+                self._rewards.move_to_end(block_hash)
+                while len(self._rewards) > self.max_size:
+                    self._rewards.popitem(last=False)
+        return reward
+
+    def _spot_check_due(self):
+        """Count a block the schedule could answer; True for every spot_check_interval-th one."""
+        with self._lock:
+            if (self.from_schedule + self.spot_checks + 1) % self.spot_check_interval == 0:
+                self.spot_checks += 1
+                return True
+            self.from_schedule += 1
+            return False
+
+    def _coinbase_value(self, txid):
+        tx_details = self.get_transaction(txid)
+        with self._lock:
+            self.from_transaction += 1
+        if not tx_details or not tx_details.get('vout'):
+            return None
+        # The block reward is in the first output of the coinbase transaction
+        return tx_details['vout'][0]['value']
+
+    def _check_schedule(self, height, reward):
+        era = self.schedule.era(height)
+        if self._verified_eras.get(era) is False:
+            return
+        expected = self.schedule.subsidy(height)
+        matches = round(float(reward) * COIN) == round(expected * COIN)
+        self._verified_eras[era] = matches
+        if not matches:
+            print(f"WARNING: block {height} pays {reward} but the subsidy schedule expects {expected}; "
+                  f"fetching every coinbase in era {era}. Check BLOCK_SUBSIDY and SUBSIDY_HALVING_INTERVAL, "
+                  f"or whether miners in this era split or under-claim the reward.")
+
+    def clear(self):
+        with self._lock:
+            self._rewards.clear()
+            self._verified_eras.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._rewards),
+                'max_size': self.max_size,
+                'cache_hits': self.cache_hits,
+                'from_schedule': self.from_schedule,
+                'from_transaction': self.from_transaction,
+                'spot_checks': self.spot_checks,
+                'verified_eras': {era: matches for era, matches in self._verified_eras.items()}
+            }
@@ -0,0 +1,293 @@
+from psycopg2.extras import execute_values
+
+from block_headers import HEADER_COLUMNS, block_headers_exist, save_block_headers
+from chain_summary import update_chain_summary
+from daily_emissions import daily_emissions_exists, emissions_insert_sql
+from moving_averages import MOVING_AVERAGES, moving_average_columns, record_dirty_range
+
+
+def contiguous_runs(block_numbers):
+    """[1, 2, 3, 7, 8] -> [(1, 3), (7, 8)]"""
+    runs = []
+    for block_number in sorted(block_numbers):
+        if runs and block_number == runs[-1][1] + 1:
+            runs[-1][1] = block_number
+        else:
+            runs.append([block_number, block_number])
+    return [tuple(run) for run in runs]
+
+
+class BlockBatchWriter:
+    """
+    Buffers computed blocks and writes them in one transaction per batch.
+
+    Each flush writes block_data, block_moving_averages, block_headers and
+    emissions (plus the daily_emissions rollup) with one execute_values
+    statement per table, records dirty moving average ranges
+    for blocks that landed before existing ones, updates chain_summary and
+    commits once.
+
+    Callers computing moving averages with a MovingAverageEngine must flush
+    before the engine re-warms from the database, so the warm sees every
+    block already handed to the writer. A failed flush is rolled back and its
+    blocks are dropped from the buffer. With batch_size=None the writer only
+    writes when flush() is called.
+    """
+
+    def __init__(self, connection, batch_size=500, overwrite=False):
+        self.connection = connection
+        self.batch_size = batch_size
+        # overwrite=True replaces existing block_data rows (the /api/sync behaviour),
+        # otherwise rows that are already stored are left alone
+        self.overwrite = overwrite
+        self.blocks = []
+        self.window_averages = []
+        self.emissions = []
+        self.headers = []
+        self.rows_written = 0
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+        return False
+
+    def add(self, block_index, block_time, prev_block_index, prev_block_time, time_difference,
+            network_hashrate, averages, formatted_time=None, money_supply=None, block_reward=None, header=None):
+        """
+        Buffer one block; flushes automatically once batch_size blocks are pending.
+        header is the block's block_headers row (see block_headers.header_row).
+        """
+        self.blocks.append((
+            block_index,
+            block_time,
+            prev_block_index,
+            prev_block_time,
+            time_difference,
+            network_hashrate,
+            *[averages.get(window) for window in MOVING_AVERAGES]
+        ))
+        self.window_averages.extend(
+            (block_index, window, value) for window, value in averages.items() if value is not None
+        )
+        if formatted_time is not None and (money_supply is not None or block_reward is not None):
+            self.emissions.append((block_index, block_time, formatted_time, money_supply, block_reward))
+        if header is not None:
+            self.headers.append(header)
+
+        if self.batch_size is not None and len(self.blocks) >= self.batch_size:
+            return self.flush()
+        return 0
+
+    def discard(self):
+        self.blocks = []
+        self.window_averages = []
+        self.emissions = []
+        self.headers = []
+
+    def flush(self):
+        """Write all pending blocks in a single transaction; returns the number of blocks written."""
+        if not self.blocks:
+            return 0
+
+        columns = [
+            'current_block_number',
+            'current_block_timestamp',
+            'previous_block_number',
+            'previous_block_timestamp',
+            'block_time_interval_seconds',
+            'network_hashrate'
+        ] + moving_average_columns()
+        template = "(" + ", ".join(["%s"] * 6 + ["CAST(%s AS NUMERIC(20,8))"] * len(MOVING_AVERAGES)) + ")"
+        if self.overwrite:
+            conflict = "DO UPDATE SET " + ", ".join(f"{column} = EXCLUDED.{column}" for column in columns[1:])
+        else:
+            conflict = "DO NOTHING"
+
+        cursor = self.connection.cursor()
+        try:
+            # xmax = 0 only for freshly inserted rows, not for updated ones
+            inserted = execute_values(cursor, f"""
+                INSERT INTO block_data ({', '.join(columns)})
+                VALUES %s
+                ON CONFLICT (current_block_number) {conflict}
+                RETURNING (xmax = 0)
+            """, self.blocks, template=template, page_size=len(self.blocks), fetch=True)
+
+            if self.window_averages:
+                execute_values(cursor, """
+                    INSERT INTO block_moving_averages (block_number, window_size, value)
+                    VALUES %s
+                    ON CONFLICT (block_number, window_size) DO UPDATE SET value = EXCLUDED.value
+                """, self.window_averages, template="(%s, %s, CAST(%s AS NUMERIC(20,8)))",
+                    page_size=len(self.window_averages))
+
+            if self.emissions:
+                # Also folds the inserted rows into daily_emissions
+                execute_values(cursor, emissions_insert_sql("VALUES %s", rollup=daily_emissions_exists(cursor)),
+                               self.emissions, page_size=len(self.emissions))
+
+            save_block_headers(cursor, self.headers)
+
+            # Within a run the averages were computed in order; only blocks
+            # stored after the end of each run can be stale
+            for _, run_end in contiguous_runs(block[0] for block in self.blocks):
+                record_dirty_range(cursor, run_end)
+
+            update_chain_summary(cursor, sum(1 for row in inserted if row[0]))
+
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            # The batch is gone from the database; never retry it with the next one
+            self.discard()
+            raise
+        finally:
+            cursor.close()
+
+        written = len(self.blocks)
+        self.rows_written += written
+        print(f"Wrote batch of {written} blocks ({self.blocks[0][0]}-{self.blocks[-1][0]})")
+        self.discard()
+        return written
+
+
+class BlockWriter:
+    """
+    Single-block write unit for the live ingestor.
+
+    Keeps one connection open and, for every block, writes block_data with its
+    precomputed moving averages, the block_moving_averages rows, the
+    emissions row (with its daily_emissions rollup), the block_headers row
+    and the chain_summary update in a single transaction with one commit. The statements are
+    prepared once per connection and run with EXECUTE afterwards.
+    """
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection
+        self.connection = None
+        self.write_headers = False
+
+    def _connect(self):
+        if self.connection is not None and not self.connection.closed:
+            return self.connection
+        self.connection = self._get_connection()
+        cursor = self.connection.cursor()
+        columns = [
+            'current_block_number',
+            'current_block_timestamp',
+            'previous_block_number',
+            'previous_block_timestamp',
+            'block_time_interval_seconds',
+            'network_hashrate'
+        ] + moving_average_columns()
+        moving_average_params = ", ".join(
+            f"CAST(${index} AS NUMERIC(20,8))" for index in range(7, 7 + len(MOVING_AVERAGES))
+        )
+        cursor.execute(f"""
+            PREPARE write_block_data AS
+            INSERT INTO block_data ({', '.join(columns)})
+            VALUES ($1, $2, $3, $4, $5, $6, {moving_average_params})
+            ON CONFLICT (current_block_number) DO UPDATE SET
+                {', '.join(f"{column} = EXCLUDED.{column}" for column in columns[1:])}
+            RETURNING (xmax = 0)
+        """)
+        cursor.execute("""
+            PREPARE write_window_averages (integer, integer[], numeric[]) AS
+            INSERT INTO block_moving_averages (block_number, window_size, value)
+            SELECT $1, window_size, CAST(value AS NUMERIC(20,8))
+            FROM unnest($2, $3) AS averages(window_size, value)
+            ON CONFLICT (block_number, window_size) DO UPDATE SET value = EXCLUDED.value
+        """)
+        cursor.execute("PREPARE write_emissions AS " + emissions_insert_sql(
+            "VALUES ($1, $2, $3, $4, $5)", rollup=daily_emissions_exists(cursor)))
+        self.write_headers = block_headers_exist(cursor)
+        if self.write_headers:
+            cursor.execute(f"""
+                PREPARE write_block_header AS
+                INSERT INTO block_headers ({', '.join(HEADER_COLUMNS)})
+                VALUES ({', '.join(f"${index}" for index in range(1, len(HEADER_COLUMNS) + 1))})
+                ON CONFLICT (block_number) DO UPDATE SET
+                    {', '.join(f"{column} = EXCLUDED.{column}" for column in HEADER_COLUMNS[1:])}
+            """)
+        self.connection.commit()
+        cursor.close()
+        return self.connection
+
+    def cursor(self):
+        return self._connect().cursor()
+
+    def write(self, moving_average_engine, block_index, block_time, prev_block_index, prev_block_time,
+              network_hashrate, formatted_time=None, money_supply=None, block_reward=None,
+              money_supply_engine=None, hashrate_engine=None, chain_work=None, header=None):
+        """
+        Write one block in a single transaction and return its moving averages.
+        Without a money_supply or network_hashrate, they are derived with
+        money_supply_engine and hashrate_engine (from chain_work) if given.
+        The emissions row is skipped when neither supply nor reward is known,
+        the block_headers row when header is None.
+        """
+        connection = self._connect()
+        cursor = connection.cursor()
+        try:
+            time_difference = block_time - prev_block_time
+            averages = moving_average_engine.next(cursor, block_index, time_difference)
+            if money_supply is None and money_supply_engine is not None:
+                money_supply = money_supply_engine.next(cursor, block_index, block_reward)
+            if network_hashrate is None and hashrate_engine is not None:
+                network_hashrate = hashrate_engine.next(cursor, block_index, chain_work, block_time)
+
+            cursor.execute(
+                f"EXECUTE write_block_data ({', '.join(['%s'] * (6 + len(MOVING_AVERAGES)))})",
+                [block_index, block_time, prev_block_index, prev_block_time, time_difference, network_hashrate]
+                + [averages.get(window) for window in MOVING_AVERAGES]
+            )
+            inserted = cursor.fetchone()[0]
+
+            windows = [window for window, value in averages.items() if value is not None]
+            if windows:
+                cursor.execute("EXECUTE write_window_averages (%s, %s, %s)",
+                               (block_index, windows, [averages[window] for window in windows]))
+
+            if formatted_time is not None and (money_supply is not None or block_reward is not None):
+                cursor.execute("EXECUTE write_emissions (%s, %s, %s, %s, %s)",
+                               (block_index, block_time, formatted_time, money_supply, block_reward))
+
+            if header is not None and self.write_headers:
+                cursor.execute(f"EXECUTE write_block_header ({', '.join(['%s'] * len(HEADER_COLUMNS))})", header)
+
+            # Blocks after this one (if any) now have stale averages
+            if record_dirty_range(cursor, block_index):
+                print(f"Block {block_index} was written out of order; recorded a dirty moving average range")
+
+            update_chain_summary(cursor, 1 if inserted else 0)
+
+            connection.commit()
+            return averages
+        except Exception:
+            # The engines may have advanced past a block that was never written
+            moving_average_engine.last_block = None
+            if money_supply_engine is not None:
+                money_supply_engine.last_block = None
+            if hashrate_engine is not None:
+                hashrate_engine.last_block = None
+            if not connection.closed:
+                connection.rollback()
+            else:
+                self.connection = None
+            raise
+        finally:
+            if not cursor.closed:
+                cursor.close()
+
+    def close(self):
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
+        self.connection = None
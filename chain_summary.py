@@ -0,0 +1,145 @@
+"""
+Single-row chain_summary table behind /api/stats.
+
+The ingest paths call update_chain_summary() in the same transaction as
+their block writes and update_market_summary() with each market sample, so
+/api/stats is one primary key read instead of a COUNT(*) over block_data and
+six more queries. rebuild_chain_summary() recomputes the row from scratch
+(run `python chain_summary.py` after deleting blocks by hand).
+"""
+from schema_registry import table_exists
+
+CHAIN_SUMMARY_TABLE = """
+    CREATE TABLE IF NOT EXISTS chain_summary (
+        id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        latest_block INTEGER,
+        total_blocks BIGINT NOT NULL DEFAULT 0,
+        avg_block_time NUMERIC,
+        avg_hashrate NUMERIC,
+        moving_avg_100 NUMERIC(20,8),
+        moving_avg_672 NUMERIC(20,8),
+        money_supply NUMERIC,
+        block_reward NUMERIC,
+        market_unix_timestamp BIGINT,
+        market_data_time TIMESTAMP,
+        price NUMERIC,
+        difficulty NUMERIC,
+        updated_at TIMESTAMP DEFAULT now()
+    );
+"""
+
+# Everything but the block count and market fields, from the newest rows.
+# Each subquery is a short backward scan of a primary key index.
+BLOCK_FIELDS = """
+    (SELECT MAX(current_block_number) FROM block_data) AS latest_block,
+    (SELECT AVG(block_time_interval_seconds) FROM (
+        SELECT block_time_interval_seconds FROM block_data
+        ORDER BY current_block_number DESC LIMIT 100
+    ) AS recent_blocks) AS avg_block_time,
+    (SELECT AVG(network_hashrate) FROM (
+        SELECT network_hashrate FROM block_data
+        WHERE network_hashrate IS NOT NULL
+        ORDER BY current_block_number DESC LIMIT 100
+    ) AS recent_blocks) AS avg_hashrate,
+    (SELECT moving_avg_100 FROM block_data WHERE moving_avg_100 IS NOT NULL
+     ORDER BY current_block_number DESC LIMIT 1) AS moving_avg_100,
+    (SELECT moving_avg_672 FROM block_data WHERE moving_avg_672 IS NOT NULL
+     ORDER BY current_block_number DESC LIMIT 1) AS moving_avg_672,
+    (SELECT money_supply FROM emissions ORDER BY current_block_number DESC LIMIT 1) AS money_supply,
+    (SELECT block_reward FROM emissions ORDER BY current_block_number DESC LIMIT 1) AS block_reward
+"""
+
+BLOCK_COLUMNS = ['latest_block', 'avg_block_time', 'avg_hashrate', 'moving_avg_100', 'moving_avg_672',
+                 'money_supply', 'block_reward']
+
+
+def chain_summary_exists(cursor):
+    return table_exists(cursor, 'chain_summary')
+
+
+def update_chain_summary(cursor, blocks_inserted):
+    """
+    Refresh the summary after a block write, in the caller's transaction.
+    blocks_inserted is the number of new block_data rows (not updated ones).
+    """
+    if not chain_summary_exists(cursor):
+        return
+    cursor.execute(f"""
+        UPDATE chain_summary s
+        SET {', '.join(f"{column} = latest.{column}" for column in BLOCK_COLUMNS)},
+            total_blocks = s.total_blocks + %s,
+            updated_at = now()
+        FROM (SELECT {BLOCK_FIELDS}) AS latest
+        WHERE s.id = 1
+    """, (blocks_inserted,))
+    if cursor.rowcount == 0:
+        # First write since the table was created: count once
+        rebuild_chain_summary(cursor)
+
+
+def update_market_summary(cursor, unix_timestamp, date_time, price, difficulty):
+    """Record a new market sample in the summary, in the caller's transaction."""
+    if not chain_summary_exists(cursor):
+        return
+    cursor.execute("""
+        UPDATE chain_summary
+        SET market_unix_timestamp = %s, market_data_time = %s, price = %s, difficulty = %s, updated_at = now()
+        WHERE id = 1 AND (market_unix_timestamp IS NULL OR market_unix_timestamp <= %s)
+    """, (unix_timestamp, date_time, price, difficulty, unix_timestamp))
+
+
+def rebuild_chain_summary(cursor):
+    """Recompute the whole summary row, including the full block count."""
+    cursor.execute(f"""
+        INSERT INTO chain_summary (
+            id, {', '.join(BLOCK_COLUMNS)}, total_blocks,
+            market_unix_timestamp, market_data_time, price, difficulty, updated_at
+        )
+        SELECT 1, {', '.join(f"latest.{column}" for column in BLOCK_COLUMNS)},
+               (SELECT COUNT(*) FROM block_data),
+               market.unix_timestamp, market.date_time, market.price, market.difficulty, now()
+        FROM (SELECT {BLOCK_FIELDS}) AS latest
+        LEFT JOIN (
+            SELECT unix_timestamp, date_time, price, difficulty
+            FROM market_data
+            ORDER BY unix_timestamp DESC
+            LIMIT 1
+        ) AS market ON true
+        ON CONFLICT (id) DO UPDATE SET
+            {', '.join(f"{column} = EXCLUDED.{column}" for column in BLOCK_COLUMNS)},
+            total_blocks = EXCLUDED.total_blocks,
+            market_unix_timestamp = EXCLUDED.market_unix_timestamp,
+            market_data_time = EXCLUDED.market_data_time,
+            price = EXCLUDED.price,
+            difficulty = EXCLUDED.difficulty,
+            updated_at = EXCLUDED.updated_at
+    """)
+
+
+def ensure_chain_summary(connection):
+    """Create chain_summary if needed and fill it if it has no row yet."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(CHAIN_SUMMARY_TABLE)
+        cursor.execute("SELECT 1 FROM chain_summary WHERE id = 1")
+        if not cursor.fetchone():
+            print("Building chain_summary from block_data...")
+            rebuild_chain_summary(cursor)
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+if __name__ == "__main__":
+    from requestevery5seconds import get_db_connection
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(CHAIN_SUMMARY_TABLE)
+    rebuild_chain_summary(cursor)
+    connection.commit()
+    cursor.execute("SELECT latest_block, total_blocks FROM chain_summary WHERE id = 1")
+    latest_block, total_blocks = cursor.fetchone()
+    print(f"Rebuilt chain_summary: latest block {latest_block}, {total_blocks} blocks")
+    cursor.close()
+    connection.close()
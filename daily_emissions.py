@@ -0,0 +1,135 @@
+"""
+daily_emissions rollup behind /api/emissions/daily.
+
+One row per UTC day with the lowest and highest money supply seen, the block
+count and the first and last block. The writers insert emissions rows with
+emissions_insert_sql(), which folds every newly inserted row into its day in
+the same statement, so the endpoint never has to GROUP BY the emissions
+table. `python daily_emissions.py` rebuilds the rollup from emissions.
+"""
+from schema_registry import table_exists
+
+DAILY_EMISSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS daily_emissions (
+        day DATE PRIMARY KEY,
+        start_supply NUMERIC,
+        end_supply NUMERIC,
+        block_count INTEGER NOT NULL,
+        first_block BIGINT,
+        last_block BIGINT,
+        updated_at TIMESTAMP DEFAULT now()
+    );
+"""
+
+# Fold a set of emissions rows (rows, with date_time, money_supply and
+# current_block_number) into their days. min/max/count only ever grow as
+# rows are added, so merging with the stored day is exact.
+ROLLUP_UPSERT = """
+    INSERT INTO daily_emissions (day, start_supply, end_supply, block_count, first_block, last_block)
+    SELECT DATE_TRUNC('day', date_time)::date, MIN(money_supply), MAX(money_supply), COUNT(*),
+           MIN(current_block_number), MAX(current_block_number)
+    FROM rows
+    WHERE date_time IS NOT NULL
+    GROUP BY 1
+    ON CONFLICT (day) DO UPDATE SET
+        start_supply = LEAST(daily_emissions.start_supply, EXCLUDED.start_supply),
+        end_supply = GREATEST(daily_emissions.end_supply, EXCLUDED.end_supply),
+        block_count = daily_emissions.block_count + EXCLUDED.block_count,
+        first_block = LEAST(daily_emissions.first_block, EXCLUDED.first_block),
+        last_block = GREATEST(daily_emissions.last_block, EXCLUDED.last_block),
+        updated_at = now()
+"""
+
+
+def daily_emissions_exists(cursor):
+    return table_exists(cursor, 'daily_emissions')
+
+
+def emissions_insert_sql(values, rollup=True):
+    """
+    INSERT ... ON CONFLICT DO NOTHING into emissions for the given VALUES
+    clause. With rollup, the rows that were actually inserted (RETURNING) are
+    added to daily_emissions by the same statement.
+    """
+    insert = f"""
+        INSERT INTO emissions (current_block_number, unix_timestamp, date_time, money_supply, block_reward)
+        {values}
+        ON CONFLICT (current_block_number) DO NOTHING
+    """
+    if not rollup:
+        return insert
+    return f"""
+        WITH rows AS (
+            {insert}
+            RETURNING current_block_number, date_time, money_supply
+        )
+        {ROLLUP_UPSERT}
+    """
+
+
+def rebuild_daily_emissions(cursor):
+    """Recompute every day from the emissions table, in the caller's transaction."""
+    # Blocks concurrent writers until the caller commits, so no row is counted twice
+    cursor.execute("LOCK TABLE emissions IN SHARE MODE")
+    cursor.execute("TRUNCATE daily_emissions")
+    cursor.execute(f"""
+        WITH rows AS (
+            SELECT current_block_number, date_time, money_supply FROM emissions
+        )
+        {ROLLUP_UPSERT}
+    """)
+    return cursor.rowcount
+
+
+def refresh_daily_emissions(cursor, first_block, last_block):
+    """
+    Recompute only the days holding blocks first_block..last_block, in the
+    caller's transaction. Unlike rebuild_daily_emissions() this locks just
+    those day rows, so writers adding blocks to other days are not blocked.
+    """
+    cursor.execute("""
+        SELECT MIN(date_time)::date, MAX(date_time)::date FROM emissions
+        WHERE current_block_number BETWEEN %s AND %s
+    """, (first_block, last_block))
+    first_day, last_day = cursor.fetchone()
+    if first_day is None:
+        return 0
+    # A writer folding a new row into one of these days waits for the caller's
+    # commit and then adds it on top of the recomputed day
+    cursor.execute("DELETE FROM daily_emissions WHERE day BETWEEN %s AND %s", (first_day, last_day))
+    cursor.execute(f"""
+        WITH rows AS (
+            SELECT current_block_number, date_time, money_supply FROM emissions
+            WHERE date_time >= %s AND date_time < %s + 1
+        )
+        {ROLLUP_UPSERT}
+    """, (first_day, last_day))
+    return cursor.rowcount
+
+
+def ensure_daily_emissions(connection):
+    """Create daily_emissions if needed and backfill it if it is empty."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(DAILY_EMISSIONS_TABLE)
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM daily_emissions)")
+        if not cursor.fetchone()[0]:
+            days = rebuild_daily_emissions(cursor)
+            if days:
+                print(f"Backfilled daily_emissions with {days} days")
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+if __name__ == "__main__":
+    from requestevery5seconds import get_db_connection
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(DAILY_EMISSIONS_TABLE)
+    days = rebuild_daily_emissions(cursor)
+    connection.commit()
+    print(f"Rebuilt daily_emissions: {days} days")
+    cursor.close()
+    connection.close()
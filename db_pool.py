@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+import logging
+
+import psycopg2
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of psycopg2 connections.
+
+    Connections are opened lazily by the given connect function, up to maxconn,
+    and at least minconn are kept open once the pool has been used. The pool
+    remembers the pid it was created in, so a pool inherited through a fork
+    (gunicorn pre-fork workers) drops the parent's connections and starts fresh
+    instead of sharing sockets with the parent.
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=10, timeout=30.0, health_check_interval=30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: minconn={minconn}, maxconn={maxconn}")
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._condition = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []  # list of (connection, time it was returned)
+        self._in_use = set()
+        self._counters = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'checkout_waits': 0,
+            'checkout_timeouts': 0,
+            'health_check_failures': 0,
+            'peak_in_use': 0,
+        }
+
+    def _check_pid(self):
+        # Connections inherited from the parent process must never be used or
+        # closed here, because the socket is shared with the parent.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _open(self):
+        connection = self._connect()
+        self._counters['connections_opened'] += 1
+        return connection
+
+    def _discard(self, connection):
+        self._counters['connections_closed'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, connection, idle_since):
+        if connection.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            connection.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled connection failed health check: {e}")
+            return False
+
+    def getconn(self):
+        """Check a connection out of the pool, waiting up to timeout seconds."""
+        with self._condition:
+            self._check_pid()
+            self._fill()
+            deadline = time.monotonic() + self.timeout
+            waited = False
+            while True:
+                while self._idle:
+                    connection, idle_since = self._idle.pop()
+                    if self._is_healthy(connection, idle_since):
+                        return self._checkout(connection)
+                    self._counters['health_check_failures'] += 1
+                    self._discard(connection)
+
+                if len(self._in_use) < self.maxconn:
+                    return self._checkout(self._open())
+
+                if not waited:
+                    self._counters['checkout_waits'] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['checkout_timeouts'] += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s "
+                                      f"({len(self._in_use)}/{self.maxconn} in use)")
+                self._condition.wait(remaining)
+
+    def _checkout(self, connection):
+        self._in_use.add(connection)
+        self._counters['checkouts'] += 1
+        self._counters['peak_in_use'] = max(self._counters['peak_in_use'], len(self._in_use))
+        return connection
+
+    def putconn(self, connection, close=False):
+        """Return a connection to the pool, resetting any open transaction."""
+        with self._condition:
+            if self._pid != os.getpid() or connection not in self._in_use:
+                return
+            self._in_use.discard(connection)
+
+            if not close and not connection.closed:
+                try:
+                    status = connection.get_transaction_status()
+                    if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        connection.rollback()
+                except Exception as e:
+                    logger.warning(f"Discarding pooled connection after failed reset: {e}")
+                    close = True
+            else:
+                close = True
+
+            idle_count = len(self._idle)
+            if close or idle_count + len(self._in_use) >= self.maxconn:
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def _fill(self):
+        while len(self._idle) + len(self._in_use) < self.minconn:
+            self._idle.append((self._open(), time.monotonic()))
+
+    def fill(self):
+        """Open connections until minconn are available."""
+        with self._condition:
+            self._check_pid()
+            self._fill()
+
+    def closeall(self):
+        with self._condition:
+            if self._pid != os.getpid():
+                self._reset()
+                return
+            for connection, _ in self._idle:
+                self._discard(connection)
+            self._idle = []
+
+    def stats(self):
+        """Return pool size and saturation counters for this process."""
+        with self._condition:
+            self._check_pid()
+            in_use = len(self._in_use)
+            stats = {
+                'pid': self._pid,
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+                'in_use': in_use,
+                'idle': len(self._idle),
+                'saturation': in_use / self.maxconn,
+            }
+            stats.update(self._counters)
+            return stats
@@ -0,0 +1,139 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Explorer root; /api/ and /ext/ endpoints hang off it
+EXPLORER_URL = os.environ.get('EXPLORER_URL', 'https://explorer.fact0rn.io').rstrip('/')
+
+# Seconds to wait for each endpoint; anything not listed uses DEFAULT_TIMEOUT
+DEFAULT_TIMEOUT = float(os.environ.get('EXPLORER_TIMEOUT', 10))
+ENDPOINT_TIMEOUTS = {
+    'getblockcount': 5,
+    'getblockhash': 5,
+    'getblock': 15,
+    'getrawtransaction': 20,
+    'getnetworkhashps': 10,
+    'getdifficulty': 5,
+    'getmoneysupply': 10,
+    'getcurrentprice': 10,
+}
+
+# Status codes worth retrying; everything else fails immediately
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def endpoint_name(endpoint):
+    """'getblockhash?index=5' -> 'getblockhash'"""
+    return endpoint.split('?', 1)[0].strip('/')
+
+
+class ExplorerClient:
+    """
+    HTTP client for the Fact0rn explorer.
+
+    All requests share one keep-alive requests.Session, so repeated calls
+    reuse TCP/TLS connections. Every call gets a per-endpoint timeout and is
+    retried with jittered exponential backoff on connection errors, timeouts
+    and retryable status codes. Latency and error counters are kept per
+    endpoint.
+    """
+
+    def __init__(self, base_url=EXPLORER_URL, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 pool_size=20, timeouts=None, default_timeout=DEFAULT_TIMEOUT):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeouts = dict(ENDPOINT_TIMEOUTS, **(timeouts or {}))
+        self.default_timeout = default_timeout
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._counters = {}
+        self.session = None
+        self.configure(base_url)
+
+    def configure(self, base_url):
+        """Point the client at another explorer root (e.g. a local stand-in)."""
+        base_url = base_url.rstrip('/')
+        self.api_url = base_url + '/api/'
+        self.ext_url = base_url + '/ext/'
+        if self.session is not None:
+            self.session.close()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _record(self, name, latency, error=False, retry=False):
+        with self._lock:
+            counters = self._counters.setdefault(name, {
+                'calls': 0,
+                'errors': 0,
+                'retries': 0,
+                'total_latency': 0.0,
+                'max_latency': 0.0,
+            })
+            if retry:
+                counters['retries'] += 1
+                return
+            counters['calls'] += 1
+            counters['total_latency'] += latency
+            counters['max_latency'] = max(counters['max_latency'], latency)
+            if error:
+                counters['errors'] += 1
+
+    def _backoff(self, attempt):
+        # Full jitter: sleep a random time up to the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, endpoint, is_ext=False):
+        """GET an explorer endpoint and return the response, raising requests.RequestException on failure."""
+        name = endpoint_name(endpoint)
+        url = (self.ext_url if is_ext else self.api_url) + endpoint
+        timeout = self.timeouts.get(name, self.default_timeout)
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=timeout)
+                if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    raise requests.HTTPError(f"{response.status_code} from {name}", response=response)
+                response.raise_for_status()
+                self._record(name, time.perf_counter() - started)
+                return response
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                retryable = not isinstance(e, requests.HTTPError) or (
+                    e.response is not None and e.response.status_code in RETRY_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    self._record(name, time.perf_counter() - started, error=True)
+                    raise
+                self._record(name, 0, retry=True)
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+
+    def get_text(self, endpoint, is_ext=False):
+        return self.get(endpoint, is_ext=is_ext).text.strip()
+
+    def get_json(self, endpoint, is_ext=False):
+        return self.get(endpoint, is_ext=is_ext).json()
+
+    def stats(self):
+        """Per-endpoint call, error, retry and latency counters."""
+        with self._lock:
+            stats = {}
+            for name, counters in self._counters.items():
+                stats[name] = dict(counters)
+                stats[name]['avg_latency'] = counters['total_latency'] / counters['calls'] if counters['calls'] else None
+            return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._counters = {}
+
+
+# Shared client used by every ingest path in this process
+explorer = ExplorerClient()
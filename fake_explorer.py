@@ -0,0 +1,316 @@
+"""
+Local stand-in for the Fact0rn explorer, for running the ingest code offline.
+
+Serves the /api/ and /ext/ endpoints the ingestor uses from a synthetic,
+deterministic chain: every height always has the same hash, time, coinbase
+transaction and reward, so runs are repeatable. Latency and error responses
+can be injected per endpoint.
+
+Usage: python fake_explorer.py [--port 8555] [--tip 5000] [--latency 0.02]
+                               [--latency-jitter 0.0] [--error-rate 0.0]
+                               [--endpoint-latency getrawtransaction=0.1]
+
+Then point the ingest code at it with EXPLORER_URL=http://127.0.0.1:8555
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+GENESIS_TIME = 1650000000
+
+# Target block spacing of the synthetic chain, in seconds
+TARGET_SPACING = 1800
+
+# Coinbase reward at height 0 and the number of blocks between halvings
+INITIAL_SUBSIDY = 100.0
+HALVING_INTERVAL = 840000
+
+# Every FEE_BLOCK_SPACING-th block carries fee-paying transactions besides the coinbase
+FEE_BLOCK_SPACING = 5
+FEE_PER_TRANSACTION = 0.0001
+
+# Blocks getnetworkhashps looks back over, like the node's default
+NETWORK_HASHPS_LOOKUP = 120
+
+
+def _digest(*parts):
+    return hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+class FakeChain:
+    """
+    Deterministic chain. Hashes and txids end in the height as 16 hex digits,
+    so the server can map them back to a height without keeping an index.
+    """
+
+    def __init__(self, tip, seed=0):
+        self.tip = tip
+        self.seed = seed
+        # Running fee and work totals by height, so money_supply() and chain_work() stay cheap
+        self._fee_totals = []
+        self._work_totals = []
+        self._totals_lock = threading.Lock()
+
+    def _running_total(self, totals, value, height):
+        with self._totals_lock:
+            while len(totals) <= height:
+                totals.append((totals[-1] if totals else 0) + value(len(totals)))
+            return totals[height]
+
+    def _jitter(self, height):
+        # Up to +/- half the target spacing, so every interval stays positive
+        return int(_digest(self.seed, "time", height)[:8], 16) % TARGET_SPACING - TARGET_SPACING // 2
+
+    def block_time(self, height):
+        return GENESIS_TIME + height * TARGET_SPACING + (self._jitter(height) if height else 0)
+
+    def block_hash(self, height):
+        return _digest(self.seed, "block", height)[:48] + f"{height:016x}"
+
+    def txid(self, height):
+        return _digest(self.seed, "coinbase", height)[:48] + f"{height:016x}"
+
+    @staticmethod
+    def height_of(hash_or_txid):
+        try:
+            return int(hash_or_txid[-16:], 16)
+        except (TypeError, ValueError):
+            return None
+
+    def transaction_count(self, height):
+        if height == 0 or height % FEE_BLOCK_SPACING:
+            return 1
+        return 2 + int(_digest(self.seed, "transactions", height)[:2], 16) % 4
+
+    def fees(self, height):
+        return round((self.transaction_count(height) - 1) * FEE_PER_TRANSACTION, 8)
+
+    def subsidy(self, height):
+        return INITIAL_SUBSIDY / (2 ** (height // HALVING_INTERVAL))
+
+    def block_reward(self, height):
+        """Coinbase value: the subsidy plus the block's fees."""
+        return round(self.subsidy(height) + self.fees(height), 8)
+
+    def money_supply(self, height=None):
+        """Sum of every reward up to and including height (the tip by default)."""
+        height = self.tip if height is None else height
+        supply = 0.0
+        era = 0
+        while era * HALVING_INTERVAL <= height:
+            blocks = min(height + 1, (era + 1) * HALVING_INTERVAL) - era * HALVING_INTERVAL
+            supply += blocks * INITIAL_SUBSIDY / (2 ** era)
+            era += 1
+        return round(supply + self._running_total(self._fee_totals, self.fees, height), 8)
+
+    def difficulty(self, height):
+        return 230.0 + int(_digest(self.seed, "difficulty", height)[:4], 16) / 65536
+
+    def work(self, height):
+        # Deliberately unrelated to difficulty, so nothing can get by on a hashes-per-difficulty constant
+        return 2 ** 40 + int(_digest(self.seed, "work", height)[:10], 16)
+
+    def chain_work(self, height):
+        """Total work of blocks 0..height, as getblock's chainwork reports it."""
+        return self._running_total(self._work_totals, self.work, height)
+
+    def network_hashps(self, lookup=NETWORK_HASHPS_LOOKUP):
+        """The node's getnetworkhashps: work over the last lookup blocks / their time spread."""
+        first = max(0, self.tip - lookup)
+        if first == self.tip:
+            return 0
+        times = [self.block_time(height) for height in range(first, self.tip + 1)]
+        return (self.chain_work(self.tip) - self.chain_work(first)) / (max(times) - min(times))
+
+    def block(self, height):
+        block_hash = self.block_hash(height)
+        block = {
+            "hash": block_hash,
+            "confirmations": self.tip - height + 1,
+            "size": 300 + int(block_hash[:3], 16) % 200,
+            "height": height,
+            "version": 536870912,
+            "merkleroot": self.txid(height),
+            "tx": [self.txid(height)] + [
+                _digest(self.seed, "tx", height, index)[:48] + f"{height:016x}"
+                for index in range(1, self.transaction_count(height))
+            ],
+            "time": self.block_time(height),
+            "mediantime": self.block_time(max(height - 5, 0)),
+            "nonce": int(block_hash[8:16], 16),
+            "bits": "1d00ffff",
+            "difficulty": self.difficulty(height),
+            "chainwork": f"{self.chain_work(height):064x}",
+            "nTx": self.transaction_count(height),
+            "nP1": block_hash[:32],
+            "wOffset": int(block_hash[16:20], 16) - 32768,
+        }
+        if height > 0:
+            block["previousblockhash"] = self.block_hash(height - 1)
+        if height < self.tip:
+            block["nextblockhash"] = self.block_hash(height + 1)
+        return block
+
+    def coinbase_transaction(self, height):
+        return {
+            "txid": self.txid(height),
+            "blockhash": self.block_hash(height),
+            "confirmations": self.tip - height + 1,
+            "time": self.block_time(height),
+            "vin": [{"coinbase": f"{height:08x}", "sequence": 4294967295}],
+            "vout": [{"value": self.block_reward(height), "n": 0}],
+        }
+
+
+class FakeExplorer:
+    """
+    Endpoint handlers plus per-endpoint latency, error injection and call counters.
+    """
+
+    def __init__(self, chain, latency=0.0, latency_jitter=0.0, endpoint_latency=None,
+                 error_rate=0.0, error_status=503, price=0.5, seed=0):
+        self.chain = chain
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.endpoint_latency = dict(endpoint_latency or {})
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.price = price
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.errors = {}
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = {}
+            self.errors = {}
+
+    def stats(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "errors": dict(self.errors)}
+
+    def _delay(self, name):
+        with self._lock:
+            jitter = self._random.uniform(-self.latency_jitter, self.latency_jitter) if self.latency_jitter else 0.0
+            fail = self.error_rate and self._random.random() < self.error_rate
+        delay = self.endpoint_latency.get(name, self.latency) + jitter
+        if delay > 0:
+            time.sleep(delay)
+        return fail
+
+    def handle(self, name, params):
+        """Return (status, content type, body) for one request."""
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self._delay(name):
+            with self._lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            return self.error_status, "text/plain", "injected error"
+
+        chain = self.chain
+        if name == "getblockcount":
+            return 200, "text/plain", str(chain.tip)
+        if name == "getblockhash":
+            height = int(params.get("index", -1))
+            if not 0 <= height <= chain.tip:
+                return 400, "text/plain", "Block height out of range"
+            return 200, "text/plain", chain.block_hash(height)
+        if name == "getblock":
+            height = chain.height_of(params.get("hash"))
+            if height is None or height > chain.tip or chain.block_hash(height) != params.get("hash"):
+                return 404, "text/plain", "Block not found"
+            return 200, "application/json", json.dumps(chain.block(height))
+        if name == "getrawtransaction":
+            height = chain.height_of(params.get("txid"))
+            if height is None or height > chain.tip or chain.txid(height) != params.get("txid"):
+                return 404, "text/plain", "No such transaction"
+            return 200, "application/json", json.dumps(chain.coinbase_transaction(height))
+        if name == "getnetworkhashps":
+            return 200, "application/json", json.dumps(chain.network_hashps())
+        if name == "getdifficulty":
+            return 200, "text/plain", str(chain.difficulty(chain.tip))
+        if name == "getmoneysupply":
+            return 200, "text/plain", f"{chain.money_supply():.8f}"
+        if name == "getcurrentprice":
+            return 200, "application/json", json.dumps({"last_price_usd": self.price, "last_price_usdt": self.price})
+        return 404, "text/plain", f"Unknown endpoint {name}"
+
+
+def make_handler(explorer):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 so clients keep their connections alive, like the real explorer
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without this, Nagle plus
+        # delayed ACKs add ~40ms to every keep-alive response
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            name = url.path.rstrip("/").rsplit("/", 1)[-1]
+            status, content_type, body = explorer.handle(name, params)
+            payload = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(explorer, host="127.0.0.1", port=0):
+    """Serve explorer on a background thread; returns (server, base URL)."""
+    server = ThreadingHTTPServer((host, port), make_handler(explorer))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-explorer", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def parse_endpoint_latency(values):
+    latencies = {}
+    for value in values or []:
+        name, seconds = value.split("=", 1)
+        latencies[name] = float(seconds)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Fact0rn explorer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8555)
+    parser.add_argument("--tip", type=int, default=5000, help="height of the chain tip")
+    parser.add_argument("--seed", type=int, default=0, help="changes every hash, time and difficulty")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--endpoint-latency", action="append", metavar="NAME=SECONDS",
+                        help="latency for one endpoint, e.g. getrawtransaction=0.1")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    explorer = FakeExplorer(
+        FakeChain(args.tip, seed=args.seed),
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        endpoint_latency=parse_endpoint_latency(args.endpoint_latency),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(explorer))
+    server.daemon_threads = True
+    print(f"Fake explorer serving a {args.tip}-block chain on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
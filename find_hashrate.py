@@ -4,8 +4,7 @@ import requests
 import time
 import importlib
 
-# Fact0rn API base URL
-BASE_URL = "https://explorer.fact0rn.io/api/"
+from explorer_client import explorer
 
 # Database connection parameters
 DB_PARAMS = {
@@ -18,8 +17,7 @@ DB_PARAMS = {
 
 def fetch_api_data(endpoint):
     try:
-        response = requests.get(BASE_URL + endpoint)
-        response.raise_for_status()
+        response = explorer.get(endpoint)
         if "getblockhash" in endpoint:
             return response.text.strip()
         return response.json()
@@ -7,8 +7,8 @@ import importlib
 import subprocess
 import os
 
-# Fact0rn API base URL
-BASE_URL = os.environ.get("API_BASE_URL", "https://explorer.fact0rn.io/api/")
+# Explorer root is set with EXPLORER_URL (default https://explorer.fact0rn.io)
+from explorer_client import explorer
 
 def get_db_connection():
     try:
@@ -20,8 +20,7 @@ def get_db_connection():
 
 def fetch_api_data(endpoint):
     try:
-        response = requests.get(BASE_URL + endpoint)
-        response.raise_for_status()
+        response = explorer.get(endpoint)
         if "getblockhash" in endpoint:
             return response.text.strip()
         return response.json()
@@ -0,0 +1,251 @@
+"""
+Network hashrate estimated from cumulative chain work.
+
+The estimate for block n is the node's own getnetworkhashps definition: the
+chain work added over the last HASHRATE_WINDOW blocks (chainwork of n minus
+chainwork of n - HASHRATE_WINDOW) divided by the spread between the earliest
+and latest block time in that span. Chain work comes from getblock and is
+stored in block_headers, so no hashes-per-difficulty constant is assumed.
+Unlike getnetworkhashps it can be computed for any past block, so backfilled
+rows no longer get the hashrate of the moment they were synced.
+
+HashrateEngine keeps the window for the ingest paths and warms it from
+block_headers only, never from the explorer. `python hashrate.py` first
+checks the estimate at the explorer's tip against its getnetworkhashps and
+only then rewrites network_hashrate across block_data; blocks whose window
+has no stored chain work keep the value they have.
+
+Usage: python hashrate.py [--start N] [--end N] [--window 120] [--check] [--force]
+"""
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+from block_headers import block_headers_exist, chain_work
+from chain_summary import update_chain_summary
+
+# Blocks in the estimate window (getnetworkhashps defaults to 120)
+HASHRATE_WINDOW = int(os.environ.get('HASHRATE_WINDOW', 120))
+
+# Largest relative difference from getnetworkhashps the backfill accepts
+HASHRATE_CALIBRATION_TOLERANCE = float(os.environ.get('HASHRATE_CALIBRATION_TOLERANCE', 0.01))
+
+
+def load_hashrate_window(cursor, block_number, count):
+    """
+    (block_number, chain_work, block_time) of the stored headers from
+    block_number - count to block_number, oldest first.
+    """
+    if not block_headers_exist(cursor):
+        return []
+    cursor.execute("""
+        SELECT block_number, chain_work, block_time FROM block_headers
+        WHERE block_number BETWEEN %s AND %s AND chain_work IS NOT NULL AND block_time IS NOT NULL
+        ORDER BY block_number
+    """, (block_number - count, block_number))
+    return cursor.fetchall()
+
+
+class HashrateEngine:
+    """
+    Windowed hashrate estimate for each new block in constant time.
+
+    load_window(cursor, block_number, count) returns the (block_number,
+    chain_work, block_time) of the blocks from block_number - count to
+    block_number, oldest first. As with MovingAverageEngine, the engine
+    re-warms from it whenever a block does not directly follow the last one
+    seen. Blocks with unknown chain work are left out of the window and get
+    no estimate themselves.
+    """
+
+    def __init__(self, load_window=load_hashrate_window, window=HASHRATE_WINDOW):
+        self.load_window = load_window
+        self.window = window
+        self.entries = deque()
+        # Block times in increasing / decreasing order, for the window's min and max
+        self.min_times = deque()
+        self.max_times = deque()
+        self.last_block = None
+
+    def warm(self, cursor, block_number):
+        self.entries.clear()
+        self.min_times.clear()
+        self.max_times.clear()
+        for entry in self.load_window(cursor, block_number, self.window):
+            self.push(*entry)
+        self.last_block = block_number
+
+    def push(self, block_number, work, block_time):
+        if work is None or block_time is None:
+            return
+        block_time = int(block_time)
+        self.entries.append((block_number, int(work)))
+        while self.min_times and self.min_times[-1][1] >= block_time:
+            self.min_times.pop()
+        self.min_times.append((block_number, block_time))
+        while self.max_times and self.max_times[-1][1] <= block_time:
+            self.max_times.pop()
+        self.max_times.append((block_number, block_time))
+        first = block_number - self.window
+        for entries in (self.entries, self.min_times, self.max_times):
+            while entries[0][0] < first:
+                entries.popleft()
+
+    def next(self, cursor, block_number, work, block_time):
+        """Hashrate estimate for block_number once it is included in the window."""
+        if self.last_block != block_number - 1:
+            self.warm(cursor, block_number - 1)
+        self.push(block_number, work, block_time)
+        self.last_block = block_number
+        return self.current() if work is not None else None
+
+    def current(self):
+        if len(self.entries) < 2:
+            return None
+        seconds = self.max_times[0][1] - self.min_times[0][1]
+        if seconds <= 0:
+            return None
+        return (self.entries[-1][1] - self.entries[0][1]) / seconds
+
+
+def estimate_hashrates(blocks, window=HASHRATE_WINDOW, engine=None):
+    """
+    [(block_number, chain_work, block_time), ...] in block order ->
+    [(block_number, hashrate), ...], the same values HashrateEngine gives
+    when fed the blocks one by one. Pass a warmed engine to continue its window.
+    """
+    engine = engine or HashrateEngine(window=window)
+    estimates = []
+    for block_number, work, block_time in blocks:
+        engine.push(block_number, work, block_time)
+        engine.last_block = block_number
+        estimates.append((block_number, engine.current() if work is not None else None))
+    return estimates
+
+
+def calibrate_hashrate(get_block_count, get_block_details, get_network_hashrate, window=HASHRATE_WINDOW,
+                       concurrency=8, attempts=3):
+    """
+    (tip, estimate, getnetworkhashps) at the explorer's tip, with the
+    estimate computed from the explorer's own headers, or None if the tip
+    kept moving or the explorer did not answer.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="calibrate-fetch") as executor:
+        for _ in range(attempts):
+            tip = get_block_count()
+            reported = get_network_hashrate()
+            if tip is None or reported is None:
+                return None
+            heights = range(max(0, tip - window), tip + 1)
+            blocks = [(height, chain_work(details[2]), details[1])
+                      for height, details in zip(heights, executor.map(get_block_details, heights))]
+            if get_block_count() == tip:
+                return tip, estimate_hashrates(blocks, window)[-1][1], float(reported)
+    return None
+
+
+def backfill_network_hashrate(connection, start_block=None, end_block=None, window=HASHRATE_WINDOW, page_size=5000):
+    """
+    Rewrite block_data.network_hashrate with windowed estimates from the
+    chain work in block_headers. The window blocks before start_block are
+    read too, so the first estimates are complete. Blocks without an
+    estimate keep their stored value; only changed rows are written, one
+    commit per page. Returns the number of rows updated.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT block_number, chain_work, block_time FROM block_headers
+            WHERE (%(start)s IS NULL OR block_number >= %(start)s - %(window)s)
+              AND (%(end)s IS NULL OR block_number <= %(end)s)
+            ORDER BY block_number
+        """, {'start': start_block, 'end': end_block, 'window': window})
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+        estimates = [
+            (block_number, hashrate)
+            for block_number, hashrate in estimate_hashrates(rows, window)
+            if hashrate is not None and (start_block is None or block_number >= start_block)
+        ]
+
+        updated = 0
+        for offset in range(0, len(estimates), page_size):
+            execute_values(cursor, """
+                UPDATE block_data b
+                SET network_hashrate = v.hashrate
+                FROM (VALUES %s) AS v(block_number, hashrate)
+                WHERE b.current_block_number = v.block_number
+                  AND b.network_hashrate IS DISTINCT FROM v.hashrate
+            """, estimates[offset:offset + page_size], template="(%s, CAST(%s AS NUMERIC))", page_size=page_size)
+            updated += cursor.rowcount
+            connection.commit()
+            print(f"Estimated hashrate up to block {estimates[min(offset + page_size, len(estimates)) - 1][0]}")
+
+        # avg_hashrate in /api/stats is built from these rows
+        update_chain_summary(cursor, 0)
+        connection.commit()
+        return updated
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+if __name__ == "__main__":
+    from requestevery5seconds import fetch_current_hashrate, get_block_details, get_db_connection
+    from block_headers import backfill_block_headers, ensure_block_headers
+    from explorer_client import explorer
+
+    parser = argparse.ArgumentParser(description="Rewrite block_data.network_hashrate from stored chain work")
+    parser.add_argument('--start', type=int)
+    parser.add_argument('--end', type=int)
+    parser.add_argument('--window', type=int, default=HASHRATE_WINDOW)
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('SYNC_CONCURRENCY', 8)))
+    parser.add_argument('--check', action='store_true',
+                        help="only compare the estimates with the explorer's getnetworkhashps")
+    parser.add_argument('--force', action='store_true',
+                        help="rewrite even if the estimate disagrees with getnetworkhashps")
+    args = parser.parse_args()
+
+    calibration = calibrate_hashrate(lambda: int(explorer.get_text("getblockcount")), get_block_details, fetch_current_hashrate, args.window,
+                                     args.concurrency)
+    difference = None
+    if calibration is None:
+        print("Could not compare with getnetworkhashps")
+    else:
+        tip, estimate, reported = calibration
+        difference = abs(estimate - reported) / reported if estimate and reported else None
+        print(f"Block {tip}: estimated {estimate or 0:.6g} H/s, explorer {reported:.6g} H/s"
+              + (f" (off by {difference:.4%})" if difference is not None else ""))
+    calibrated = difference is not None and difference <= HASHRATE_CALIBRATION_TOLERANCE
+
+    connection = get_db_connection()
+    try:
+        if args.check:
+            cursor = connection.cursor()
+            cursor.execute("SELECT current_block_number, network_hashrate FROM block_data "
+                           "ORDER BY current_block_number DESC LIMIT 1")
+            row = cursor.fetchone()
+            cursor.close()
+            if row and row[1] is not None:
+                print(f"Latest stored block {row[0]}: {float(row[1]):.6g} H/s")
+        elif not calibrated and not args.force:
+            print(f"Estimate is not within {HASHRATE_CALIBRATION_TOLERANCE:.2%} of getnetworkhashps; "
+                  "leaving network_hashrate unchanged (use --force to rewrite anyway)")
+            sys.exit(1)
+        else:
+            # Chain work comes from block_headers; fetch the headers it does not have yet
+            ensure_block_headers(connection)
+            backfill_block_headers(connection, get_block_details,
+                                   None if args.start is None else args.start - args.window, args.end,
+                                   args.concurrency)
+            updated = backfill_network_hashrate(connection, args.start, args.end, args.window)
+            print(f"Updated network_hashrate on {updated} blocks")
+    finally:
+        connection.close()
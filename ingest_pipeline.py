@@ -0,0 +1,231 @@
+import os
+import queue
+import threading
+import time
+
+from requestevery5seconds import get_db_connection, get_block_time, format_unix_time
+from sync_missing_blocks import DEFAULT_CONCURRENCY, fetch_blocks_in_order
+from block_writer import BlockBatchWriter
+from moving_averages import MovingAverageEngine
+from money_supply import MoneySupplyEngine
+from hashrate import HashrateEngine
+
+# Blocks held between stages; a full queue blocks the stage feeding it
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 256))
+
+# Blocks committed per transaction by the write stage
+PIPELINE_BATCH_SIZE = int(os.environ.get('PIPELINE_BATCH_SIZE', 100))
+
+# Seconds the write stage waits for more blocks before committing a partial batch
+PIPELINE_FLUSH_INTERVAL = float(os.environ.get('PIPELINE_FLUSH_INTERVAL', 2.0))
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class IngestPipeline:
+    """
+    Fetch -> transform -> write pipeline for catching up to the chain tip.
+
+    The fetch stage pulls blocks from the explorer on a thread pool and hands
+    them on in block order. The transform stage computes intervals and moving
+    averages. The write stage buffers blocks in a BlockBatchWriter and commits
+    once per batch_size blocks, or sooner when the queue runs dry. Stages are
+    joined by bounded queues, so a slow writer holds back fetching and a slow
+    explorer leaves the writer idle rather than the other way round.
+
+    The run stops at the first block that cannot be fetched or written; the
+    blocks before it are committed and last_block reports where it got to.
+    """
+
+    def __init__(self, get_connection=get_db_connection, concurrency=DEFAULT_CONCURRENCY,
+                 batch_size=PIPELINE_BATCH_SIZE, queue_size=PIPELINE_QUEUE_SIZE,
+                 flush_interval=PIPELINE_FLUSH_INTERVAL):
+        self.get_connection = get_connection
+        self.concurrency = max(1, concurrency)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.last_block = None
+        self.blocks_written = 0
+        self.error = None
+        self._stop = threading.Event()
+
+    def _put(self, target, item):
+        # Blocks while the queue is full, but gives up once another stage failed
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _finish(self, target):
+        # Downstream stages also exit on their own once the pipeline is stopped
+        while True:
+            try:
+                target.put(_DONE, timeout=0.5)
+                return
+            except queue.Full:
+                if self._stop.is_set():
+                    return
+
+    def _get(self, source, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set():
+            wait = 0.5 if deadline is None else min(0.5, deadline - time.monotonic())
+            if wait <= 0:
+                raise queue.Empty
+            try:
+                return source.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, stage, error):
+        if self.error is None:
+            self.error = error
+            print(f"Ingest pipeline {stage} stage failed: {error}")
+        self._stop.set()
+
+    def _fetch_stage(self, start_block, end_block, fetched):
+        try:
+            expected = start_block
+            for block in fetch_blocks_in_order(range(start_block, end_block + 1), self.concurrency):
+                if block is None:
+                    # Later blocks cannot be written without this one; let the
+                    # blocks already fetched drain through the other stages
+                    self.error = Exception(f"Failed to fetch block {expected}")
+                    break
+                if not self._put(fetched, block):
+                    break
+                expected += 1
+        except Exception as e:
+            self._fail("fetch", e)
+        finally:
+            self._finish(fetched)
+
+    def _transform_stage(self, start_block, fetched, transformed):
+        connection = None
+        try:
+            connection = self.get_connection()
+            cursor = connection.cursor()
+            moving_average_engine = MovingAverageEngine()
+            moving_average_engine.warm(cursor, start_block - 1)
+            money_supply_engine = MoneySupplyEngine()
+            money_supply_engine.warm(cursor, start_block - 1)
+            hashrate_engine = HashrateEngine()
+            hashrate_engine.warm(cursor, start_block - 1)
+
+            prev_block_time = get_block_time(start_block - 1, cursor)
+            if prev_block_time is None:
+                raise Exception(f"Failed to get details for previous block {start_block - 1}")
+            connection.rollback()
+
+            while True:
+                block = self._get(fetched)
+                if block is _DONE:
+                    break
+                block_index = block['block_index']
+                block_time = block['block_time']
+                time_difference = block_time - prev_block_time
+
+                # Blocks arrive in order, so the engines never need to re-warm
+                averages = moving_average_engine.next(cursor, block_index, time_difference)
+                money_supply = money_supply_engine.next(cursor, block_index, block['block_reward'])
+                network_hashrate = hashrate_engine.next(cursor, block_index, block['chain_work'], block_time)
+
+                block.update({
+                    'prev_block_time': prev_block_time,
+                    'time_difference': time_difference,
+                    'formatted_time': format_unix_time(block_time),
+                    'averages': averages,
+                    'money_supply': money_supply,
+                    'network_hashrate': network_hashrate
+                })
+                if not self._put(transformed, block):
+                    break
+                prev_block_time = block_time
+        except Exception as e:
+            self._fail("transform", e)
+        finally:
+            self._finish(transformed)
+            if connection:
+                connection.close()
+
+    def _write_stage(self, transformed):
+        connection = None
+        writer = None
+        try:
+            connection = self.get_connection()
+            writer = BlockBatchWriter(connection, batch_size=self.batch_size)
+            pending_last = None
+            while True:
+                try:
+                    block = self._get(transformed, timeout=self.flush_interval)
+                except queue.Empty:
+                    # Nothing new for a while; commit what we have
+                    if writer.flush():
+                        self.last_block = pending_last
+                    continue
+                if block is _DONE:
+                    break
+                pending_last = block['block_index']
+                if writer.add(
+                    block['block_index'],
+                    block['block_time'],
+                    block['block_index'] - 1,
+                    block['prev_block_time'],
+                    block['time_difference'],
+                    block['network_hashrate'],
+                    block['averages'],
+                    formatted_time=block['formatted_time'],
+                    money_supply=block['money_supply'],
+                    block_reward=block['block_reward'],
+                    header=block['header']
+                ):
+                    self.last_block = pending_last
+            if not self._stop.is_set() and writer.flush():
+                self.last_block = pending_last
+        except Exception as e:
+            self._fail("write", e)
+        finally:
+            if connection:
+                connection.close()
+
+    def run(self, start_block, end_block):
+        """
+        Ingest start_block..end_block (inclusive). Returns the last block that
+        was committed, or None if nothing was. Raises the first stage error
+        after every stage has stopped.
+        """
+        self.last_block = None
+        self.error = None
+        self._stop.clear()
+        fetched = queue.Queue(maxsize=self.queue_size)
+        transformed = queue.Queue(maxsize=self.queue_size)
+
+        started = time.perf_counter()
+        stages = [
+            threading.Thread(target=self._fetch_stage, args=(start_block, end_block, fetched),
+                             name="ingest-fetch", daemon=True),
+            threading.Thread(target=self._transform_stage, args=(start_block, fetched, transformed),
+                             name="ingest-transform", daemon=True),
+            threading.Thread(target=self._write_stage, args=(transformed,),
+                             name="ingest-write", daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+        elapsed = time.perf_counter() - started
+        if self.last_block is not None:
+            written = self.last_block - start_block + 1
+            self.blocks_written += written
+            print(f"Ingested blocks {start_block}-{self.last_block} in {elapsed:.1f}s "
+                  f"({written / elapsed:.1f} blocks/sec)")
+        if self.error is not None:
+            raise self.error
+        return self.last_block
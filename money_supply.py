@@ -0,0 +1,254 @@
+"""
+Money supply derived from block rewards.
+
+supply(n) = anchor_supply + sum of block_reward over the blocks between the
+anchor and n, so each block's supply is the previous block's plus its own
+reward. MoneySupplyEngine does that in O(1) per block for the ingest paths;
+backfill_money_supply() does it for a whole range with one window-function
+UPDATE. The explorer's getmoneysupply (the supply at its current tip) is only
+used to pick an anchor when none is stored and, from reconcile_money_supply(),
+to check that the derived values have not drifted. start_supply_reconciler()
+runs that check in a background thread, retrying every
+MONEY_SUPPLY_RETRY_INTERVAL seconds until a supply is anchored.
+
+Usage: python money_supply.py [--anchor BLOCK:SUPPLY | --anchor explorer] [--check]
+"""
+import argparse
+import os
+import threading
+from decimal import Decimal
+
+from explorer_client import explorer
+from chain_summary import chain_summary_exists, update_chain_summary
+from daily_emissions import daily_emissions_exists, refresh_daily_emissions
+
+# Seconds between explorer reconciliation checks in the live loop
+MONEY_SUPPLY_CHECK_INTERVAL = int(os.environ.get('MONEY_SUPPLY_CHECK_INTERVAL', 3600))
+
+# Seconds between attempts while no supply is anchored yet (e.g. the tip is not stored)
+MONEY_SUPPLY_RETRY_INTERVAL = int(os.environ.get('MONEY_SUPPLY_RETRY_INTERVAL', 30))
+
+# Largest difference from the explorer's supply that is not reported as drift
+MONEY_SUPPLY_TOLERANCE = float(os.environ.get('MONEY_SUPPLY_TOLERANCE', 0.01))
+
+# Supplies are stored to the smallest unit (8 decimals)
+SATOSHI = Decimal('0.00000001')
+
+
+def add_reward(supply, block_reward):
+    """supply + block_reward, exact and rounded to SATOSHI; rewards arrive as JSON floats."""
+    return (Decimal(str(supply)) + Decimal(str(block_reward))).quantize(SATOSHI)
+
+
+class MoneySupplyEngine:
+    """
+    Running money supply for blocks processed in order. Re-reads the previous
+    block's stored supply from emissions whenever the next block does not
+    directly follow the last one, the same way MovingAverageEngine re-warms,
+    so callers that flush before a moving average re-warm are covered too.
+    """
+
+    def __init__(self):
+        self.last_block = None
+        self.last_supply = None
+
+    def warm(self, cursor, block_number):
+        cursor.execute("SELECT money_supply FROM emissions WHERE current_block_number = %s", (block_number,))
+        row = cursor.fetchone()
+        self.last_block = block_number
+        self.last_supply = row[0] if row else None
+
+    def next(self, cursor, block_number, block_reward):
+        """Supply once block_number is mined, or None while no anchor is known."""
+        if self.last_block != block_number - 1:
+            self.warm(cursor, block_number - 1)
+        if self.last_supply is None or block_reward is None:
+            supply = None
+        else:
+            supply = add_reward(self.last_supply, block_reward)
+        self.last_block = block_number
+        self.last_supply = supply
+        return supply
+
+
+def parse_anchor(value):
+    """'12345:6789.5' -> (12345, Decimal-compatible string)"""
+    block_number, supply = value.split(':', 1)
+    return int(block_number), supply
+
+
+def explorer_anchor():
+    """
+    (tip, supply) from the explorer, or None if a block arrived between the
+    two calls (then the supply might belong to either block).
+    """
+    try:
+        tip = int(explorer.get_text("getblockcount"))
+        supply = explorer.get_text("getmoneysupply", is_ext=True)
+        if int(explorer.get_text("getblockcount")) != tip:
+            return None
+        return tip, supply
+    except Exception as e:
+        print(f"Error fetching money supply anchor from explorer: {e}")
+        return None
+
+
+def backfill_money_supply(connection, anchor_block, anchor_supply):
+    """
+    Rewrite emissions.money_supply from an anchor with one set-based UPDATE.
+
+    Covers the run of consecutive blocks with known rewards that contains the
+    anchor; a missing row or reward ends the run, since no supply past it can
+    be derived. Refreshes daily_emissions and chain_summary and commits.
+    Returns (blocks updated, first block, last block) of the run.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            WITH rewards AS (
+                SELECT current_block_number, block_reward,
+                       current_block_number - ROW_NUMBER() OVER (ORDER BY current_block_number) AS run
+                FROM emissions
+                WHERE block_reward IS NOT NULL
+            ),
+            anchored_run AS (
+                SELECT current_block_number,
+                       SUM(block_reward) OVER (ORDER BY current_block_number) AS cumulative
+                FROM rewards
+                WHERE run = (SELECT run FROM rewards WHERE current_block_number = %(anchor_block)s)
+            ),
+            supplies AS (
+                SELECT current_block_number,
+                       CAST(%(anchor_supply)s AS NUMERIC) + cumulative - (
+                           SELECT cumulative FROM anchored_run WHERE current_block_number = %(anchor_block)s
+                       ) AS money_supply
+                FROM anchored_run
+            ),
+            updated AS (
+                UPDATE emissions e
+                SET money_supply = s.money_supply
+                FROM supplies s
+                WHERE e.current_block_number = s.current_block_number
+                  AND e.money_supply IS DISTINCT FROM s.money_supply
+                RETURNING e.current_block_number
+            )
+            SELECT (SELECT COUNT(*) FROM updated),
+                   (SELECT MIN(current_block_number) FROM supplies),
+                   (SELECT MAX(current_block_number) FROM supplies)
+        """, {'anchor_block': anchor_block, 'anchor_supply': str(anchor_supply)})
+        updated, first_block, last_block = cursor.fetchone()
+        if first_block is None:
+            print(f"Block {anchor_block} has no stored reward; cannot anchor the money supply there")
+            connection.rollback()
+            return 0, None, None
+
+        if updated:
+            # Per-day supplies and the latest supply were built from the old values
+            if daily_emissions_exists(cursor):
+                refresh_daily_emissions(cursor, first_block, last_block)
+            if chain_summary_exists(cursor):
+                update_chain_summary(cursor, 0)
+        connection.commit()
+        print(f"Derived money supply for blocks {first_block}-{last_block} from block {anchor_block} "
+              f"({updated} blocks updated)")
+        return updated, first_block, last_block
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def reconcile_money_supply(connection, tolerance=MONEY_SUPPLY_TOLERANCE, on_anchor=None):
+    """
+    Compare the derived supply at the explorer's tip with getmoneysupply.
+    If nothing has been derived yet, anchor there, backfill and call
+    on_anchor() (callers reset their MoneySupplyEngine). Returns the explorer
+    minus local difference (0 after anchoring), or None if no check ran.
+    """
+    anchor = explorer_anchor()
+    if anchor is None:
+        return None
+    tip, explorer_supply = anchor
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT money_supply, block_reward FROM emissions WHERE current_block_number = %s", (tip,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        connection.rollback()
+    if row is None:
+        print(f"Block {tip} is not stored yet; skipping money supply check")
+        return None
+
+    local_supply, block_reward = row
+    if local_supply is None:
+        print(f"No derived money supply at block {tip}; anchoring at the explorer's {explorer_supply}")
+        updated, first_block, _ = backfill_money_supply(connection, tip, explorer_supply)
+        if first_block is None:
+            return None
+        if on_anchor is not None:
+            on_anchor()
+        return 0.0
+
+    difference = float(explorer_supply) - float(local_supply)
+    if abs(difference) > tolerance:
+        print(f"WARNING: money supply at block {tip} differs from the explorer by {difference:+.8f} "
+              f"(local {local_supply}, explorer {explorer_supply}). "
+              f"Re-anchor with: python money_supply.py --anchor explorer")
+    else:
+        print(f"Money supply at block {tip} matches the explorer (difference {difference:+.8f})")
+    return difference
+
+
+def run_supply_reconciler(get_connection, on_anchor=None, interval=MONEY_SUPPLY_CHECK_INTERVAL,
+                          retry_interval=MONEY_SUPPLY_RETRY_INTERVAL, stop_event=None):
+    """Reconcile every `interval` seconds, or every `retry_interval` while no check could run."""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        connection = None
+        difference = None
+        try:
+            connection = get_connection()
+            difference = reconcile_money_supply(connection, on_anchor=on_anchor)
+        except Exception as e:
+            print(f"Error reconciling money supply: {e}")
+        finally:
+            if connection:
+                connection.close()
+        stop_event.wait(interval if difference is not None else retry_interval)
+
+
+def start_supply_reconciler(get_connection, on_anchor=None, interval=MONEY_SUPPLY_CHECK_INTERVAL):
+    """Run the money supply reconciler in a daemon thread, starting now; returns its stop event."""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_supply_reconciler, args=(get_connection, on_anchor, interval),
+                              kwargs={'stop_event': stop_event}, name="supply-reconciler", daemon=True)
+    thread.start()
+    return stop_event
+
+
+if __name__ == "__main__":
+    from requestevery5seconds import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Derive emissions.money_supply from block rewards")
+    parser.add_argument('--anchor', default='explorer',
+                        help="BLOCK:SUPPLY, or 'explorer' to use the explorer's current tip (default)")
+    parser.add_argument('--check', action='store_true', help="only compare with the explorer")
+    args = parser.parse_args()
+
+    connection = get_db_connection()
+    try:
+        if args.check:
+            reconcile_money_supply(connection)
+        else:
+            if args.anchor == 'explorer':
+                anchor = explorer_anchor()
+                if anchor is None:
+                    raise SystemExit("Could not get a stable anchor from the explorer, try again")
+            else:
+                anchor = parse_anchor(args.anchor)
+            backfill_money_supply(connection, *anchor)
+    finally:
+        connection.close()
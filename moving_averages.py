@@ -0,0 +1,305 @@
+import os
+import threading
+from collections import deque
+
+from chain_summary import update_chain_summary
+
+# Define moving averages periods (block_data has a moving_avg_<N> column for each)
+MOVING_AVERAGES = [100, 672]
+
+# All windows stored in the block_moving_averages side table, configurable with
+# MOVING_AVERAGE_WINDOWS; the block_data column windows are always included
+MOVING_AVERAGE_WINDOWS = sorted(
+    set(int(window) for window in os.environ.get('MOVING_AVERAGE_WINDOWS', '24,144,1008,2016').split(',') if window.strip())
+    | set(MOVING_AVERAGES)
+)
+
+
+class RollingAverage:
+    """Average of the last `window` values, kept as a running sum."""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.total = 0
+
+    def clear(self):
+        self.values.clear()
+        self.total = 0
+
+    def push(self, value):
+        self.values.append(value)
+        self.total += value
+        if len(self.values) > self.window:
+            self.total -= self.values.popleft()
+        return self.average()
+
+    def average(self):
+        if not self.values:
+            return None
+        return self.total / len(self.values)
+
+
+class MovingAverageEngine:
+    """
+    Computes the block time moving averages for each new block in constant time.
+
+    The engine holds the last max(windows) block intervals in memory. It is
+    warmed from block_data once and then fed each new block's interval in
+    order. If a block arrives that does not directly follow the last one seen
+    (a gap, a re-processed block or a backfill), it re-warms from the database
+    up to the previous block first, so the averages always match those of the
+    rows in block_data.
+    """
+
+    def __init__(self, windows=MOVING_AVERAGE_WINDOWS):
+        self.windows = list(windows)
+        self.averages = {window: RollingAverage(window) for window in self.windows}
+        self.last_block = None
+
+    def warm(self, cursor, block_number):
+        """Load the intervals of the blocks up to and including block_number."""
+        cursor.execute("""
+            SELECT block_time_interval_seconds
+            FROM block_data
+            WHERE current_block_number <= %s AND block_time_interval_seconds IS NOT NULL
+            ORDER BY current_block_number DESC
+            LIMIT %s
+        """, (block_number, max(self.windows)))
+        intervals = [row[0] for row in cursor.fetchall()]
+
+        for average in self.averages.values():
+            average.clear()
+        for interval in reversed(intervals):
+            for average in self.averages.values():
+                average.push(interval)
+        self.last_block = block_number
+
+    def next(self, cursor, block_number, interval):
+        """Return {window: average} for block_number once its interval is included."""
+        if self.last_block != block_number - 1:
+            self.warm(cursor, block_number - 1)
+
+        if interval is not None:
+            for average in self.averages.values():
+                average.push(interval)
+        self.last_block = block_number
+        return self.current()
+
+    def current(self):
+        return {window: average.average() for window, average in self.averages.items()}
+
+
+def moving_average_columns(windows=MOVING_AVERAGES):
+    return [f"moving_avg_{window}" for window in windows]
+
+
+def format_moving_averages(block_number, averages):
+    parts = [f"{window}-block avg = {value:.2f}" if value is not None else f"{window}-block avg = N/A"
+             for window, value in averages.items()]
+    return f"Moving averages for block {block_number}: {', '.join(parts)}"
+
+
+def recompute_moving_averages(connection, start_block=None, end_block=None, only_missing=False,
+                              batch_size=50000, windows=MOVING_AVERAGE_WINDOWS):
+    """
+    Recompute the moving averages of a block range with window functions.
+
+    Each batch of batch_size blocks is one statement that computes every window
+    with AVG(...) OVER (ROWS BETWEEN N-1 PRECEDING AND CURRENT ROW), reading
+    enough blocks before the batch to fill the largest window. The same pass
+    writes the moving_avg_<N> columns on block_data and the rows of
+    block_moving_averages, and each batch is committed on its own. Values that
+    are already correct are not rewritten. Returns the number of blocks updated.
+    """
+    cursor = connection.cursor()
+    if start_block is None or end_block is None:
+        cursor.execute("SELECT MIN(current_block_number), MAX(current_block_number) FROM block_data")
+        min_block, max_block = cursor.fetchone()
+        if min_block is None:
+            cursor.close()
+            return 0
+        start_block = min_block if start_block is None else start_block
+        end_block = max_block if end_block is None else end_block
+
+    windows = sorted(windows)
+    column_windows = [window for window in MOVING_AVERAGES if window in windows]
+    columns = moving_average_columns(column_windows)
+    window_averages = ",\n".join(
+        f"AVG(block_time_interval_seconds) OVER (ORDER BY current_block_number "
+        f"ROWS BETWEEN {window - 1} PRECEDING AND CURRENT ROW) AS avg_{window}"
+        for window in windows
+    )
+    window_values = ", ".join(f"({window}, w.avg_{window})" for window in windows)
+
+    if column_windows:
+        assignments = ", ".join(
+            f"{column} = CAST(w.avg_{window} AS NUMERIC(20,8))" for column, window in zip(columns, column_windows)
+        )
+        changed = " OR ".join(
+            f"b.{column} IS DISTINCT FROM CAST(w.avg_{window} AS NUMERIC(20,8))"
+            for column, window in zip(columns, column_windows)
+        )
+        missing = " OR ".join(f"b.{column} IS NULL" for column in columns)
+        column_update = f"""
+            UPDATE block_data b
+            SET {assignments}
+            FROM w
+            WHERE b.current_block_number = w.current_block_number
+              AND w.current_block_number >= %(batch_start)s
+              AND ({changed})
+              {f"AND ({missing})" if only_missing else ""}
+            RETURNING b.current_block_number
+        """
+    else:
+        column_update = "SELECT NULL::integer AS current_block_number WHERE false"
+
+    # Missing-only runs never overwrite side table values that already exist
+    conflict_action = "DO NOTHING" if only_missing else """DO UPDATE SET value = EXCLUDED.value
+                WHERE block_moving_averages.value IS DISTINCT FROM EXCLUDED.value"""
+
+    query = f"""
+        WITH w AS (
+            SELECT current_block_number,
+                   {window_averages}
+            FROM block_data
+            WHERE block_time_interval_seconds IS NOT NULL
+              AND current_block_number <= %(batch_end)s
+              AND current_block_number >= COALESCE((
+                  SELECT MIN(current_block_number) FROM (
+                      SELECT current_block_number
+                      FROM block_data
+                      WHERE current_block_number < %(batch_start)s AND block_time_interval_seconds IS NOT NULL
+                      ORDER BY current_block_number DESC
+                      LIMIT %(lead_in)s
+                  ) AS lead_in
+              ), %(batch_start)s)
+        ),
+        updated_columns AS ({column_update}),
+        updated_windows AS (
+            INSERT INTO block_moving_averages (block_number, window_size, value)
+            SELECT w.current_block_number, v.window_size, CAST(v.value AS NUMERIC(20,8))
+            FROM w CROSS JOIN LATERAL (VALUES {window_values}) AS v(window_size, value)
+            WHERE w.current_block_number >= %(batch_start)s AND v.value IS NOT NULL
+            ON CONFLICT (block_number, window_size) {conflict_action}
+            RETURNING block_number
+        )
+        SELECT COUNT(*) FROM (
+            SELECT current_block_number FROM updated_columns
+            UNION
+            SELECT block_number FROM updated_windows
+        ) AS updated_blocks
+    """
+
+    updated = 0
+    try:
+        for batch_start in range(start_block, end_block + 1, batch_size):
+            batch_end = min(batch_start + batch_size - 1, end_block)
+            cursor.execute(query, {
+                'batch_start': batch_start,
+                'batch_end': batch_end,
+                'lead_in': max(windows) - 1
+            })
+            batch_updated = cursor.fetchone()[0]
+            updated += batch_updated
+            connection.commit()
+            print(f"Recomputed moving averages for blocks {batch_start}-{batch_end} ({batch_updated} blocks updated)")
+        if updated and column_windows:
+            # The latest block's averages may have been among those repaired
+            update_chain_summary(cursor, 0)
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return updated
+
+
+def record_dirty_range(cursor, block_number, windows=MOVING_AVERAGE_WINDOWS):
+    """
+    Record the blocks whose moving averages go stale when block_number is
+    written after blocks that follow it already exist.
+
+    The range runs from block_number through the block that is
+    max(windows) - 1 interval-bearing rows later, because those are the
+    windows the new row falls into. Nothing is recorded for in-order writes
+    at the chain tip.
+    """
+    cursor.execute("""
+        INSERT INTO moving_average_dirty_ranges (start_block, end_block)
+        SELECT %(block)s, MAX(current_block_number)
+        FROM (
+            SELECT current_block_number
+            FROM block_data
+            WHERE current_block_number > %(block)s AND block_time_interval_seconds IS NOT NULL
+            ORDER BY current_block_number
+            LIMIT %(following)s
+        ) AS following_blocks
+        HAVING COUNT(*) > 0
+    """, {'block': block_number, 'following': max(windows) - 1})
+    return cursor.rowcount > 0
+
+
+def merge_ranges(ranges):
+    """Merge overlapping or adjacent (start, end) ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(block_range) for block_range in merged]
+
+
+def reconcile_dirty_ranges(connection, windows=MOVING_AVERAGE_WINDOWS):
+    """
+    Recompute moving averages for every recorded dirty range, merging
+    overlapping ranges first, then clear the ranges that were processed.
+    Returns the number of block_data rows updated.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT id, start_block, end_block FROM moving_average_dirty_ranges")
+    rows = cursor.fetchall()
+    connection.commit()
+    if not rows:
+        cursor.close()
+        return 0
+
+    ranges = merge_ranges((start_block, end_block) for _, start_block, end_block in rows)
+    print(f"Reconciling {len(rows)} dirty moving average ranges merged into {len(ranges)}")
+
+    updated = 0
+    for start_block, end_block in ranges:
+        updated += recompute_moving_averages(connection, start_block, end_block, windows=windows)
+
+    # Only clear the ranges read above; ranges recorded meanwhile wait for the next pass
+    cursor.execute("DELETE FROM moving_average_dirty_ranges WHERE id = ANY(%s)", ([row[0] for row in rows],))
+    connection.commit()
+    cursor.close()
+    return updated
+
+
+def run_reconciler(get_connection, interval=60, stop_event=None):
+    """Reconcile dirty ranges every `interval` seconds until stop_event is set."""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        connection = None
+        try:
+            connection = get_connection()
+            reconcile_dirty_ranges(connection)
+        except Exception as e:
+            print(f"Error reconciling dirty moving average ranges: {e}")
+        finally:
+            if connection:
+                connection.close()
+        stop_event.wait(interval)
+
+
+def start_reconciler(get_connection, interval=60):
+    """Run the dirty range reconciler in a daemon thread; returns its stop event."""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_reconciler, args=(get_connection, interval, stop_event),
+                              name="ma-reconciler", daemon=True)
+    thread.start()
+    return stop_event
@@ -0,0 +1,246 @@
+"""
+On-disk cache of raw explorer responses that never change.
+
+A getblock payload is fixed by its block hash and a getrawtransaction
+payload by its txid, so once fetched they can be kept for every later
+re-sync or rebuild. The height -> hash mapping is only stored once a block
+is buried under RAW_CACHE_MIN_CONFIRMATIONS blocks, since the tip can
+still be reorganised.
+
+Entries are zlib-compressed JSON appended to segment files
+(segment-000001.dat, ...); index.log records where each entry is, one
+line per entry. Segments are memory-mapped for reads. When the segments
+outgrow RAW_CACHE_MAX_BYTES the oldest ones are deleted and the index is
+rewritten. Several processes can share one directory: appends are
+serialised with a lock file, and each process picks up the others'
+entries from index.log on a miss.
+"""
+import json
+import mmap
+import os
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+# Directory of the cache; set RAW_CACHE_DIR to an empty string to disable it
+RAW_CACHE_DIR = os.environ.get('RAW_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'raw_cache'))
+
+# Total size of the segment files before the oldest are evicted
+RAW_CACHE_MAX_BYTES = int(os.environ.get('RAW_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Size at which a new segment file is started
+RAW_CACHE_SEGMENT_BYTES = int(os.environ.get('RAW_CACHE_SEGMENT_BYTES', 64 * 1024 * 1024))
+
+# Confirmations after which a block's height -> hash mapping is treated as final
+RAW_CACHE_MIN_CONFIRMATIONS = int(os.environ.get('RAW_CACHE_MIN_CONFIRMATIONS', 100))
+
+INDEX_FILE = 'index.log'
+LOCK_FILE = 'lock'
+
+
+class RawResponseCache:
+    """Append-only, size-bounded store of JSON values keyed by (kind, key)."""
+
+    def __init__(self, directory, max_bytes=RAW_CACHE_MAX_BYTES, segment_bytes=RAW_CACHE_SEGMENT_BYTES,
+                 min_confirmations=RAW_CACHE_MIN_CONFIRMATIONS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.min_confirmations = min_confirmations
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, INDEX_FILE)
+        self._lock = threading.Lock()
+        # name -> (segment, offset, length)
+        self._index = {}
+        self._index_position = 0
+        self._index_inode = None
+        # segment -> (file, mmap)
+        self._maps = {}
+        # Highest block height known to exist, for deciding when a block is buried
+        self.tip = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evicted_segments = 0
+        with self._lock:
+            self._load_index()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:06d}.dat")
+
+    def _segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith('segment-') and name.endswith('.dat'):
+                segments.append(int(name[8:-4]))
+        return sorted(segments)
+
+    def _load_index(self):
+        """Read index lines appended since the last call (by any process)."""
+        try:
+            stat = os.stat(self._index_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._index_inode or stat.st_size < self._index_position:
+            # Rewritten by an eviction: start over
+            self._index = {}
+            self._index_position = 0
+            self._index_inode = stat.st_ino
+        if stat.st_size == self._index_position:
+            return
+        with open(self._index_path, 'rb') as f:
+            f.seek(self._index_position)
+            data = f.read()
+        # A line still being appended by another process is read next time
+        complete = data.rfind(b'\n') + 1
+        for line in data[:complete].decode().splitlines():
+            name, segment, offset, length = line.rsplit('\t', 3)
+            self._index[name] = (int(segment), int(offset), int(length))
+        self._index_position += complete
+
+    def _close_segment(self, segment):
+        mapped = self._maps.pop(segment, None)
+        if mapped is not None:
+            mapped[1].close()
+            mapped[0].close()
+
+    def _read(self, entry):
+        segment, offset, length = entry
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped[1]) < offset + length:
+            # Not mapped yet, or the segment has grown since it was mapped
+            self._close_segment(segment)
+            try:
+                f = open(self._segment_path(segment), 'rb')
+            except FileNotFoundError:
+                return None
+            if os.fstat(f.fileno()).st_size < offset + length:
+                f.close()
+                return None
+            mapped = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            self._maps[segment] = mapped
+        return mapped[1][offset:offset + length]
+
+    def get(self, kind, key):
+        """The stored value, or None on a miss."""
+        name = f"{kind}:{key}"
+        with self._lock:
+            entry = self._index.get(name)
+            if entry is None:
+                self._load_index()
+                entry = self._index.get(name)
+            data = self._read(entry) if entry is not None else None
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(zlib.decompress(data))
+
+    def put(self, kind, key, value):
+        name = f"{kind}:{key}"
+        payload = zlib.compress(json.dumps(value, separators=(',', ':')).encode())
+        with self._lock, open(os.path.join(self.directory, LOCK_FILE), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._load_index()
+            if name in self._index:
+                return
+
+            segments = self._segments()
+            segment = segments[-1] if segments else 1
+            path = self._segment_path(segment)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size and size + len(payload) > self.segment_bytes:
+                segment += 1
+                path = self._segment_path(segment)
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(payload)
+            # The entry only becomes visible once its data is in place
+            with open(self._index_path, 'ab') as f:
+                f.write(f"{name}\t{segment}\t{offset}\t{len(payload)}\n".encode())
+            self._index[name] = (segment, offset, len(payload))
+            self.writes += 1
+            self._evict()
+
+    def _evict(self):
+        """Delete the oldest segments until the rest fit in max_bytes. Caller holds both locks."""
+        segments = [(segment, os.path.getsize(self._segment_path(segment))) for segment in self._segments()]
+        total = sum(size for _, size in segments)
+        evicted = set()
+        while total > self.max_bytes and len(segments) > 1:
+            segment, size = segments.pop(0)
+            self._close_segment(segment)
+            os.remove(self._segment_path(segment))
+            evicted.add(segment)
+            total -= size
+        if not evicted:
+            return
+        self.evicted_segments += len(evicted)
+        self._load_index()
+        self._index = {name: entry for name, entry in self._index.items() if entry[0] not in evicted}
+        temporary = self._index_path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(''.join(f"{name}\t{segment}\t{offset}\t{length}\n"
+                            for name, (segment, offset, length) in self._index.items()).encode())
+        os.replace(temporary, self._index_path)
+        stat = os.stat(self._index_path)
+        self._index_inode = stat.st_ino
+        self._index_position = stat.st_size
+
+    def keys(self, kind):
+        """Keys stored under kind, e.g. every cached height."""
+        prefix = f"{kind}:"
+        with self._lock:
+            self._load_index()
+            return [name[len(prefix):] for name in self._index if name.startswith(prefix)]
+
+    def note_tip(self, height):
+        if height is not None and (self.tip is None or height > self.tip):
+            self.tip = height
+
+    def is_buried(self, height):
+        return self.tip is not None and self.tip - height + 1 >= self.min_confirmations
+
+    def clear(self):
+        with self._lock, open(os.path.join(self.directory, LOCK_FILE), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            for segment in self._segments():
+                self._close_segment(segment)
+                os.remove(self._segment_path(segment))
+            if os.path.exists(self._index_path):
+                os.remove(self._index_path)
+            self._index = {}
+            self._index_position = 0
+            self._index_inode = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'directory': self.directory,
+                'entries': len(self._index),
+                'bytes': sum(os.path.getsize(self._segment_path(segment)) for segment in self._segments()),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'writes': self.writes,
+                'evicted_segments': self.evicted_segments
+            }
+
+
+def open_raw_cache(directory=RAW_CACHE_DIR):
+    """The configured cache, or None when RAW_CACHE_DIR is empty or unusable."""
+    if not directory:
+        return None
+    try:
+        return RawResponseCache(directory)
+    except OSError as e:
+        print(f"Raw response cache disabled, cannot use {directory}: {e}")
+        return None
@@ -0,0 +1,446 @@
+"""
+Offline rebuild of the derived tables from raw block payloads.
+
+Reads every stored block's getblock payload (and coinbase transaction, when
+cached) from the raw response cache, or from a dump written with --export,
+and recomputes block_data (intervals, moving averages, hashrate),
+block_moving_averages, emissions (rewards, money supply) and block_headers
+without calling the explorer. Payloads are decoded in parallel worker
+processes; the window calculations are single linear passes in the parent.
+
+The results are bulk-loaded with COPY into fresh <table>_rebuild tables
+(created LIKE the live ones, so schema changes carry over) and swapped in
+with renames in one transaction. Blocks written while the rebuild ran, and
+blocks whose payloads were not available, are carried over from the old
+tables in that transaction. daily_emissions and chain_summary are rebuilt
+in it too, so readers see either the old tables or the new ones.
+
+Which blocks are rebuilt: the heights in block_data, or every height in the
+source when block_data is empty (a fresh database restored from a dump).
+
+Usage: python rebuild.py [--dump chain.jsonl.gz] [--workers N] [--anchor BLOCK:SUPPLY] [--keep-old]
+       python rebuild.py --export chain.jsonl.gz
+"""
+import argparse
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from block_headers import HEADER_COLUMNS, block_headers_exist, chain_work, ensure_block_headers, header_row
+from block_rewards import SubsidySchedule
+from chain_summary import chain_summary_exists, rebuild_chain_summary
+from daily_emissions import daily_emissions_exists, rebuild_daily_emissions
+from hashrate import HASHRATE_WINDOW, HashrateEngine
+from money_supply import SATOSHI, add_reward, parse_anchor
+from moving_averages import MOVING_AVERAGES, MOVING_AVERAGE_WINDOWS, RollingAverage, moving_average_columns
+from raw_cache import RAW_CACHE_DIR, RawResponseCache
+from schema_registry import table_exists
+
+# Table -> block number column, in swap order
+REBUILT_TABLES = {
+    'block_data': 'current_block_number',
+    'block_moving_averages': 'block_number',
+    'emissions': 'current_block_number',
+    'block_headers': 'block_number',
+}
+
+# Blocks handed to a worker process at a time
+REBUILD_CHUNK_SIZE = int(os.environ.get('REBUILD_CHUNK_SIZE', 2000))
+
+# Rows sent per COPY statement
+COPY_BATCH_SIZE = 100000
+
+BLOCK_DATA_COLUMNS = [
+    'current_block_number',
+    'current_block_timestamp',
+    'previous_block_number',
+    'previous_block_timestamp',
+    'block_time_interval_seconds',
+    'network_hashrate'
+] + moving_average_columns()
+
+EMISSIONS_COLUMNS = ['current_block_number', 'unix_timestamp', 'date_time', 'money_supply', 'block_reward']
+
+# Raw cache opened once per worker process
+_worker_cache = None
+
+
+def _init_worker(cache_directory):
+    global _worker_cache
+    _worker_cache = RawResponseCache(cache_directory) if cache_directory else None
+
+
+def parse_block(block_number, block_info, coinbase, schedule):
+    """
+    (block_number, time, chain work, reward, header row) for one payload.
+    Without a cached coinbase, a coinbase-only block's reward is its subsidy.
+    """
+    reward = None
+    if coinbase and coinbase.get('vout'):
+        reward = coinbase['vout'][0]['value']
+    elif block_info.get('nTx', len(block_info.get('tx') or [])) == 1:
+        reward = schedule.subsidy(block_number)
+    return (block_number, block_info.get('time'), chain_work(block_info), reward,
+            header_row(block_number, block_info))
+
+
+def _parse_cached_chunk(chunk):
+    schedule = SubsidySchedule()
+    parsed = []
+    for block_number, block_hash in chunk:
+        if block_hash is None:
+            block_hash = _worker_cache.get('height', block_number)
+        block_info = _worker_cache.get('block', block_hash) if block_hash else None
+        if block_info is None:
+            continue
+        coinbase = _worker_cache.get('tx', block_info['tx'][0]) if block_info.get('tx') else None
+        parsed.append(parse_block(block_number, block_info, coinbase, schedule))
+    return parsed
+
+
+def _parse_dump_chunk(lines):
+    schedule = SubsidySchedule()
+    parsed = []
+    for line in lines:
+        record = json.loads(line)
+        block_info = record['block']
+        parsed.append(parse_block(block_info['height'], block_info, record.get('coinbase'), schedule))
+    return parsed
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def cached_block_hashes(cursor, cache):
+    """{height: hash or None} for every height the cache may hold; None means look up the height in the cache."""
+    hashes = {int(height): None for height in cache.keys('height')}
+    if block_headers_exist(cursor):
+        cursor.execute("SELECT block_number, block_hash FROM block_headers")
+        hashes.update(cursor.fetchall())
+    return hashes
+
+
+def read_payloads(connection, workers, cache_directory=None, dump=None):
+    """Decode every available block in parallel; returns {height: parsed block}."""
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(None if dump else cache_directory,)) as pool:
+        if dump:
+            with gzip.open(dump, 'rt') as f:
+                results = pool.imap_unordered(_parse_dump_chunk, _chunks(f, REBUILD_CHUNK_SIZE))
+                return {block[0]: block for chunk in results for block in chunk}
+        cursor = connection.cursor()
+        hashes = cached_block_hashes(cursor, RawResponseCache(cache_directory))
+        cursor.execute("SELECT current_block_number FROM block_data")
+        for (block_number,) in cursor.fetchall():
+            hashes.setdefault(block_number, None)
+        cursor.close()
+        connection.rollback()
+        results = pool.imap_unordered(_parse_cached_chunk, _chunks(sorted(hashes.items()), REBUILD_CHUNK_SIZE))
+        return {block[0]: block for chunk in results for block in chunk}
+
+
+def current_anchor(cursor):
+    """(block, supply) of the oldest stored money supply, so rebuilt supplies keep the stored basis."""
+    cursor.execute("""
+        SELECT current_block_number, money_supply FROM emissions
+        WHERE money_supply IS NOT NULL
+        ORDER BY current_block_number LIMIT 1
+    """)
+    return cursor.fetchone()
+
+
+def read_stored(cursor):
+    """
+    {block_number: (previous_block_timestamp, interval, network_hashrate,
+    money_supply, chain_work, block_time)} for every row of block_data, from
+    the current tables.
+    """
+    cursor.execute("""
+        SELECT b.current_block_number, b.previous_block_timestamp, b.block_time_interval_seconds,
+               b.network_hashrate, e.money_supply, h.chain_work, h.block_time
+        FROM block_data b
+        LEFT JOIN emissions e ON e.current_block_number = b.current_block_number
+        LEFT JOIN block_headers h ON h.block_number = b.current_block_number
+        ORDER BY b.current_block_number
+    """)
+    return {row[0]: row[1:] for row in cursor.fetchall()}
+
+
+# Stored row of a height block_data does not have
+_NOT_STORED = (None,) * 6
+
+
+def derive_rows(blocks, block_numbers, anchor=None, stored=None):
+    """
+    Every derived row for block_numbers (ascending), from the parsed blocks.
+
+    stored is read_stored() of the current tables. Stored blocks that are not
+    rebuilt still feed the moving average and hashrate windows, the way the
+    live engines warm from block_data, so the first rebuilt block and the
+    ones after a kept block get full windows. Intervals use the previous
+    height's payload even when that height is not itself rebuilt, the way the
+    ingestor asks the explorer for it, and fall back to the stored
+    previous_block_timestamp when the source does not have it.
+
+    Money supply is walked from anchor over the run of known rewards around
+    it; every other run continues from the stored supply of the block before
+    it. A block whose supply or hashrate cannot be derived keeps its stored one.
+    """
+    stored = stored or {}
+    rebuilt = set(block_numbers)
+    windows = {window: RollingAverage(window) for window in MOVING_AVERAGE_WINDOWS}
+    hashrate_engine = HashrateEngine(window=HASHRATE_WINDOW)
+    block_rows = []
+    window_rows = []
+    for block_number in sorted(rebuilt.union(stored)):
+        if block_number not in rebuilt:
+            _, interval, _, _, work, block_time = stored[block_number]
+            if interval is not None:
+                for average in windows.values():
+                    average.push(int(interval))
+            hashrate_engine.push(block_number, work, block_time)
+            continue
+
+        _, block_time, work, _, _ = blocks[block_number]
+        stored_prev_time, _, stored_hashrate, _, _, _ = stored.get(block_number, _NOT_STORED)
+        previous = blocks.get(block_number - 1)
+        prev_time = previous[1] if previous else stored_prev_time
+        prev_time = int(prev_time) if prev_time is not None else None
+        interval = block_time - prev_time if prev_time is not None and block_time is not None else None
+        if interval is not None:
+            for average in windows.values():
+                average.push(interval)
+        averages = {window: average.average() for window, average in windows.items()}
+        hashrate_engine.push(block_number, work, block_time)
+        hashrate = hashrate_engine.current() if work is not None else None
+        block_rows.append([block_number, block_time, block_number - 1, prev_time, interval,
+                           stored_hashrate if hashrate is None else hashrate]
+                          + [averages[window] for window in MOVING_AVERAGES])
+        window_rows.extend((block_number, window, value) for window, value in averages.items() if value is not None)
+
+    # Money supply over the run of consecutive known rewards next to the anchor;
+    # the anchor block itself need not be rebuilt (e.g. a seeded genesis row)
+    rewards = {block_number: blocks[block_number][3] for block_number in block_numbers}
+    supplies = {}
+    if anchor is not None:
+        anchor_block, anchor_supply = anchor
+        anchor_supply = Decimal(str(anchor_supply)).quantize(SATOSHI)
+        supply = anchor_supply
+        block_number = anchor_block
+        while rewards.get(block_number + 1) is not None:
+            block_number += 1
+            supply = supplies[block_number] = add_reward(supply, rewards[block_number])
+        if rewards.get(anchor_block) is not None:
+            supplies[anchor_block] = supply = anchor_supply
+            block_number = anchor_block
+            while rewards.get(block_number - 1) is not None:
+                supply = add_reward(supply, -rewards[block_number])
+                block_number -= 1
+                supplies[block_number] = supply
+        if not supplies:
+            print(f"No rebuilt block next to anchor block {anchor_block} has a reward; "
+                  f"continuing from the stored supplies")
+
+    # Runs the anchor does not reach start from the stored supply before them
+    for block_number in block_numbers:
+        if block_number in supplies or rewards[block_number] is None:
+            continue
+        previous = supplies.get(block_number - 1)
+        if previous is None:
+            previous = stored.get(block_number - 1, _NOT_STORED)[3]
+        if previous is not None:
+            supplies[block_number] = add_reward(previous, rewards[block_number])
+
+    emissions_rows = [
+        (block_number, blocks[block_number][1],
+         datetime.fromtimestamp(blocks[block_number][1], timezone.utc).replace(tzinfo=None),
+         supplies.get(block_number, stored.get(block_number, _NOT_STORED)[3]), blocks[block_number][3])
+        for block_number in block_numbers if blocks[block_number][3] is not None
+    ]
+    header_rows = [blocks[block_number][4] for block_number in block_numbers if blocks[block_number][4] is not None]
+    return block_rows, window_rows, emissions_rows, header_rows
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+    return str(value)
+
+
+def copy_rows(cursor, table, columns, rows):
+    for offset in range(0, len(rows), COPY_BATCH_SIZE):
+        buffer = io.StringIO()
+        for row in rows[offset:offset + COPY_BATCH_SIZE]:
+            buffer.write('\t'.join(_copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def _rename_indexes(cursor, table, old_prefix, new_prefix):
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s",
+                   (table,))
+    for (index,) in cursor.fetchall():
+        if index.startswith(old_prefix):
+            cursor.execute(f"ALTER INDEX {index} RENAME TO {new_prefix}{index[len(old_prefix):]}")
+
+
+def _columns(cursor, table):
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def swap_tables(connection, keep_old=False):
+    """Swap every <table>_rebuild in for <table> and refresh the rollups, in one transaction."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"LOCK TABLE {', '.join(REBUILT_TABLES)} IN ACCESS EXCLUSIVE MODE")
+        for table, block_column in REBUILT_TABLES.items():
+            # Blocks written since the payloads were read, or missing from the source
+            new_columns = set(_columns(cursor, f"{table}_rebuild"))
+            columns = ', '.join(column for column in _columns(cursor, table) if column in new_columns)
+            cursor.execute(f"""
+                INSERT INTO {table}_rebuild ({columns})
+                SELECT {columns} FROM {table} old
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {table}_rebuild new WHERE new.{block_column} = old.{block_column}
+                )
+            """)
+            if cursor.rowcount:
+                print(f"Kept {cursor.rowcount} rows of {table} that were not rebuilt")
+
+        for table in REBUILT_TABLES:
+            if keep_old:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}_old")
+                cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+                _rename_indexes(cursor, f"{table}_old", table, f"{table}_old")
+            else:
+                cursor.execute(f"DROP TABLE {table}")
+            cursor.execute(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+            _rename_indexes(cursor, table, f"{table}_rebuild", table)
+
+        if table_exists(cursor, 'moving_average_dirty_ranges'):
+            # Every average was just computed from scratch
+            cursor.execute("TRUNCATE moving_average_dirty_ranges")
+        if daily_emissions_exists(cursor):
+            rebuild_daily_emissions(cursor)
+        if chain_summary_exists(cursor):
+            rebuild_chain_summary(cursor)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def rebuild(connection, workers=None, cache_directory=RAW_CACHE_DIR, dump=None, anchor=None, keep_old=False):
+    """Recompute and swap in every derived table. Returns the number of blocks rebuilt."""
+    workers = workers or os.cpu_count() or 1
+    ensure_block_headers(connection)
+    started = time.perf_counter()
+
+    blocks = read_payloads(connection, workers, cache_directory, dump)
+    print(f"Decoded {len(blocks)} block payloads with {workers} workers in {time.perf_counter() - started:.1f}s")
+
+    cursor = connection.cursor()
+    try:
+        stored = read_stored(cursor)
+        block_numbers = [block_number for block_number in stored if block_number in blocks] if stored \
+            else sorted(blocks)
+        if stored and len(block_numbers) < len(stored):
+            print(f"{len(stored) - len(block_numbers)} stored blocks have no payload in the source; "
+                  f"their current rows are kept")
+        if anchor is None:
+            anchor = current_anchor(cursor)
+        connection.rollback()
+
+        phase = time.perf_counter()
+        block_rows, window_rows, emissions_rows, header_rows = derive_rows(blocks, block_numbers, anchor, stored)
+        print(f"Derived {len(block_rows)} blocks in {time.perf_counter() - phase:.1f}s")
+
+        phase = time.perf_counter()
+        for table in REBUILT_TABLES:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}_rebuild")
+            cursor.execute(f"CREATE TABLE {table}_rebuild (LIKE {table} INCLUDING ALL)")
+        copy_rows(cursor, 'block_data_rebuild', BLOCK_DATA_COLUMNS, block_rows)
+        copy_rows(cursor, 'block_moving_averages_rebuild', ['block_number', 'window_size', 'value'], window_rows)
+        copy_rows(cursor, 'emissions_rebuild', EMISSIONS_COLUMNS, emissions_rows)
+        copy_rows(cursor, 'block_headers_rebuild', HEADER_COLUMNS, header_rows)
+        for table in REBUILT_TABLES:
+            cursor.execute(f"ANALYZE {table}_rebuild")
+        connection.commit()
+        print(f"Loaded fresh tables in {time.perf_counter() - phase:.1f}s")
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    swap_tables(connection, keep_old)
+    print(f"Rebuilt {len(block_numbers)} blocks in {time.perf_counter() - started:.1f}s. "
+          f"Running API workers should POST /api/schema/refresh if columns changed.")
+    return len(block_numbers)
+
+
+def export_dump(connection, path, cache_directory=RAW_CACHE_DIR):
+    """Write every cached block (and coinbase) as gzipped JSON lines in height order."""
+    cache = RawResponseCache(cache_directory)
+    cursor = connection.cursor()
+    hashes = cached_block_hashes(cursor, cache)
+    cursor.close()
+    connection.rollback()
+    written = 0
+    with gzip.open(path, 'wt') as f:
+        for block_number, block_hash in sorted(hashes.items()):
+            block_hash = block_hash or cache.get('height', block_number)
+            block_info = cache.get('block', block_hash) if block_hash else None
+            if block_info is None:
+                continue
+            coinbase = cache.get('tx', block_info['tx'][0]) if block_info.get('tx') else None
+            f.write(json.dumps({'block': block_info, 'coinbase': coinbase}, separators=(',', ':')))
+            f.write('\n')
+            written += 1
+    return written
+
+
+if __name__ == "__main__":
+    from requestevery5seconds import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Rebuild the derived tables from raw block payloads")
+    parser.add_argument('--dump', help="read payloads from this dump instead of the raw cache")
+    parser.add_argument('--export', help="write the cached payloads to this dump and exit")
+    parser.add_argument('--cache-dir', default=RAW_CACHE_DIR)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--anchor', help="BLOCK:SUPPLY for money supply (default: the oldest stored supply)")
+    parser.add_argument('--keep-old', action='store_true', help="keep the replaced tables as <table>_old")
+    args = parser.parse_args()
+
+    connection = get_db_connection()
+    try:
+        if args.export:
+            written = export_dump(connection, args.export, args.cache_dir)
+            print(f"Exported {written} blocks to {args.export}")
+        else:
+            rebuild(connection, args.workers, args.cache_dir, args.dump,
+                    parse_anchor(args.anchor) if args.anchor else None, args.keep_old)
+    finally:
+        connection.close()
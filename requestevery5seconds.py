@@ -5,15 +5,49 @@ import psycopg2
 import os
 from urllib3 import response
 
-# Base URLs
-BASE_URL = "https://explorer.fact0rn.io/api/"
-EXT_URL = "https://explorer.fact0rn.io/ext/"
+from block_cache import BlockHeaderCache
+from raw_cache import open_raw_cache
+from block_rewards import RewardResolver
+from explorer_client import explorer
+from moving_averages import (
+    MovingAverageEngine,
+    format_moving_averages,
+    recompute_moving_averages,
+    start_reconciler
+)
+from block_writer import BlockWriter
+from chain_summary import ensure_chain_summary, update_market_summary
+from daily_emissions import ensure_daily_emissions
+from money_supply import MoneySupplyEngine, start_supply_reconciler
+from hashrate import HASHRATE_WINDOW, HashrateEngine
+from block_headers import backfill_block_headers, chain_work, ensure_block_headers, header_row, latest_difficulty
 
 # Get database configuration from environment variable (for Heroku)
 DATABASE_URL = os.environ.get('DATABASE_URL')
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# In-memory MA-100/MA-672 windows for the live ingestor, warmed from block_data at startup
+moving_average_engine = MovingAverageEngine()
+
+# Running money supply (previous block's supply plus each block reward)
+money_supply_engine = MoneySupplyEngine()
+
+# Network hashrate estimated from the chain work of recent blocks
+hashrate_engine = HashrateEngine()
+
+# Gaps of at least this many blocks are caught up through the ingest pipeline
+PIPELINE_MIN_BLOCKS = int(os.environ.get('PIPELINE_MIN_BLOCKS', 10))
+
+# Persistent connection and prepared statements for per-block writes
+block_writer = BlockWriter(lambda: get_db_connection())
+
+# Recently seen block headers, so each header is fetched from the explorer once
+block_header_cache = BlockHeaderCache(int(os.environ.get('BLOCK_HEADER_CACHE_SIZE', 2048)))
+
+# getblock/getrawtransaction payloads kept on disk across runs (None when RAW_CACHE_DIR is empty)
+raw_cache = open_raw_cache()
+
 # Database connection function
 def get_db_connection():
     try:
@@ -38,9 +72,8 @@ def get_db_connection():
 def fetch_api_data(endpoint, is_ext=False):
     """Fetch data from Fact0rn API or extension endpoints."""
     try:
-        url = (EXT_URL if is_ext else BASE_URL) + endpoint
-        response = requests.get(url)
-        response.raise_for_status()
+        # Shared keep-alive session with timeouts and retries
+        response = explorer.get(endpoint, is_ext=is_ext)
         
         # For text responses (like block hash, money supply, price)
         if any(x in endpoint for x in ["getblockhash", "getmoneysupply", "getcurrentprice", "getdifficulty"]):
@@ -55,121 +88,31 @@ def fetch_api_data(endpoint, is_ext=False):
 def format_unix_time(unix_time):
     return datetime.fromtimestamp(unix_time, timezone.utc)
 
-def save_to_database(block_index, block_hash, unix_timestamp, formatted_time, time_difference):
+def save_to_database(block_index, block_hash, unix_timestamp, formatted_time, time_difference,
+                     block_reward=None, money_supply=None, chain_work=None, header=None):
+    """Write the block, its moving averages and its emissions row in one transaction."""
     try:
-        # Connect to database
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        # Get current hashrate
-        current_hashrate = fetch_current_hashrate()
-        
-        # Insert block data into the database
-        cursor.execute("""
-            INSERT INTO block_data (
-                current_block_number, 
-                current_block_timestamp, 
-                previous_block_number,
-                previous_block_timestamp,
-                block_time_interval_seconds,
-                network_hashrate
-            )
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (current_block_number) DO UPDATE SET
-                current_block_timestamp = EXCLUDED.current_block_timestamp,
-                previous_block_number = EXCLUDED.previous_block_number,
-                previous_block_timestamp = EXCLUDED.previous_block_timestamp,
-                block_time_interval_seconds = EXCLUDED.block_time_interval_seconds,
-                network_hashrate = EXCLUDED.network_hashrate;
-        """, (
-            block_index, 
-            unix_timestamp, 
+        averages = block_writer.write(
+            moving_average_engine,
+            block_index,
+            unix_timestamp,
             block_index - 1,
             unix_timestamp - time_difference,
-            time_difference,
-            current_hashrate
-        ))
-        
-        connection.commit()
-        
-        # Update moving averages
-        update_moving_averages(connection, cursor, block_index)
-        
-        cursor.close()
-        connection.close()
+            None,
+            formatted_time=formatted_time,
+            money_supply=money_supply,
+            block_reward=block_reward,
+            money_supply_engine=money_supply_engine,
+            hashrate_engine=hashrate_engine,
+            chain_work=chain_work,
+            header=header
+        )
+        print(format_moving_averages(block_index, averages))
         return True
     except Exception as e:
         print(f"Error saving to database: {e}")
         return False
 
-def update_moving_averages(connection, cursor, block_number):
-    """Update moving averages for the given block number."""
-    try:
-        # Calculate 100-block moving average
-        cursor.execute("""
-            SELECT AVG(block_time_interval_seconds)
-            FROM (
-                SELECT block_time_interval_seconds
-                FROM block_data
-                WHERE current_block_number <= %s AND block_time_interval_seconds IS NOT NULL
-                ORDER BY current_block_number DESC
-                LIMIT 100
-            ) AS recent_blocks
-        """, (block_number,))
-        
-        result = cursor.fetchone()
-        avg_100 = result[0] if result and result[0] is not None else None
-        
-        # Calculate 672-block moving average
-        cursor.execute("""
-            SELECT AVG(block_time_interval_seconds)
-            FROM (
-                SELECT block_time_interval_seconds
-                FROM block_data
-                WHERE current_block_number <= %s AND block_time_interval_seconds IS NOT NULL
-                ORDER BY current_block_number DESC
-                LIMIT 672
-            ) AS recent_blocks
-        """, (block_number,))
-        
-        result = cursor.fetchone()
-        avg_672 = result[0] if result and result[0] is not None else None
-        
-        # Only update if we have valid averages
-        if avg_100 is not None or avg_672 is not None:
-            # Build the update query dynamically based on which averages we have
-            update_parts = []
-            params = []
-            
-            if avg_100 is not None:
-                update_parts.append("moving_avg_100 = CAST(%s AS NUMERIC(20,8))")
-                params.append(avg_100)
-            
-            if avg_672 is not None:
-                update_parts.append("moving_avg_672 = CAST(%s AS NUMERIC(20,8))")
-                params.append(avg_672)
-            
-            if update_parts:
-                query = f"""
-                    UPDATE block_data
-                    SET {", ".join(update_parts)}
-                    WHERE current_block_number = %s
-                """
-                params.append(block_number)
-                
-                cursor.execute(query, params)
-                connection.commit()
-                
-                # Log the update
-                avg_100_str = f"{avg_100:.2f}" if avg_100 is not None else "N/A"
-                avg_672_str = f"{avg_672:.2f}" if avg_672 is not None else "N/A"
-                print(f"Updated moving averages for block {block_number}: 100-block avg = {avg_100_str}, 672-block avg = {avg_672_str}")
-        else:
-            print(f"Not enough blocks to calculate moving averages for block {block_number}")
-    except Exception as e:
-        print(f"Error updating moving averages for block {block_number}: {e}")
-        connection.rollback()
-
 def check_and_fix_missing_averages(limit=100):
     """Check for blocks with missing moving averages and fix them."""
     try:
@@ -177,28 +120,29 @@ def check_and_fix_missing_averages(limit=100):
         connection = get_db_connection()
         cursor = connection.cursor()
         
-        # Find blocks with missing moving averages
+        # Find the range covering the first `limit` blocks with missing moving averages
         cursor.execute("""
-            SELECT current_block_number 
-            FROM block_data 
-            WHERE moving_avg_100 IS NULL OR moving_avg_672 IS NULL
-            ORDER BY current_block_number
-            LIMIT %s
+            SELECT MIN(current_block_number), MAX(current_block_number), COUNT(*)
+            FROM (
+                SELECT current_block_number 
+                FROM block_data 
+                WHERE moving_avg_100 IS NULL OR moving_avg_672 IS NULL
+                ORDER BY current_block_number
+                LIMIT %s
+            ) AS missing_blocks
         """, (limit,))
         
-        missing_blocks = [row[0] for row in cursor.fetchall()]
+        first_missing, last_missing, missing_count = cursor.fetchone()
+        cursor.close()
         
-        if missing_blocks:
-            print(f"Found {len(missing_blocks)} blocks with missing moving averages")
+        if missing_count:
+            print(f"Found {missing_count} blocks with missing moving averages")
             
-            # Process each block
-            for block_number in missing_blocks:
-                print(f"Fixing moving averages for block {block_number}...")
-                update_moving_averages(connection, cursor, block_number)
+            # Recompute the whole range in one set-based pass
+            recompute_moving_averages(connection, first_missing, last_missing, only_missing=True)
         else:
             print("No blocks with missing moving averages found")
         
-        cursor.close()
         connection.close()
         return True
     except Exception as e:
@@ -206,11 +150,9 @@ def check_and_fix_missing_averages(limit=100):
         return False
 
 def fetch_current_hashrate():
-    """Fetch the current network hashrate from the Fact0rn API."""
+    """Fetch the explorer's current network hashrate (getnetworkhashps)."""
     try:
-        response = requests.get(BASE_URL + "getnetworkhashps")
-        response.raise_for_status()
-        hashrate = response.json()
+        hashrate = explorer.get_json("getnetworkhashps")
         return hashrate
     except requests.RequestException as e:
         print(f"Error fetching hashrate: {e}")
@@ -219,17 +161,6 @@ def fetch_current_hashrate():
         print(f"Error parsing hashrate response: {e}")
         return None
 
-def get_money_supply():
-    """Get the current total money supply."""
-    try:
-        money_supply = fetch_api_data("getmoneysupply", is_ext=True)
-        if money_supply:
-            return float(money_supply)
-        return None
-    except Exception as e:
-        print(f"Error getting money supply: {e}")
-        return None
-
 def get_current_price():
     """Get the current price of FACT0rn."""
     try:
@@ -272,64 +203,24 @@ def get_difficulty():
 def get_transaction_details(tx_hash):
     """Get transaction details using the transaction hash."""
     try:
+        if raw_cache is not None:
+            tx_details = raw_cache.get('tx', tx_hash)
+            if tx_details is not None:
+                return tx_details
         tx_details = fetch_api_data(f"getrawtransaction?txid={tx_hash}&decrypt=1")
+        if tx_details and raw_cache is not None:
+            raw_cache.put('tx', tx_hash, tx_details)
         return tx_details
     except Exception as e:
         print(f"Error getting transaction details: {e}")
         return None
 
-def get_block_reward(block_info):
-    """Extract the block reward from the coinbase transaction."""
-    if not block_info or 'tx' not in block_info or not block_info['tx']:
-        return None
-    
-    # Get the first transaction in the block (coinbase transaction)
-    tx_hash = block_info['tx'][0]
-    
-    tx_details = get_transaction_details(tx_hash)
-    if not tx_details or 'vout' not in tx_details or not tx_details['vout']:
-        return None
-    
-    # The block reward is in the first output of the coinbase transaction
-    return tx_details['vout'][0]['value']
-
-def save_emissions_data(block_number, unix_timestamp, formatted_time, block_reward=None):
-    """Save emissions data to the database."""
-    try:
-        # Get money supply
-        money_supply = get_money_supply()
-        if money_supply is None:
-            print("Failed to get money supply. Skipping emissions data.")
-            return False
+# Coinbase rewards from the subsidy schedule, fetching the transaction only when fees are possible
+reward_resolver = RewardResolver(get_transaction_details)
 
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
-        # Check if we already have emissions data for this block
-        cursor.execute("SELECT 1 FROM emissions WHERE current_block_number = %s", (block_number,))
-        if cursor.fetchone():
-            print(f"Emissions data for block {block_number} already exists.")
-            cursor.close()
-            connection.close()
-            return False
-        
-        # Insert emissions data
-        cursor.execute("""
-            INSERT INTO emissions (current_block_number, unix_timestamp, date_time, money_supply, block_reward)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (current_block_number) DO NOTHING;
-        """, (block_number, unix_timestamp, formatted_time, money_supply, block_reward))
-        
-        connection.commit()
-        print(f"Emissions data for block {block_number} saved to database.")
-        return True
-    except Exception as e:
-        print(f"Error saving emissions data: {e}")
-        return False
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+def get_block_reward(block_info):
+    """Get the block reward (the coinbase transaction's first output)."""
+    return reward_resolver.resolve(block_info)
 
 def save_market_data():
     """Save market data (price and difficulty) to the database."""
@@ -339,15 +230,21 @@ def save_market_data():
         current_time = datetime.now(timezone.utc)
         unix_timestamp = int(current_time.timestamp())
         price = get_current_price()
-        difficulty = get_difficulty()
-        
-        if price is None or difficulty is None:
-            print("Failed to get price or difficulty. Skipping market data.")
+        if price is None:
+            print("Failed to get price. Skipping market data.")
             return False
         
         connection = get_db_connection()
         cursor = connection.cursor()
         
+        # Difficulty of the newest stored block; the explorer only before any header is stored
+        difficulty = latest_difficulty(cursor)
+        if difficulty is None:
+            difficulty = get_difficulty()
+        if difficulty is None:
+            print("Failed to get difficulty. Skipping market data.")
+            return False
+        
         # Check the last entry's timestamp to avoid too frequent updates
         cursor.execute("SELECT MAX(unix_timestamp) FROM market_data")
         last_timestamp = cursor.fetchone()[0]
@@ -364,6 +261,7 @@ def save_market_data():
             INSERT INTO market_data (unix_timestamp, date_time, price, difficulty)
             VALUES (%s, %s, %s, %s)
         """, (unix_timestamp, current_time, price, difficulty))
+        update_market_summary(cursor, unix_timestamp, current_time, price, difficulty)
         
         connection.commit()
         print(f"Market data saved to database at {current_time}")
@@ -390,12 +288,43 @@ def ensure_blocks_table_exists():
                 previous_block_number INTEGER,
                 previous_block_timestamp NUMERIC,
                 block_time_interval_seconds NUMERIC,
+                moving_avg_100 NUMERIC(20,8),
+                moving_avg_672 NUMERIC(20,8),
                 network_hashrate NUMERIC
             );
         """)
         
+        # Moving averages for every configured window, one row per block and window
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS block_moving_averages (
+                block_number INTEGER NOT NULL,
+                window_size INTEGER NOT NULL,
+                value NUMERIC(20,8),
+                PRIMARY KEY (block_number, window_size)
+            );
+        """)
+        
+        # Block ranges whose moving averages need recomputing after out-of-order writes
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS moving_average_dirty_ranges (
+                id SERIAL PRIMARY KEY,
+                start_block INTEGER NOT NULL,
+                end_block INTEGER NOT NULL,
+                created_at timestamp DEFAULT now()
+            );
+        """)
+        
         connection.commit()
         print("Blocks table created or already exists.")
+        
+        # Latest-state row behind /api/stats, kept current by every block write
+        ensure_chain_summary(connection)
+        
+        # Per-day emissions rollup behind /api/emissions/daily
+        ensure_daily_emissions(connection)
+        
+        # Header fields (difficulty, size, nonce, nP1, ...) of every stored block
+        ensure_block_headers(connection)
     except psycopg2.Error as e:
         print(f"Database error creating blocks table: {e}")
     finally:
@@ -404,20 +333,81 @@ def ensure_blocks_table_exists():
             connection.close()
 
 def get_block_details(block_index):
-    """Fetch hash and time for a given block index."""
-    block_hash = fetch_api_data(f"getblockhash?index={block_index}")
+    """
+    Fetch hash and time for a given block index. Buried heights and known
+    hashes are answered from the on-disk raw cache without explorer calls.
+    """
+    cached = block_header_cache.get(block_index)
+    if cached is not None:
+        return cached
+    
+    block_hash = raw_cache.get('height', block_index) if raw_cache is not None else None
+    hash_from_cache = block_hash is not None
+    if block_hash is None:
+        block_hash = fetch_api_data(f"getblockhash?index={block_index}")
     if block_hash is None:
         print(f"Failed to get block hash for index {block_index}.")
         return None, None, None
     
-    block_info = fetch_api_data(f"getblock?hash={block_hash}")
+    block_info = raw_cache.get('block', block_hash) if raw_cache is not None else None
     if block_info is None:
-        print(f"Failed to get block info for index {block_index}.")
-        return None, None, None
+        block_info = fetch_api_data(f"getblock?hash={block_hash}")
+        if block_info is None:
+            print(f"Failed to get block info for index {block_index}.")
+            return None, None, None
+        if raw_cache is not None:
+            raw_cache.put('block', block_hash, block_info)
+            if block_info.get('confirmations'):
+                raw_cache.note_tip(block_index + block_info['confirmations'] - 1)
+    
+    # The height can only be trusted to keep this hash once the block is buried
+    if raw_cache is not None and not hash_from_cache and raw_cache.is_buried(block_index):
+        raw_cache.put('height', block_index, block_hash)
     
     block_time = block_info.get("time")
+    block_header_cache.put(block_index, block_hash, block_time, block_info)
     return block_hash, block_time, block_info
 
+def get_block_time(block_index, cursor=None):
+    """
+    Get the timestamp of a block, trying the header cache first, then
+    block_data, and only then the explorer.
+    """
+    block_time = block_header_cache.get_time(block_index)
+    if block_time is not None:
+        return block_time
+    
+    connection = None
+    savepoint = cursor is not None
+    try:
+        if savepoint:
+            # A failed read must not abort the caller's transaction
+            cursor.execute("SAVEPOINT get_block_time")
+        else:
+            connection = get_db_connection()
+            cursor = connection.cursor()
+        cursor.execute(
+            "SELECT current_block_timestamp FROM block_data WHERE current_block_number = %s",
+            (block_index,)
+        )
+        result = cursor.fetchone()
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT get_block_time")
+        if result and result[0] is not None:
+            block_time = int(result[0])
+            block_header_cache.put(block_index, None, block_time)
+            return block_time
+    except Exception as e:
+        if savepoint:
+            cursor.execute("ROLLBACK TO SAVEPOINT get_block_time")
+        print(f"Error reading timestamp of block {block_index} from database: {e}")
+    finally:
+        if connection:
+            connection.close()
+    
+    _, block_time, _ = get_block_details(block_index)
+    return block_time
+
 def process_block(block_number):
     """Process a single block by fetching details and saving to database."""
     # Get block details
@@ -425,8 +415,8 @@ def process_block(block_number):
     if unix_timestamp is None:
         raise Exception(f"Failed to get details for block {block_number}")
         
-    # Get previous block for time difference calculation
-    prev_block_hash, prev_unix_timestamp, _ = get_block_details(block_number - 1)
+    # Get previous block time for the time difference (usually cached from the last iteration)
+    prev_unix_timestamp = get_block_time(block_number - 1)
     if prev_unix_timestamp is None:
         raise Exception(f"Failed to get details for previous block {block_number - 1}")
     
@@ -434,17 +424,13 @@ def process_block(block_number):
     time_difference = unix_timestamp - prev_unix_timestamp
     formatted_time = format_unix_time(unix_timestamp)
     
-    # Save to database
-    success = save_to_database(block_number, block_hash, unix_timestamp, formatted_time, time_difference)
+    # Get block reward from coinbase transaction
+    block_reward = get_block_reward(block_info)
     
-    if success:
-        # Get block reward from coinbase transaction
-        block_reward = get_block_reward(block_info)
-        
-        # Save emissions data
-        save_emissions_data(block_number, unix_timestamp, formatted_time, block_reward)
-    
-    return success
+    # Save block data and emissions data together
+    return save_to_database(block_number, block_hash, unix_timestamp, formatted_time, time_difference,
+                            block_reward=block_reward, chain_work=chain_work(block_info),
+                            header=header_row(block_number, block_info))
 
 def setup_database():
     ensure_blocks_table_exists()
@@ -471,18 +457,42 @@ if __name__ == "__main__":
         if result and result[0]:
             last_processed_block = result[0]
             print(f"Last processed block: {last_processed_block}")
+            
+            # The hashrate window is warmed from block_headers only, so fetch the
+            # headers it is missing now rather than while writing a block
+            backfill_block_headers(connection, get_block_details,
+                                   last_processed_block - HASHRATE_WINDOW, last_processed_block)
+            
+            # Warm the moving average windows and money supply once so each new block is O(1)
+            moving_average_engine.warm(cursor, last_processed_block)
+            money_supply_engine.warm(cursor, last_processed_block)
+            hashrate_engine.warm(cursor, last_processed_block)
         
         cursor.close()
         connection.close()
     except Exception as e:
         print(f"Error getting last processed block: {e}")
     
+    # Fetch, transform and write stages used when many blocks are behind
+    from ingest_pipeline import IngestPipeline
+    pipeline = IngestPipeline(get_db_connection)
+    
+    # Recompute moving averages behind out-of-order writes in the background
+    start_reconciler(get_db_connection, interval=int(os.environ.get('MA_RECONCILE_INTERVAL', 60)))
+    
+    # Anchor the derived money supply now if none is stored (retried until the tip is stored),
+    # then compare it with the explorer's every MONEY_SUPPLY_CHECK_INTERVAL seconds
+    def reset_money_supply():
+        money_supply_engine.last_block = None
+    start_supply_reconciler(get_db_connection, on_anchor=reset_money_supply)
+    
     # Main loop to check for new blocks every 5 seconds
     while True:
         try:
             # Get the latest block count
-            response = requests.get('https://explorer.fact0rn.io/api/getblockcount')
-            current_block_count = int(response.text.strip())
+            current_block_count = int(explorer.get_text("getblockcount"))
+            if raw_cache is not None:
+                raw_cache.note_tip(current_block_count)
             
             # If this is our first run or we haven't processed a block yet
             if last_processed_block is None:
@@ -491,7 +501,18 @@ if __name__ == "__main__":
             if current_block_count > last_processed_block:
                 print(f"New block(s) detected! Current block: {current_block_count}, Last processed: {last_processed_block}")
                 
-                # Process all missing blocks
+                # After downtime, catch up through the pipelined fetch/transform/write stages
+                if current_block_count - last_processed_block >= PIPELINE_MIN_BLOCKS:
+                    try:
+                        pipeline.run(last_processed_block + 1, current_block_count)
+                        consecutive_failures = 0
+                    except Exception as e:
+                        print(f"Error catching up to block {current_block_count}: {e}")
+                        consecutive_failures += 1
+                    if pipeline.last_block is not None:
+                        last_processed_block = pipeline.last_block
+                
+                # Process the remaining new blocks one at a time
                 for block_number in range(last_processed_block + 1, current_block_count + 1):
                     try:
                         print(f"Processing block {block_number}...")
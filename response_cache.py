@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of rendered API responses.
+
+    Entries are stored under (key, version), where version identifies the
+    data the response was built from (the chain tip and latest market row).
+    A new block or market sample changes the version, so stale entries are
+    never served and simply age out of the LRU. ttl bounds how long an entry
+    lives regardless, for writes that do not move the tip (repaired moving
+    averages, backfilled holes, date-relative queries).
+    """
+
+    def __init__(self, max_size=256, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get((key, version))
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((key, version))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[(key, version)] = (time.monotonic(), value)
+            self._entries.move_to_end((key, version))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None
+            }
+
+    def __len__(self):
+        return len(self._entries)
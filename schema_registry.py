@@ -0,0 +1,124 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tables whose columns the API builds its SELECT lists from
+REGISTERED_TABLES = ('block_data', 'emissions', 'market_data', 'chain_summary', 'daily_emissions')
+
+# Fingerprint of the registered tables' columns. Every process computes the
+# same value from the shared catalog, so a migration is noticed by all of them.
+FINGERPRINT_QUERY = """
+    SELECT md5(COALESCE(string_agg(c.relname || '.' || a.attname, ',' ORDER BY c.relname, a.attnum), ''))
+    FROM pg_class c
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    WHERE c.relnamespace = current_schema()::regnamespace AND c.relname = ANY(%s)
+"""
+
+# Optional tables seen to exist in this process; missing ones are looked up again
+_existing_tables = set()
+
+
+def table_exists(cursor, name):
+    """
+    Whether an optional table (created by setup_database.py) exists. Writers
+    skip it until it does; once seen it is not looked up again.
+    """
+    if name not in _existing_tables:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+        if cursor.fetchone()[0]:
+            _existing_tables.add(name)
+    return name in _existing_tables
+
+
+class SchemaRegistry:
+    """
+    Cached view of which columns exist on the tables the API reads.
+
+    The catalog is introspected once and then served from memory until the TTL
+    expires or invalidate() is called, so routes no longer query
+    information_schema on every request. At most every check_interval
+    seconds a catalog fingerprint is compared with the loaded one, so a
+    migration (or a refresh in another process) is picked up by every
+    process within check_interval rather than ttl.
+    """
+
+    def __init__(self, get_connection, tables=REGISTERED_TABLES, ttl=300.0, check_interval=5.0):
+        self._get_connection = get_connection
+        self.tables = tuple(tables)
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._columns = None
+        self._fingerprint = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def _read_fingerprint(self, cursor):
+        cursor.execute(FINGERPRINT_QUERY, (list(self.tables),))
+        return cursor.fetchone()[0]
+
+    def _load(self):
+        connection = self._get_connection()
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT table_name, column_name
+            FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ANY(%s)
+            ORDER BY table_name, ordinal_position
+        """, (list(self.tables),))
+        columns = {}
+        for table_name, column_name in cursor.fetchall():
+            columns.setdefault(table_name, []).append(column_name)
+        self._fingerprint = self._read_fingerprint(cursor)
+        cursor.close()
+        logger.info(f"Loaded schema for tables: {', '.join(sorted(columns)) or 'none'}")
+        return columns
+
+    def _current(self):
+        with self._lock:
+            now = time.monotonic()
+            stale = self._columns is None or now - self._loaded_at >= self.ttl
+            if not stale and now - self._checked_at >= self.check_interval:
+                cursor = self._get_connection().cursor()
+                try:
+                    stale = self._read_fingerprint(cursor) != self._fingerprint
+                finally:
+                    cursor.close()
+                self._checked_at = now
+            if stale:
+                self._columns = self._load()
+                self._loaded_at = self._checked_at = time.monotonic()
+            return self._columns
+
+    def refresh(self):
+        """Re-introspect the catalog immediately."""
+        with self._lock:
+            self._columns = self._load()
+            self._loaded_at = self._checked_at = time.monotonic()
+            return self._columns
+
+    def version(self):
+        """Fingerprint of the schema currently served; changes whenever it is reloaded with different columns."""
+        self._current()
+        return self._fingerprint
+
+    def invalidate(self):
+        """Drop the cached schema so the next lookup re-introspects it."""
+        with self._lock:
+            self._columns = None
+
+    def has_table(self, table):
+        return table in self._current()
+
+    def has_column(self, table, column):
+        return column in self._current().get(table, ())
+
+    def columns(self, table):
+        return list(self._current().get(table, ()))
+
+    def select_columns(self, table, required, optional=()):
+        """Return the required columns plus whichever optional ones exist on the table."""
+        existing = self._current().get(table, ())
+        return list(required) + [column for column in optional if column in existing]
@@ -1,6 +1,10 @@
 import psycopg2
 import os
 
+from chain_summary import ensure_chain_summary
+from daily_emissions import ensure_daily_emissions
+from block_headers import ensure_block_headers
+
 try:
     # Get database URL and fix postgres:// if needed (Heroku format)
     DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -50,6 +54,40 @@ try:
     );
     ''')
     
+    # Create side table holding a moving average per block and configured window
+    print("Creating block_moving_averages table if it doesn't exist...")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS block_moving_averages (
+        block_number INTEGER NOT NULL,
+        window_size INTEGER NOT NULL,
+        value NUMERIC(20,8),
+        PRIMARY KEY (block_number, window_size)
+    );
+    ''')
+    
+    # Create table of block ranges whose moving averages went stale after out-of-order writes
+    print("Creating moving_average_dirty_ranges table if it doesn't exist...")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS moving_average_dirty_ranges (
+        id SERIAL PRIMARY KEY,
+        start_block INTEGER NOT NULL,
+        end_block INTEGER NOT NULL,
+        created_at timestamp DEFAULT now()
+    );
+    ''')
+    
+    # Create the single-row summary behind /api/stats and fill it
+    print("Creating chain_summary table if it doesn't exist...")
+    ensure_chain_summary(conn)
+    
+    # Create the per-day emissions rollup and backfill it from emissions
+    print("Creating daily_emissions table if it doesn't exist...")
+    ensure_daily_emissions(conn)
+    
+    # Create the table of block header fields (difficulty, size, nonce, nP1, ...)
+    print("Creating block_headers table if it doesn't exist...")
+    ensure_block_headers(conn)
+    
     # Check if moving_avg columns have the right type and update if needed
     print("Checking if moving_avg columns have the correct precision...")
     
@@ -127,43 +165,25 @@ try:
     try:
         cursor.execute("""
             CREATE OR REPLACE FUNCTION recalculate_missing_averages() RETURNS void AS $$
-            DECLARE
-                block_record RECORD;
             BEGIN
-                FOR block_record IN 
-                    SELECT current_block_number 
-                    FROM block_data 
-                    WHERE moving_avg_100 IS NULL OR moving_avg_672 IS NULL
-                    ORDER BY current_block_number
-                LOOP
-                    -- Calculate 100-block moving average
-                    UPDATE block_data b
-                    SET moving_avg_100 = (
-                        SELECT AVG(block_time_interval_seconds)
-                        FROM (
-                            SELECT block_time_interval_seconds
-                            FROM block_data
-                            WHERE current_block_number <= block_record.current_block_number
-                            ORDER BY current_block_number DESC
-                            LIMIT 100
-                        ) AS recent_blocks
-                    )
-                    WHERE b.current_block_number = block_record.current_block_number;
-                    
-                    -- Calculate 672-block moving average
-                    UPDATE block_data b
-                    SET moving_avg_672 = (
-                        SELECT AVG(block_time_interval_seconds)
-                        FROM (
-                            SELECT block_time_interval_seconds
-                            FROM block_data
-                            WHERE current_block_number <= block_record.current_block_number
-                            ORDER BY current_block_number DESC
-                            LIMIT 672
-                        ) AS recent_blocks
-                    )
-                    WHERE b.current_block_number = block_record.current_block_number;
-                END LOOP;
+                -- One set-based pass: window averages over the interval-bearing
+                -- rows, written only to blocks missing either average
+                UPDATE block_data b
+                SET moving_avg_100 = CAST(w.avg_100 AS NUMERIC(20,8)),
+                    moving_avg_672 = CAST(w.avg_672 AS NUMERIC(20,8))
+                FROM (
+                    SELECT current_block_number,
+                           AVG(block_time_interval_seconds) OVER (
+                               ORDER BY current_block_number ROWS BETWEEN 99 PRECEDING AND CURRENT ROW
+                           ) AS avg_100,
+                           AVG(block_time_interval_seconds) OVER (
+                               ORDER BY current_block_number ROWS BETWEEN 671 PRECEDING AND CURRENT ROW
+                           ) AS avg_672
+                    FROM block_data
+                    WHERE block_time_interval_seconds IS NOT NULL
+                ) AS w
+                WHERE b.current_block_number = w.current_block_number
+                  AND (b.moving_avg_100 IS NULL OR b.moving_avg_672 IS NULL);
             END;
             $$ LANGUAGE plpgsql;
         """)
@@ -178,6 +198,7 @@ try:
             print(f"Found {missing_count} blocks with missing moving averages")
             # Don't automatically run this as it could take a while - just inform the user
             print("To recalculate missing averages, run: SELECT recalculate_missing_averages();")
+            print("or, in batches from Python: moving_averages.recompute_moving_averages(connection, only_missing=True)")
     except Exception as e:
         conn.rollback()
         print(f"Error creating function to recalculate moving averages: {e}")
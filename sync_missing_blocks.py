@@ -4,97 +4,90 @@ from datetime import datetime, timezone
 import psycopg2
 import os
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Import functions from requestevery5seconds.py
 from requestevery5seconds import (
     get_db_connection,
     fetch_api_data,
     get_block_details,
+    get_block_time,
     format_unix_time,
-    fetch_current_hashrate,
-    get_block_reward,
-    save_emissions_data
+    get_block_reward
+)
+from block_writer import BlockBatchWriter
+from money_supply import MoneySupplyEngine
+from hashrate import HashrateEngine
+from block_headers import chain_work, header_row
+from moving_averages import (
+    MovingAverageEngine,
+    format_moving_averages,
+    reconcile_dirty_ranges
 )
 
-# Define moving averages periods
-MOVING_AVERAGES = [100, 672]  # Only using MA-100 and MA-672
+# Default number of heights fetched from the explorer at once
+DEFAULT_CONCURRENCY = int(os.environ.get('SYNC_CONCURRENCY', 8))
 
-# Custom update_moving_averages function that uses the correct column names
-def update_moving_averages(connection, cursor, block_number):
-    """Update moving averages for the given block number."""
-    try:
-        # Calculate 100-block moving average
-        cursor.execute("""
-            SELECT AVG(block_time_interval_seconds)
-            FROM (
-                SELECT block_time_interval_seconds
-                FROM block_data
-                WHERE current_block_number <= %s AND block_time_interval_seconds IS NOT NULL
-                ORDER BY current_block_number DESC
-                LIMIT 100
-            ) AS recent_blocks
-        """, (block_number,))
-        
-        result = cursor.fetchone()
-        avg_100 = result[0] if result and result[0] is not None else None
-        
-        # Calculate 672-block moving average
-        cursor.execute("""
-            SELECT AVG(block_time_interval_seconds)
-            FROM (
-                SELECT block_time_interval_seconds
-                FROM block_data
-                WHERE current_block_number <= %s AND block_time_interval_seconds IS NOT NULL
-                ORDER BY current_block_number DESC
-                LIMIT 672
-            ) AS recent_blocks
-        """, (block_number,))
-        
-        result = cursor.fetchone()
-        avg_672 = result[0] if result and result[0] is not None else None
-        
-        # Only update if we have valid averages
-        if avg_100 is not None or avg_672 is not None:
-            # Build the update query dynamically based on which averages we have
-            update_parts = []
-            params = []
-            
-            if avg_100 is not None:
-                update_parts.append("moving_avg_100 = CAST(%s AS NUMERIC(20,8))")
-                params.append(avg_100)
-            
-            if avg_672 is not None:
-                update_parts.append("moving_avg_672 = CAST(%s AS NUMERIC(20,8))")
-                params.append(avg_672)
-            
-            if update_parts:
-                query = f"""
-                    UPDATE block_data
-                    SET {", ".join(update_parts)}
-                    WHERE current_block_number = %s
-                """
-                params.append(block_number)
-                
-                cursor.execute(query, params)
-                connection.commit()
-                
-                # Log the update
-                avg_100_str = f"{avg_100:.2f}" if avg_100 is not None else "N/A"
-                avg_672_str = f"{avg_672:.2f}" if avg_672 is not None else "N/A"
-                print(f"Updated moving averages for block {block_number}: 100-block avg = {avg_100_str}, 672-block avg = {avg_672_str}")
-        else:
-            print(f"Not enough blocks to calculate moving averages for block {block_number}")
-    except Exception as e:
-        print(f"Error updating moving averages for block {block_number}: {e}")
-        connection.rollback()
+# Default number of blocks written per transaction
+DEFAULT_BATCH_SIZE = int(os.environ.get('SYNC_BATCH_SIZE', 500))
+
+def fetch_block(block_index):
+    """
+    Fetch everything needed to write a block from the explorer.
+    Safe to run from several threads at once; returns None on failure.
+    """
+    block_hash, block_time, block_info = get_block_details(block_index)
+    if block_time is None:
+        print(f"Failed to fetch details for block {block_index}. Skipping...")
+        return None
+    
+    return {
+        'block_index': block_index,
+        'block_hash': block_hash,
+        'block_time': block_time,
+        # Get block reward from coinbase transaction
+        'block_reward': get_block_reward(block_info),
+        'chain_work': chain_work(block_info),
+        'header': header_row(block_index, block_info)
+    }
 
-def sync_missing_blocks(start_block, end_block):
+def fetch_blocks_in_order(block_indexes, concurrency):
+    """
+    Fetch blocks on a thread pool, yielding results in block order.
+    At most concurrency * 2 fetches are queued ahead of the consumer. A
+    fetch that raises yields None, like any other failed fetch.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="block-fetch") as executor:
+        pending = deque()
+        block_iter = iter(block_indexes)
+        for block_index in block_iter:
+            pending.append((block_index, executor.submit(fetch_block, block_index)))
+            if len(pending) >= concurrency * 2:
+                break
+        while pending:
+            block_index, future = pending.popleft()
+            try:
+                fetched = future.result()
+            except Exception as e:
+                print(f"Error fetching block {block_index}: {e}")
+                fetched = None
+            yield fetched
+            next_block = next(block_iter, None)
+            if next_block is not None:
+                pending.append((next_block, executor.submit(fetch_block, next_block)))
+
+def sync_missing_blocks(start_block, end_block, concurrency=DEFAULT_CONCURRENCY, batch_size=DEFAULT_BATCH_SIZE):
     """
     Sync missing blocks from start_block to end_block (inclusive).
+    Up to `concurrency` heights are fetched in parallel; a single writer
+    stores them in block order so intervals and moving averages stay correct,
+    committing once per batch_size blocks.
     """
-    print(f"Starting sync of blocks from {start_block} to {end_block}...")
+    print(f"Starting sync of blocks from {start_block} to {end_block} with concurrency {concurrency}...")
     
     # Connect to the database
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -113,19 +106,33 @@ def sync_missing_blocks(start_block, end_block):
             
         print(f"Found {len(blocks_to_sync)} blocks to sync: {blocks_to_sync}")
         
-        # Sync each missing block
-        for block_index in blocks_to_sync:
+        # Rolling MA windows; re-warmed from the database whenever the next
+        # missing block does not directly follow the previous one
+        moving_average_engine = MovingAverageEngine()
+        
+        # Money supply from the previous block's, re-read under the same condition
+        money_supply_engine = MoneySupplyEngine()
+        hashrate_engine = HashrateEngine()
+        
+        # Buffered writer: one transaction per batch_size blocks
+        writer = BlockBatchWriter(conn, batch_size=batch_size)
+        
+        # Write each fetched block in order
+        for fetched in fetch_blocks_in_order(blocks_to_sync, max(1, concurrency)):
+            if fetched is None:
+                continue
+            block_index = fetched['block_index']
+            block_time = fetched['block_time']
             print(f"Processing block {block_index}...")
             
-            # Get block details
-            block_hash, block_time, block_info = get_block_details(block_index)
-            if block_time is None:
-                print(f"Failed to fetch details for block {block_index}. Skipping...")
-                continue
+            # The engine is about to re-warm from block_data, which must include
+            # everything buffered so far
+            if moving_average_engine.last_block != block_index - 1:
+                writer.flush()
             
-            # Get previous block details
+            # Get previous block time (cached if it was fetched in this run)
             prev_block_index = block_index - 1
-            prev_block_hash, prev_block_time, _ = get_block_details(prev_block_index)
+            prev_block_time = get_block_time(prev_block_index, cursor)
             if prev_block_time is None:
                 print(f"Failed to fetch previous block details for block {block_index}. Skipping...")
                 continue
@@ -134,43 +141,32 @@ def sync_missing_blocks(start_block, end_block):
             time_difference = block_time - prev_block_time
             formatted_block_time = format_unix_time(block_time)
             
-            # Get current hashrate
-            current_hashrate = fetch_current_hashrate()
+            # Moving averages including this block
+            averages = moving_average_engine.next(cursor, block_index, time_difference)
+            print(format_moving_averages(block_index, averages))
+            money_supply = money_supply_engine.next(cursor, block_index, fetched['block_reward'])
+            network_hashrate = hashrate_engine.next(cursor, block_index, fetched['chain_work'], block_time)
             
-            # Insert into block_data table
-            cursor.execute("""
-                INSERT INTO block_data (
-                    current_block_number, 
-                    current_block_timestamp, 
-                    previous_block_number,
-                    previous_block_timestamp,
-                    block_time_interval_seconds,
-                    network_hashrate
-                )
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (current_block_number) DO NOTHING;
-            """, (
-                block_index, 
-                block_time, 
+            # Buffer block_data, moving averages and emissions for the batch write
+            writer.add(
+                block_index,
+                block_time,
                 prev_block_index,
                 prev_block_time,
                 time_difference,
-                current_hashrate
-            ))
-            
-            # Update moving averages using our custom function
-            update_moving_averages(conn, cursor, block_index)
-            
-            # Get block reward from coinbase transaction
-            block_reward = get_block_reward(block_info)
+                network_hashrate,
+                averages,
+                formatted_time=formatted_block_time,
+                money_supply=money_supply,
+                block_reward=fetched['block_reward'],
+                header=fetched['header']
+            )
             
-            # Save emissions data for the block
-            save_emissions_data(block_index, block_time, formatted_block_time, block_reward)
-            
-            print(f"Successfully synced block {block_index}")
-            
-        conn.commit()
+        writer.flush()
         print(f"Successfully synced all missing blocks from {start_block} to {end_block}")
+        
+        # Repair the averages that the filled holes made stale
+        reconcile_dirty_ranges(conn)
     except Exception as e:
         print(f"Error syncing blocks: {e}")
         if conn:
@@ -183,10 +179,11 @@ def sync_missing_blocks(start_block, end_block):
 if __name__ == "__main__":
     # Get start and end blocks from command line arguments
     if len(sys.argv) < 3:
-        print("Usage: python sync_missing_blocks.py <start_block> <end_block>")
+        print("Usage: python sync_missing_blocks.py <start_block> <end_block> [concurrency]")
         sys.exit(1)
     
     start_block = int(sys.argv[1])
     end_block = int(sys.argv[2])
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_CONCURRENCY
     
-    sync_missing_blocks(start_block, end_block)
+    sync_missing_blocks(start_block, end_block, concurrency)